@@ -0,0 +1,82 @@
+# benchmarks/bench_bar_store_memory.py
+#
+# Loads the same synthetic universe three ways and reports retained and peak memory (tracemalloc):
+# ORM StockData instances, a pd.read_sql DataFrame, and the array-backed BarStore.
+#
+#   python benchmarks/bench_bar_store_memory.py [--symbols 200] [--bars 1000]
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.database.bar_store import BarStore
+from src.database.models import Base, StockData
+
+
+def populate(engine, n_symbols, n_bars, seed=0):
+    rng = np.random.default_rng(seed)
+    days = [date(2020, 1, 1) + timedelta(days=i) for i in range(n_bars)]
+    with engine.begin() as connection:
+        for s in range(n_symbols):
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_bars)))
+            volume = rng.integers(100_000, 1_000_000, n_bars)
+            connection.execute(insert(StockData), [
+                {'symbol': f'SYM{s:04d}', 'country': 'usa', 'date': d, 'open': c, 'high': c * 1.01,
+                 'low': c * 0.99, 'close': c, 'volume': int(v)}
+                for d, c, v in zip(days, close.tolist(), volume.tolist())
+            ])
+
+
+def measure(label, load):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} retained {retained / 2**20:8.1f} MiB   peak {peak / 2**20:8.1f} MiB   {elapsed:6.2f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--bars', type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(bind=engine)
+    populate(engine, args.symbols, args.bars)
+    session = sessionmaker(bind=engine)()
+    print(f"{args.symbols} symbols x {args.bars} bars = {args.symbols * args.bars} bars")
+
+    def orm():
+        return session.query(StockData).order_by(StockData.symbol, StockData.date).all()
+
+    def dataframe():
+        query = session.query(StockData).order_by(StockData.symbol, StockData.date)
+        return pd.read_sql(query.statement, session.bind)
+
+    rows = measure('ORM StockData', orm)
+    del rows
+    session.expunge_all()
+    frame = measure('pd.read_sql DataFrame', dataframe)
+    del frame
+    store = measure('BarStore', lambda: BarStore.load(session))
+    print(f"BarStore array bytes: {store.nbytes / 2**20:.1f} MiB ({store.nbytes / len(store.days):.0f} bytes/bar)")
+
+
+if __name__ == "__main__":
+    main()
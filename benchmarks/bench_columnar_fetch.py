@@ -0,0 +1,90 @@
+# benchmarks/bench_columnar_fetch.py
+#
+# Fetches one long price history the old way (pd.read_sql on the full StockData row, then
+# to_datetime/drop_duplicates/dropna/sort_values) and with the columnar fetch, reporting
+# latency and peak memory (tracemalloc) for each.
+#
+#   python benchmarks/bench_columnar_fetch.py [--symbols 20] [--bars 20000] [--runs 5]
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.database.columnar import fetch_bars, fetch_bars_frame
+from src.database.models import Base, StockData
+
+
+def populate(engine, n_symbols, n_bars, seed=0):
+    rng = np.random.default_rng(seed)
+    days = [date(1950, 1, 1) + timedelta(days=i) for i in range(n_bars)]
+    with engine.begin() as connection:
+        for s in range(n_symbols):
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_bars)))
+            volume = rng.integers(100_000, 1_000_000, n_bars)
+            connection.execute(insert(StockData), [
+                {'symbol': f'SYM{s:04d}', 'country': 'usa', 'date': d, 'open': c, 'high': c * 1.01,
+                 'low': c * 0.99, 'close': c, 'volume': int(v)}
+                for d, c, v in zip(days, close.tolist(), volume.tolist())
+            ])
+
+
+def read_sql_fetch(session, symbol, country):
+    # The per-module helper this replaces
+    query = session.query(StockData).filter(
+        StockData.symbol == symbol,
+        StockData.country == country
+    ).order_by(StockData.date)
+    df = pd.read_sql(query.statement, session.bind)
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.drop_duplicates()
+    df = df.dropna(subset=['open', 'high', 'low', 'close', 'volume'])
+    return df.sort_values('date').reset_index(drop=True)
+
+
+def measure(label, fetch, runs):
+    # Timed without tracemalloc, which slows down per-object allocation; peak measured in a separate run
+    timings = []
+    for _ in range(runs):
+        gc.collect()
+        start = time.perf_counter()
+        fetch()
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    fetch()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<22} median {np.median(timings) * 1000:8.1f} ms   peak {peak / 2**20:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--bars', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(bind=engine)
+    populate(engine, args.symbols, args.bars)
+    session = sessionmaker(bind=engine)()
+    print(f"{args.symbols} symbols x {args.bars} bars, fetching one symbol")
+
+    measure('pd.read_sql + cleanup', lambda: read_sql_fetch(session, 'SYM0000', 'usa'), args.runs)
+    measure('fetch_bars_frame', lambda: fetch_bars_frame(session, symbol='SYM0000', country='usa'), args.runs)
+    measure('fetch_bars', lambda: fetch_bars(session, symbol='SYM0000', country='usa'), args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_figure_spec.py
+#
+# Compares the Plotly graph_objects chart path the endpoint used before figure_spec.py (add_hline
+# per pivot, update_layout with the zone shapes, pio.to_json, json.loads, then FastAPI's
+# jsonable_encoder and JSONResponse) with the direct figure-spec builder on a synthetic 1-year window.
+#
+#   python benchmarks/bench_figure_spec.py [--bars 252] [--pivot-window 2] [--repeat 20]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.research.figure_spec import to_json_bytes
+from src.research.price_zones import zone_shapes
+from src.research.support_resistance_detection import (
+    build_support_resistance_figure, compute_support_resistance_levels
+)
+
+
+def synthetic_bars(n_bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_bars)))
+    open_ = close * (1 + rng.normal(0, 0.005, n_bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n_bars)))
+    return pd.DataFrame({
+        'date': pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_bars),
+        'open': open_, 'high': high, 'low': low, 'close': close,
+        'volume': rng.integers(100_000, 1_000_000, n_bars),
+    })
+
+
+def graph_objects_response(symbol, df, levels):
+    # The calls of the former detect_and_plot_support_resistance and its endpoint, in order.
+    # update_layout(shapes=...) replaced the shapes add_hline had added, so that output only
+    # kept the pivot annotations; the figure-spec builder draws the pivot lines as intended
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    x0 = df['date'].min()
+    x1 = df['date'].max()
+    shapes = zone_shapes(*levels['resistance_zones'], x0, x1, line_color='red', rgb='255, 0, 0')
+    shapes += zone_shapes(*levels['support_zones'], x0, x1, line_color='green', rgb='0, 255, 0')
+
+    fig = go.Figure(data=[go.Candlestick(
+        x=df['date'], open=df['open'], high=df['high'], low=df['low'], close=df['close'],
+        increasing_line_color='green', decreasing_line_color='red', name='OHLC'
+    )])
+    fig.add_trace(go.Scatter(
+        x=levels['pivot_dates'], y=levels['pivot_prices'], mode='markers',
+        marker=dict(size=5, color='blue'), name='Pivot Points'
+    ))
+    for price in levels['pivot_prices']:
+        fig.add_hline(y=price, line_dash="dot", line_color="blue",
+                      annotation_text="<---", annotation_position="right")
+    y_min = min(df['low'].min(), np.nanmin(levels['pivot_prices']))
+    y_max = max(df['high'].max(), np.nanmax(levels['pivot_prices']))
+    fig.update_layout(
+        title=f'Support and Resistance Zones for {symbol}',
+        xaxis_title='Date', yaxis_title='Price', xaxis_rangeslider_visible=False,
+        xaxis=dict(showgrid=False), yaxis=dict(range=[y_min * 0.95, y_max * 1.05], showgrid=False),
+        paper_bgcolor='white', plot_bgcolor='white',
+        shapes=shapes
+    )
+    # Encode, parse back, then encode again for the response as the endpoint used to
+    return JSONResponse(jsonable_encoder(json.loads(pio.to_json(fig)))).body
+
+
+def figure_spec_response(symbol, df, levels):
+    return to_json_bytes(build_support_resistance_figure(symbol, df, levels))
+
+
+def timeit(fn, repeat):
+    fn()  # warm-up (template build, imports)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bars', type=int, default=252)
+    parser.add_argument('--pivot-window', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    df = synthetic_bars(args.bars)
+    levels = compute_support_resistance_levels(df, pivot_window=args.pivot_window)
+    print(f"bars={len(df)} pivots={len(levels['pivot_prices'])}")
+
+    old = timeit(lambda: graph_objects_response('BENCH', df, levels), args.repeat)
+    new = timeit(lambda: figure_spec_response('BENCH', df, levels), args.repeat)
+    print(f"graph_objects + round-trip: {old * 1000:8.2f} ms")
+    print(f"figure spec + orjson:       {new * 1000:8.2f} ms")
+    print(f"speedup:                    {old / new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/bench_query_budgets.py
+#
+# Runs the nightly stages and the API's read paths on a synthetic universe, each under
+# track_queries in strict mode with a fixed statement budget. The budgets do not depend on the
+# number of symbols, so a per-symbol or per-row query (N+1) blows through them and the run
+# fails with QueryBudgetExceeded. Run it with a large --symbols to make such a regression obvious.
+#
+#   python benchmarks/bench_query_budgets.py [--symbols 100] [--bars 600]
+
+import argparse
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from src.database.models import StockData
+from src.database.query_stats import install_query_counter, track_queries
+from src.database.schema import upgrade_schema
+from src.service.breakout_service import update_resistance_index, scan_breakouts
+from src.service.chart_service import parse_symbol_list, stream_charts
+from src.service.levels_service import run_level_snapshots
+from src.service.results_service import active_pairs
+from src.service.rs_service import run_rs_rating
+from src.service.screener_service import run_screening, evaluate_screens, screen_program, SCREENS, SCREENING_BATCH_SIZE
+from src.service.trend_line_service import run_trend_line_snapshots
+from src.service.vcp_history_service import run_vcp_history, load_vcp_events, VCP_HISTORY_BATCH_SIZE
+from src.service.vcp_service import run_vcp_detection, VCP_BATCH_SIZE
+
+COUNTRIES = ['usa', 'india']
+
+# Statements each unit may run, as (fixed, per batch). The stages that read bars in batches of
+# symbols may run a few statements per batch; nothing may run statements per symbol or per row.
+# Raise a budget only for a deliberate new query
+STAGE_BUDGETS = {
+    'RS rating': (10, 0),
+    'resistance index': (12, 0),
+    'screening': (12, 8),
+    'VCP detection': (16, 8),
+    'VCP history': (6, 6),
+    'level snapshots': (15, 0),
+    'trend lines': (10, 0),
+}
+BATCH_SIZES = {
+    'screening': SCREENING_BATCH_SIZE,
+    'VCP detection': VCP_BATCH_SIZE,
+    'VCP history': VCP_HISTORY_BATCH_SIZE,
+}
+READ_BUDGETS = {
+    'breakouts': 10,
+    'live screens': 8,
+    'vcp events': 3,
+    'chart batch': 10,
+}
+
+
+def populate(engine, n_symbols, n_bars, seed=0):
+    # Random walks ending today, half of them trending up so the screens and VCP have hits
+    rng = np.random.default_rng(seed)
+    days = []
+    day = date.today()
+    while len(days) < n_bars:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    days.reverse()
+    with engine.begin() as connection:
+        for country in COUNTRIES:
+            for s in range(n_symbols):
+                drift = 0.002 if s % 2 == 0 else 0.0
+                close = 50 * np.exp(np.cumsum(rng.normal(drift, 0.02, n_bars)))
+                spread = np.abs(rng.normal(0, 0.01, n_bars))
+                volume = rng.integers(100_000, 1_000_000, n_bars)
+                connection.execute(insert(StockData), [
+                    {'symbol': f'{country[:2].upper()}{s:04d}', 'country': country, 'date': d, 'open': c,
+                     'high': c * (1 + w), 'low': c * (1 - w), 'close': c, 'volume': int(v)}
+                    for d, c, w, v in zip(days, close.tolist(), spread.tolist(), volume.tolist())
+                ])
+
+
+def check(name, budget, work):
+    with track_queries(name, budget=budget, strict=True):
+        return work()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=100, help="Symbols per country")
+    parser.add_argument('--bars', type=int, default=600)
+    parser.add_argument('--workers', type=int, default=2, help="Processes for the level snapshot stage")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        install_query_counter(engine)
+        upgrade_schema(engine)
+        populate(engine, args.symbols, args.bars)
+        db = sessionmaker(bind=engine)()
+        print(f"{args.symbols} symbols x {args.bars} bars in each of {', '.join(COUNTRIES)}")
+
+        # Same order as run_daily_pipeline
+        stages = [
+            ('RS rating', lambda: run_rs_rating(db, COUNTRIES)),
+            ('resistance index', lambda: update_resistance_index(db, COUNTRIES)),
+            ('screening', lambda: run_screening(db, COUNTRIES)),
+            ('VCP detection', lambda: run_vcp_detection(db, COUNTRIES)),
+            ('VCP history', lambda: run_vcp_history(db, COUNTRIES)),
+            ('level snapshots', lambda: run_level_snapshots(db, COUNTRIES, workers=args.workers)),
+            ('trend lines', lambda: run_trend_line_snapshots(db, COUNTRIES)),
+        ]
+        universe = args.symbols * len(COUNTRIES)
+        for name, work in stages:
+            fixed, per_batch = STAGE_BUDGETS[name]
+            batches = -(-universe // BATCH_SIZES.get(name, universe))
+            check(name, fixed + per_batch * batches, work)
+
+        # The chart batch is consumed completely, as a client reading the whole stream would
+        pairs = sorted(active_pairs(db, 'screening', COUNTRIES))[:50] or [('US0000', 'usa')]
+        symbols = ','.join(f'{symbol}:{country}' for symbol, country in pairs)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            reads = [
+                ('breakouts', lambda: scan_breakouts(db, COUNTRIES)),
+                ('live screens', lambda: evaluate_screens(db, screen_program(tuple(SCREENS.items())), countries=COUNTRIES)),
+                ('vcp events', lambda: load_vcp_events(db, countries=COUNTRIES)),
+                ('chart batch', lambda: list(stream_charts(db, parse_symbol_list(symbols), 'v1', 6, pool=pool))),
+            ]
+            for name, work in reads:
+                check(name, READ_BUDGETS[name], work)
+        db.close()
+    print("All units within their query budgets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_startup.py
+#
+# Measures API cold start two ways:
+#   1. python -X importtime for "import src.main": total import time and the slowest modules
+#   2. time from spawning uvicorn until the first successful response on --path
+#
+#   python benchmarks/bench_startup.py [--runs 3] [--path /openapi.json] [--port 8765] [--warmup]
+
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_times(module='src.main'):
+    # Returns (total microseconds, [(cumulative us, module), ...]) for one fresh interpreter
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    modules = []
+    total = 0
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, name = int(match.group(2)), match.group(4)
+        modules.append((cumulative, name))
+        if name == module:
+            total = cumulative
+    return total, modules
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_response(path, port, warmup=False, timeout=60.0):
+    env = dict(os.environ)
+    if warmup:
+        env['WARMUP_ON_STARTUP'] = '1'
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'src.main:app', '--host', '127.0.0.1', '--port', str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f'http://127.0.0.1:{port}{path}'
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read()
+                    return time.perf_counter() - start, response.status
+            except urllib.error.HTTPError as e:
+                return time.perf_counter() - start, e.code
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f'No response from {url} within {timeout}s')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--path', default='/openapi.json')
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--warmup', action='store_true', help='Start the server with WARMUP_ON_STARTUP=1')
+    args = parser.parse_args()
+
+    totals = []
+    for _ in range(args.runs):
+        total, modules = import_times()
+        totals.append(total)
+    print(f"import src.main: best {min(totals) / 1000:.1f} ms over {args.runs} runs")
+    print("slowest imports (cumulative, last run):")
+    for cumulative, name in sorted(modules, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, status = time_to_first_response(args.path, args.port or free_port(), warmup=args.warmup)
+        timings.append(elapsed)
+    print(f"time to first response on {args.path} (HTTP {status}): "
+          f"best {min(timings) * 1000:.0f} ms, worst {max(timings) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,11 +9,12 @@ from sqlalchemy.orm import sessionmaker
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.database.models import StockData
+from src.database.columnar import fetch_bars_frame
 from src.research.breakout_signals import generate_buy_signal
 # Replace 'your_database_url' with your actual database URL or ensure DATABASE_URL is set in your environment
 DATABASE_URL = os.environ.get('DATABASE_URL')
 last_n_months = 6  # Number of months to fetch data
+TRADING_DAYS = 252  # Periods per year for annualizing daily returns
 
 def create_db_session(database_url):
     engine = create_engine(database_url)
@@ -21,16 +22,8 @@ def create_db_session(database_url):
     return Session()
 
 def fetch_stock_data(session, symbol, country, start_date):
-    query = session.query(StockData).filter(
-        StockData.symbol == symbol,
-        StockData.country == country,
-        StockData.date >= start_date
-    ).order_by(StockData.date)
-    df = pd.read_sql(query.statement, session.bind)
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.drop_duplicates()
-    df = df.dropna(subset=['open', 'high', 'low', 'close', 'volume'])
-    return df.sort_values('date').reset_index(drop=True)
+    # Ordered by date and without missing values straight from the query
+    return fetch_bars_frame(session, symbol=symbol, country=country, start_date=start_date)
 
 def generate_buy_signal_random(df):
     short_window=20
@@ -41,7 +34,99 @@ def generate_buy_signal_random(df):
     long_sma = df['close'].rolling(window=long_window, min_periods=1).mean().iloc[-1]
     return short_sma > long_sma
 
-def backtest_strategy(df, profit_target=0.06, stop_loss=-0.03, initial_cash=10000.0):
+class MetricsAccumulator:
+    """
+    Backtest metrics updated one bar and one trade at a time, in constant memory.
+    Mean and variance of the daily returns use Welford's update; the running peak gives the
+    maximum drawdown and the sum of squared negative returns the downside deviation.
+    finalize() returns the same values as batch_metrics over the full history.
+    """
+
+    def __init__(self, periods_per_year=TRADING_DAYS):
+        self.periods_per_year = periods_per_year
+        self.bars = 0
+        self.bars_in_position = 0
+        self.first_date = None
+        self.first_value = None
+        self.last_date = None
+        self.last_value = None
+        self.peak = None
+        self.max_drawdown = 0.0
+        # Daily returns
+        self.returns = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sum_sq = 0.0
+        # Closed trades
+        self.trades = 0
+        self.wins = 0
+        self.pl_sum = 0.0
+        self.holding_sum = 0
+
+    def add_bar(self, date, portfolio_value, in_position=False):
+        if self.bars == 0:
+            self.first_date = date
+            self.first_value = portfolio_value
+            self.peak = portfolio_value
+        else:
+            daily_return = portfolio_value / self.last_value - 1
+            self.returns += 1
+            delta = daily_return - self.mean
+            self.mean += delta / self.returns
+            self.m2 += delta * (daily_return - self.mean)
+            if daily_return < 0:
+                self.downside_sum_sq += daily_return * daily_return
+        self.bars += 1
+        self.bars_in_position += bool(in_position)
+        self.last_date = date
+        self.last_value = portfolio_value
+        self.peak = max(self.peak, portfolio_value)
+        self.max_drawdown = max(self.max_drawdown, 1 - portfolio_value / self.peak)
+
+    def add_trade(self, trade):
+        self.trades += 1
+        self.wins += trade['pl_pct'] > 0
+        self.pl_sum += trade['pl_pct']
+        self.holding_sum += trade['holding_period']
+
+    def finalize(self):
+        std = np.sqrt(self.m2 / (self.returns - 1)) if self.returns > 1 else 0.0
+        downside = np.sqrt(self.downside_sum_sq / self.returns) if self.returns else 0.0
+        return summarize_metrics(
+            self.mean, std, downside, self.periods_per_year,
+            self.first_date, self.first_value, self.last_date, self.last_value,
+            self.max_drawdown, self.bars_in_position / self.bars if self.bars else 0.0,
+            self.trades, self.pl_sum / self.trades if self.trades else 0.0,
+            self.wins / self.trades if self.trades else 0.0,
+            self.holding_sum / self.trades if self.trades else 0.0,
+        )
+
+
+def summarize_metrics(mean_return, std_return, downside_deviation, periods_per_year, first_date, first_value,
+                      last_date, last_value, max_drawdown, exposure, total_trades, average_pl, win_ratio,
+                      average_holding_period):
+    # Annualized ratios are 0 when the returns do not vary (or fall, for Sortino)
+    annualize = np.sqrt(periods_per_year)
+    days = (last_date - first_date).days if first_date is not None else 0
+    total_return = last_value / first_value - 1 if first_value else 0.0
+    return {
+        'sharpe_ratio': float(mean_return / std_return * annualize) if std_return > 0 else 0.0,
+        'sortino_ratio': float(mean_return / downside_deviation * annualize) if downside_deviation > 0 else 0.0,
+        'volatility': float(std_return * annualize),
+        'total_return': float(total_return),
+        'cagr': float((1 + total_return) ** (365.25 / days) - 1) if days > 0 else 0.0,
+        'max_drawdown': float(max_drawdown),  # Largest fall from a running peak, as a fraction of the peak
+        'exposure': float(exposure),  # Fraction of bars holding a position
+        'total_trades': total_trades,
+        'average_pl': float(average_pl),
+        'win_ratio': float(win_ratio),
+        'average_holding_period': float(average_holding_period),  # Calendar days
+    }
+
+
+def backtest_strategy(df, profit_target=0.06, stop_loss=-0.03, initial_cash=10000.0, metrics=None, keep_history=True):
+    # Feeds every bar and closed trade to metrics (a MetricsAccumulator) when given;
+    # keep_history=False skips building the per-bar portfolio_values list
     in_position = False
     entry_price = 0
     entry_date = None
@@ -55,7 +140,8 @@ def backtest_strategy(df, profit_target=0.06, stop_loss=-0.03, initial_cash=1000
         price = row['close']
 
         if not in_position:
-            if generate_buy_signal(df, price):
+            signal, _, _ = generate_buy_signal(df, row['open'], price)
+            if signal:
                 shares_to_buy = cash // price
                 if shares_to_buy > 0:
                     entry_price = price
@@ -84,6 +170,8 @@ def backtest_strategy(df, profit_target=0.06, stop_loss=-0.03, initial_cash=1000
                     'holding_period': holding_period
                 }
                 trades.append(trade)
+                if metrics is not None:
+                    metrics.add_trade(trade)
                 print(f"Sold {position} shares at {exit_price} on {exit_date} with P/L of {trade['pl_pct']:.2%}")
                 in_position = False
                 position = 0
@@ -91,50 +179,60 @@ def backtest_strategy(df, profit_target=0.06, stop_loss=-0.03, initial_cash=1000
                 entry_date = None
 
         portfolio_value = cash + position * price if in_position else cash
-        portfolio_values.append({'date': date, 'portfolio_value': portfolio_value})
+        if metrics is not None:
+            metrics.add_bar(date, portfolio_value, in_position)
+        if keep_history:
+            portfolio_values.append({'date': date, 'portfolio_value': portfolio_value, 'in_position': in_position})
 
     return trades, portfolio_values
 
-def calculate_metrics(portfolio_values, trades):
+def batch_metrics(portfolio_values, trades, periods_per_year=TRADING_DAYS):
+    # The MetricsAccumulator metrics computed from the full history
     portfolio_df = pd.DataFrame(portfolio_values)
-    portfolio_df['daily_return'] = portfolio_df['portfolio_value'].pct_change()
-    portfolio_df.dropna(inplace=True)
-
-    mean_return = portfolio_df['daily_return'].mean()
-    if mean_return == 0:
-        return 0, 0, 0, pd.DataFrame()
-    std_return = portfolio_df['daily_return'].std()
-    sharpe_ratio = (mean_return / std_return) * np.sqrt(252)
-
-    trades_df = pd.DataFrame(trades)
-    average_pl = trades_df['pl_pct'].mean()
-    
-    # Debugging: Print the columns of trades_df
-    print("Columns in trades_df:", trades_df.columns)
-    
-    # Debugging: Print the first few rows of trades_df
-    print("First few rows of trades_df:\n", trades_df.head())
-    
-    # Calculate win ratio
-    win_ratio = (trades_df['pl_pct'] > 0).mean()
-
-    return sharpe_ratio, average_pl, win_ratio, trades_df
+    if portfolio_df.empty:
+        return MetricsAccumulator(periods_per_year).finalize()
+    values = portfolio_df['portfolio_value']
+    returns = values.pct_change().dropna()
+    std_return = returns.std() if len(returns) > 1 else 0.0
+    downside_deviation = np.sqrt((returns.clip(upper=0) ** 2).mean()) if len(returns) else 0.0
+    max_drawdown = (1 - values / values.cummax()).max()
+
+    trades_df = pd.DataFrame(trades, columns=['pl_pct', 'holding_period'])
+    has_trades = not trades_df.empty
+    return summarize_metrics(
+        returns.mean() if len(returns) else 0.0, std_return, downside_deviation, periods_per_year,
+        portfolio_df['date'].iloc[0], values.iloc[0], portfolio_df['date'].iloc[-1], values.iloc[-1],
+        max_drawdown, portfolio_df['in_position'].mean() if 'in_position' in portfolio_df else 0.0,
+        len(trades_df), trades_df['pl_pct'].mean() if has_trades else 0.0,
+        (trades_df['pl_pct'] > 0).mean() if has_trades else 0.0,
+        trades_df['holding_period'].mean() if has_trades else 0.0,
+    )
+
+def calculate_metrics(portfolio_values, trades):
+    metrics = batch_metrics(portfolio_values, trades)
+    return metrics['sharpe_ratio'], metrics['average_pl'], metrics['win_ratio'], pd.DataFrame(trades)
 
 def main():
     session = create_db_session(DATABASE_URL)
     start_date = datetime.now() - timedelta(days=last_n_months * 30)
     df = fetch_stock_data(session, "AAPL", "usa", start_date)
-    trades, portfolio_values = backtest_strategy(df)
-    sharpe_ratio, average_pl, win_ratio, trades_df = calculate_metrics(portfolio_values, trades)
+    metrics = MetricsAccumulator()
+    trades, _ = backtest_strategy(df, metrics=metrics, keep_history=False)
+    results = metrics.finalize()
 
     print("\n--- Backtesting Results ---")
-    print(f"Total Trades Executed: {len(trades)}")
-    print(f"Average P/L per Trade: {average_pl:.2%}")
-    print(f"Sharpe Ratio: {sharpe_ratio:.2f}")
-    print(f"Win Ratio: {win_ratio:.2%}")
+    print(f"Total Trades Executed: {results['total_trades']}")
+    print(f"Average P/L per Trade: {results['average_pl']:.2%}")
+    print(f"Win Ratio: {results['win_ratio']:.2%}")
+    print(f"Sharpe Ratio: {results['sharpe_ratio']:.2f}")
+    print(f"Sortino Ratio: {results['sortino_ratio']:.2f}")
+    print(f"Total Return: {results['total_return']:.2%}")
+    print(f"CAGR: {results['cagr']:.2%}")
+    print(f"Max Drawdown: {results['max_drawdown']:.2%}")
+    print(f"Exposure: {results['exposure']:.2%}")
 
     print("\nTrade Log:")
-    print(trades_df)
+    print(pd.DataFrame(trades))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,123 @@
+import argparse
+import sys
+import os
+import numpy as np
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.backtesting.backtesting import create_db_session, fetch_stock_data, backtest_strategy, DATABASE_URL, last_n_months
+
+# Robustness of a backtest under resampled trade sequences. Each path is a row of trade returns:
+# 'bootstrap' draws the trades with replacement, 'shuffle' permutes the actual trades. The
+# backtest puts all cash into each trade, so equity compounds the trade returns; a shuffle
+# keeps the final equity and Sharpe of the backtest and only changes the drawdowns.
+
+METHODS = ('bootstrap', 'shuffle')
+CHUNK_SIZE = 2000  # Paths simulated at once; memory is a few chunk_size x trades float arrays
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def simulate_paths(pl_pct, n_paths, method='bootstrap', rng=None):
+    # (n_paths, trades) array of resampled trade returns
+    rng = rng if rng is not None else np.random.default_rng()
+    pl_pct = np.asarray(pl_pct, dtype=float)
+    if method == 'bootstrap':
+        return pl_pct[rng.integers(0, len(pl_pct), size=(n_paths, len(pl_pct)))]
+    if method == 'shuffle':
+        return rng.permuted(np.broadcast_to(pl_pct, (n_paths, len(pl_pct))), axis=1)
+    raise ValueError(f"method must be one of {METHODS}")
+
+
+def path_metrics(paths, initial_cash=10000.0, trades_per_year=None):
+    """
+    Final equity, maximum drawdown (largest fall from a running peak, as a fraction of the peak)
+    and Sharpe ratio of the trade returns for every row of paths. The Sharpe ratio is annualized
+    with trades_per_year when given and is 0 for paths whose returns do not vary.
+    """
+    equity = initial_cash * np.cumprod(1 + paths, axis=1)
+    peak = np.maximum.accumulate(equity, axis=1)
+    # The starting cash is the first peak
+    peak = np.maximum(peak, initial_cash)
+    max_drawdown = (1 - equity / peak).max(axis=1, initial=0.0)
+
+    if paths.shape[1] > 1:
+        mean = paths.mean(axis=1)
+        std = paths.std(axis=1, ddof=1)
+        sharpe = np.divide(mean, std, out=np.zeros_like(mean), where=std > 0)
+    else:
+        sharpe = np.zeros(len(paths))
+    if trades_per_year:
+        sharpe *= np.sqrt(trades_per_year)
+
+    final_equity = equity[:, -1] if paths.shape[1] else np.full(len(paths), initial_cash)
+    return {'final_equity': final_equity, 'max_drawdown': max_drawdown, 'sharpe_ratio': sharpe}
+
+
+def estimate_trades_per_year(trades):
+    # Trade frequency over the span of the backtest's trades, or None without dates
+    if len(trades) < 2 or 'entry_date' not in trades[0]:
+        return None
+    days = (trades[-1]['exit_date'] - trades[0]['entry_date']).days
+    return len(trades) * 365.25 / days if days > 0 else None
+
+
+def monte_carlo(trades, n_paths=10000, method='bootstrap', initial_cash=10000.0, trades_per_year=None,
+                seed=None, chunk_size=CHUNK_SIZE):
+    """
+    Simulate n_paths resampled trade sequences of a backtest's trade list and return
+    {metric: array of n_paths values} for final_equity, max_drawdown and sharpe_ratio.
+    Paths are generated and measured chunk_size at a time.
+    """
+    pl_pct = np.array([trade['pl_pct'] for trade in trades], dtype=float)
+    if trades_per_year is None:
+        trades_per_year = estimate_trades_per_year(trades)
+    rng = np.random.default_rng(seed)
+
+    results = {name: np.empty(n_paths) for name in ('final_equity', 'max_drawdown', 'sharpe_ratio')}
+    for start in range(0, n_paths, chunk_size):
+        stop = min(start + chunk_size, n_paths)
+        if len(pl_pct):
+            paths = simulate_paths(pl_pct, stop - start, method, rng)
+        else:
+            paths = np.empty((stop - start, 0))
+        for name, values in path_metrics(paths, initial_cash, trades_per_year).items():
+            results[name][start:stop] = values
+    return results
+
+
+def summarize_distribution(results, percentiles=PERCENTILES):
+    # {metric: {'mean': ..., 'p5': ..., ...}}
+    summary = {}
+    for name, values in results.items():
+        summary[name] = {'mean': float(values.mean())}
+        for p, value in zip(percentiles, np.percentile(values, percentiles)):
+            summary[name][f'p{p}'] = float(value)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo robustness of the breakout backtest")
+    parser.add_argument("--symbol", default="AAPL")
+    parser.add_argument("--country", default="usa")
+    parser.add_argument("--paths", type=int, default=10000)
+    parser.add_argument("--method", choices=METHODS, default="bootstrap")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    session = create_db_session(DATABASE_URL)
+    start_date = datetime.now() - timedelta(days=last_n_months * 30)
+    df = fetch_stock_data(session, args.symbol, args.country, start_date)
+    trades, _ = backtest_strategy(df, keep_history=False)
+    if not trades:
+        print("No trades to resample")
+        return
+
+    results = monte_carlo(trades, n_paths=args.paths, method=args.method, seed=args.seed)
+    print(f"\n--- Monte Carlo ({args.method}, {args.paths} paths of {len(trades)} trades) ---")
+    for name, stats in summarize_distribution(results).items():
+        print(f"{name:<14} " + "  ".join(f"{key} {value:,.4f}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
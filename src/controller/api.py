@@ -1,53 +1,278 @@
 # src/controller/api.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from src.database.models import ScreenedStock, VCPStock
-from src.database import SessionLocal
-from src.research.support_resistance_detection import detect_and_plot_support_resistance as detect_and_plot_support_resistance_v1
-from src.research.support_resistance_detection_v2 import detect_and_plot_support_resistance as detect_and_plot_support_resistance_v2
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+# Database, pandas and plotting modules are imported inside the handlers so the API process
+# starts without loading them; the first request that needs one pays for the import.
 
 router = APIRouter()
 
 def get_db():
+    from src.database import SessionLocal
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-@router.get("/screened_stocks")
-def get_screened_stocks(db: Session = Depends(get_db)):
-    stocks = db.query(ScreenedStock).all()
+def warm_up():
+    # Optional: load the heavy modules, build the chart template and open a pooled connection
+    # ahead of the first request
+    import importlib
+    from sqlalchemy import text
+    from src.database import engine
+    from src.research.figure_spec import default_template
+
+    # Imported only to load them, and pandas and numpy with them
+    for module in ('src.research.support_resistance_detection', 'src.research.support_resistance_detection_v2'):
+        importlib.import_module(module)
+    default_template()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+# The screened and VCP lists are served from the published result runs. The encoded body is
+# cached in process until a new run is published, and its ETag lets pollers revalidate with
+# If-None-Match and get a 304 without a body.
+RESULTS_CACHE_CONTROL = "public, max-age=60"  # Results change once a day; clients revalidate after a minute
+
+def load_screened_stocks(db, active):
+    import orjson
+    from src.database.models import ScreenedStock
+    from src.service.results_service import active_filter
+    stocks = db.query(ScreenedStock).filter(active_filter(ScreenedStock, active)).order_by(ScreenedStock.id).all()
     result = [{'symbol': stock.symbol, 'country': stock.country} for stock in stocks]
-    return {"screened_stocks": result}
+    return orjson.dumps({"screened_stocks": result})
+
+def load_vcp_stocks(db, active):
+    import orjson
+    from src.database.models import VCPStock
+    from src.service.results_service import active_filter
+    stocks = db.query(VCPStock).filter(active_filter(VCPStock, active)).order_by(VCPStock.id).all()
+    result = [{'symbol': stock.symbol, 'country': stock.country, 'stage': stock.stage, 'detected_date': stock.detected_date,
+               'contraction_count': stock.contraction_count, 'final_contraction': stock.final_contraction,
+               'volume_ratio': stock.volume_ratio, 'volume_dry_up': stock.volume_dry_up} for stock in stocks]
+    return orjson.dumps({"vcp_stocks": result})
+
+def etag_matches(if_none_match, etag):
+    # Weak comparison, as for GET: W/ prefixes are ignored and * matches any version
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in tags]
+
+def result_list_response(request, db, kind, build):
+    from src.service.results_service import cached_results, version_etag
+    version, body = cached_results(db, kind, build)
+    headers = {'ETag': version_etag(kind, version), 'Cache-Control': RESULTS_CACHE_CONTROL}
+    if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/screened_stocks")
+def get_screened_stocks(
+    request: Request,
+    screens: str = Query(None, description="Comma-separated named screens to evaluate live, e.g. trend_template,near_high"),
+    expression: str = Query(None, description="Screen expression to evaluate live, e.g. close > sma(50) and rs >= 80"),
+    country: str = Query(None, description="Only screen this country when evaluating live"),
+    db=Depends(get_db)
+):
+    if screens is None and expression is None:
+        return result_list_response(request, db, 'screening', load_screened_stocks)
+    return live_screens_response(db, screens, expression, country)
+
+def live_screens_response(db, screens, expression, country):
+    # Named screens and an ad-hoc expression evaluated together on the latest bars, in one pass
+    from src.database.models import RSRating
+    from src.service.screener_service import SCREENS, screen_program, evaluate_screens
+    names = list(dict.fromkeys(name.strip() for name in (screens or '').split(',') if name.strip()))
+    unknown = [name for name in names if name not in SCREENS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown screens {', '.join(unknown)}; available: {', '.join(SCREENS)}")
+    items = tuple((name, SCREENS[name]) for name in names)
+    if expression:
+        items += (('expression', expression),)
+    if not items:
+        raise HTTPException(status_code=400, detail="screens or expression must name a screen")
+    try:
+        program = screen_program(items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Every rated country; run_rs_rating covers the whole universe
+    countries = [country] if country else [c for (c,) in db.query(RSRating.country).distinct().all()]
+    results = evaluate_screens(db, program, countries=countries)
+    return {"screens": {
+        name: [{'symbol': symbol, 'country': symbol_country} for symbol, symbol_country in sorted(pairs)]
+        for name, pairs in results.items()
+    }}
 
 @router.get("/vcp_stocks")
-def get_vcp_stocks(db: Session = Depends(get_db)):
-    stocks = db.query(VCPStock).all()
-    result = [{'symbol': stock.symbol, 'country': stock.country, 'stage': stock.stage, 'detected_date': stock.detected_date} for stock in stocks]
-    return {"vcp_stocks": result}
+def get_vcp_stocks(request: Request, db=Depends(get_db)):
+    return result_list_response(request, db, 'vcp', load_vcp_stocks)
+
+@router.get("/rs_ratings")
+def get_rs_ratings(
+    country: str = Query(None, description="Only return ratings for this country"),
+    db=Depends(get_db)
+):
+    from src.database.models import RSRating
+    query = db.query(RSRating)
+    if country:
+        query = query.filter(RSRating.country == country)
+    ratings = query.order_by(RSRating.rs_rating.desc(), RSRating.symbol).all()
+    result = [{'symbol': r.symbol, 'country': r.country, 'rs_rating': r.rs_rating, 'computed_date': r.computed_date} for r in ratings]
+    return {"rs_ratings": result}
+
+@router.get("/vcp_events")
+def get_vcp_events(
+    symbol: str = Query(None, description="Only return events for this symbol"),
+    country: str = Query(None, description="Only return events for this country"),
+    stage: str = Query(None, description="'Stage 2' or 'Stage 4'"),
+    start: str = Query(None, description="First date (YYYY-MM-DD)"),
+    end: str = Query(None, description="Last date (YYYY-MM-DD)"),
+    db=Depends(get_db)
+):
+    from datetime import date
+    from src.service.vcp_history_service import load_vcp_events
+    try:
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    events = load_vcp_events(db, countries=[country] if country else None, symbol=symbol, stage=stage, start_date=start, end_date=end)
+    result = [{'symbol': e.symbol, 'country': e.country, 'date': e.date, 'stage': e.stage, 'contraction': e.contraction, 'close': e.close} for e in events]
+    return {"vcp_events": result}
+
+@router.get("/breakouts")
+def get_breakouts(
+    country: str = Query(None, description="Only scan this country"),
+    scan_date: str = Query(None, alias="date", description="Bar date to scan (YYYY-MM-DD), latest by default"),
+    db=Depends(get_db)
+):
+    from datetime import date
+    from src.database.models import ResistanceLevel
+    from src.service.breakout_service import scan_breakouts
+    try:
+        scan_date = date.fromisoformat(scan_date) if scan_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+    countries = [country] if country else [c for (c,) in db.query(ResistanceLevel.country).distinct().all()]
+    return {"breakouts": scan_breakouts(db, countries, scan_date) if countries else []}
+
+@router.get("/trend_lines")
+def get_trend_lines(
+    symbol: str = Query(None, description="Only return lines for this symbol"),
+    country: str = Query(None, description="Only return lines for this country"),
+    kind: str = Query(None, description="'resistance' or 'support'"),
+    db=Depends(get_db)
+):
+    from src.database.models import TrendLine
+    query = db.query(TrendLine)
+    if symbol:
+        query = query.filter(TrendLine.symbol == symbol)
+    if country:
+        query = query.filter(TrendLine.country == country)
+    if kind:
+        query = query.filter(TrendLine.kind == kind)
+    lines = query.order_by(TrendLine.country, TrendLine.symbol, TrendLine.kind, TrendLine.score.desc()).all()
+    result = [{'symbol': l.symbol, 'country': l.country, 'kind': l.kind, 'start_date': l.start_date, 'end_date': l.end_date,
+               'start_price': l.start_price, 'slope': l.slope, 'touches': l.touches, 'violations': l.violations,
+               'score': l.score, 'value_at_last': l.value_at_last, 'last_date': l.last_date} for l in lines]
+    return {"trend_lines": result}
 
 @router.get("/support_resistance_graph")
 def get_support_resistance_graph(
     symbol: str = Query(..., description="Stock symbol"),
     country: str = Query(..., description="Country of the stock"),
-    months: int = Query(6, description="Number of months to fetch data")
+    months: int = Query(6, description="Number of months to fetch data"),
+    db=Depends(get_db)
 ):
+    from src.research import support_resistance_detection as levels_v1
     try:
-        graph_data = detect_and_plot_support_resistance_v1(symbol, country, months)
-        return graph_data
+        graph_data = render_support_resistance_graph(db, levels_v1, 'v1', symbol, country, months)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating graph: {str(e)}")
+    if graph_data is None:
+        raise HTTPException(status_code=404, detail=f"No price data for {symbol} ({country})")
+    return Response(content=graph_data, media_type="application/json")
 
 @router.get("/support_resistance_graph_v2")
 def get_support_resistance_graph_v2(
     symbol: str = Query(..., description="Stock symbol"),
     country: str = Query(..., description="Country of the stock"),
-    months: int = Query(6, description="Number of months to fetch data")
+    months: int = Query(6, description="Number of months to fetch data"),
+    db=Depends(get_db)
 ):
+    from src.research import support_resistance_detection_v2 as levels_v2
     try:
-        graph_data = detect_and_plot_support_resistance_v2(symbol, country, months)
-        return graph_data
+        graph_data = render_support_resistance_graph(db, levels_v2, 'v2', symbol, country, months)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating graph: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error generating graph: {str(e)}")
+    if graph_data is None:
+        raise HTTPException(status_code=404, detail=f"No price data for {symbol} ({country})")
+    return Response(content=graph_data, media_type="application/json")
+
+@router.get("/support_resistance_graphs")
+def get_support_resistance_graphs(
+    symbols: str = Query(..., description="Comma-separated SYMBOL:country pairs, e.g. AAPL:usa,TCS:india"),
+    method: str = Query("v1", description="'v1' (pivots and zones) or 'v2' (fractal levels)"),
+    months: int = Query(6, description="Number of months to fetch data"),
+    db=Depends(get_db)
+):
+    # One NDJSON line per symbol, streamed as each chart is ready
+    from fastapi.responses import StreamingResponse
+    from src.service.chart_service import parse_symbol_list, stream_charts, CHART_METHODS, MAX_BATCH_SYMBOLS
+    if method not in CHART_METHODS:
+        raise HTTPException(status_code=400, detail="method must be v1 or v2")
+    try:
+        pairs = parse_symbol_list(symbols)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not pairs or len(pairs) > MAX_BATCH_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"symbols must list 1 to {MAX_BATCH_SYMBOLS} pairs")
+    return StreamingResponse(stream_charts(db, pairs, method, months), media_type="application/x-ndjson")
+
+def render_support_resistance_graph(db, module, method, symbol, country, months):
+    # Serve levels from the nightly snapshot when it covers these bars, otherwise compute them live.
+    # Returns None when there are no bars for the symbol in the window
+    from src.research.figure_spec import to_json_bytes
+    from src.service.levels_service import load_levels_snapshot
+    df = module.fetch_price_history(symbol, country, months, db=db)
+    if df.empty:
+        return None
+    levels = load_levels_snapshot(db, symbol, country, method, months, df)
+    if levels is None:
+        levels = module.compute_support_resistance_levels(df, pair=(symbol, country))
+    return to_json_bytes(module.build_support_resistance_figure(symbol, df, levels))
+
+@router.get("/stream/events")
+async def stream_events():
+    # Server-sent events for VCP and breakout signals switching on or off during the session;
+    # the signals already on are sent first
+    import asyncio
+    from fastapi.responses import StreamingResponse
+    from src.service.stream_service import get_stream_processor, format_sse
+    processor = get_stream_processor()
+    if processor is None:
+        raise HTTPException(status_code=503, detail="Streaming is not enabled or has stopped")
+
+    queue = processor.subscribe()
+
+    async def events():
+        try:
+            for event in processor.snapshot():
+                yield format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # The stream stopped
+                    break
+                yield format_sse(event)
+        finally:
+            processor.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
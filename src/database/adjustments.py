@@ -0,0 +1,209 @@
+# src/database/adjustments.py
+
+import argparse
+import os
+import sys
+import threading
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import func, select
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.database.bar_store import EPOCH_ORDINAL
+from src.database.models import AdjustmentFactor, StockData
+
+# stock_data keeps the raw bars as they were traded. Splits and dividends are recorded in
+# adjustment_factors, one row per symbol and ex-date, and applied when bars are read: every bar
+# before an ex-date is multiplied by that event's factors, so a bar's cumulative factor is the
+# product of the factors of all later events. Recording an event therefore never rewrites bars.
+# Record events with
+#   python src/database/adjustments.py split AAPL usa 2020-08-31 4
+#   python src/database/adjustments.py dividend AAPL usa 2024-08-12 0.25
+
+SPLIT = 'split'
+DIVIDEND = 'dividend'
+
+
+def split_factors(ratio):
+    # (price, volume) factors of a ratio-for-1 split: a 2-for-1 split halves earlier prices and doubles their volume
+    return 1.0 / ratio, float(ratio)
+
+
+def dividend_factors(amount, previous_close):
+    # Earlier prices scale by the fraction of the last close before the ex-date left after the payout
+    return 1.0 - amount / previous_close, 1.0
+
+
+def record_adjustment(db, symbol, country, ex_date, kind, price_factor, volume_factor=1.0):
+    # Replaces any event already recorded for the symbol on ex_date. Rows are never updated in
+    # place, so the version checked by adjustment_events sees every change
+    if not price_factor > 0 or not volume_factor > 0:
+        raise ValueError(f"Adjustment factors must be positive, got {price_factor} and {volume_factor}")
+    db.query(AdjustmentFactor).filter(
+        AdjustmentFactor.symbol == symbol,
+        AdjustmentFactor.country == country,
+        AdjustmentFactor.date == ex_date
+    ).delete(synchronize_session=False)
+    db.add(AdjustmentFactor(symbol=symbol, country=country, date=ex_date, kind=kind,
+                            price_factor=price_factor, volume_factor=volume_factor, recorded_at=datetime.now()))
+    db.commit()
+
+
+def record_split(db, symbol, country, ex_date, ratio):
+    price_factor, volume_factor = split_factors(ratio)
+    record_adjustment(db, symbol, country, ex_date, SPLIT, price_factor, volume_factor)
+
+
+def record_dividend(db, symbol, country, ex_date, amount):
+    # The factor is based on the raw close of the last bar before the ex-date
+    previous_close = db.query(StockData.close).filter(
+        StockData.symbol == symbol,
+        StockData.country == country,
+        StockData.date < ex_date,
+        StockData.close.isnot(None)
+    ).order_by(StockData.date.desc()).limit(1).scalar()
+    if previous_close is None or not 0 < amount < previous_close:
+        raise ValueError(f"Cannot adjust {symbol} ({country}) for a dividend of {amount} before {ex_date}")
+    price_factor, volume_factor = dividend_factors(amount, previous_close)
+    record_adjustment(db, symbol, country, ex_date, DIVIDEND, price_factor, volume_factor)
+
+
+# In-process copy of adjustment_factors, reloaded when the table changes. A read costs one
+# aggregate query on the table; the events are only read again after one was recorded.
+_events = (None, {})
+_events_lock = threading.Lock()
+
+
+def adjustment_events(db):
+    """
+    {(symbol, country): (ex_days, price_suffix, volume_suffix, recorded)} for every symbol with
+    recorded events. ex_days are the sorted ex-dates as days since 1970-01-01; entry k of a
+    suffix array is the product of the factors of events k and later, with a trailing 1, so it
+    is the cumulative factor of a bar after k of the events. recorded is the date the symbol's
+    events last changed. db is a Session or Connection.
+    The events are kept on db for the rest of its current transaction, so the reads of one
+    request or stage check the version once.
+    """
+    global _events
+    transaction = db.get_transaction()
+    held = db.info.get('adjustment_events')
+    if transaction is not None and held is not None and held[0] is transaction:
+        return held[1]
+
+    table = AdjustmentFactor.__table__
+    version = tuple(db.execute(select(
+        func.count(), func.max(table.c.id), func.sum(table.c.price_factor), func.sum(table.c.volume_factor)
+    ).select_from(table)).one())
+    cached = _events
+    if cached[0] == version:
+        db.info['adjustment_events'] = (db.get_transaction(), cached[1])
+        return cached[1]
+
+    rows = db.execute(
+        select(table.c.symbol, table.c.country, table.c.date, table.c.price_factor, table.c.volume_factor, table.c.recorded_at)
+        .order_by(table.c.symbol, table.c.country, table.c.date)
+    ).all()
+    grouped = {}
+    for symbol, country, ex_date, price_factor, volume_factor, recorded_at in rows:
+        grouped.setdefault((symbol, country), []).append((ex_date.toordinal() - EPOCH_ORDINAL, price_factor, volume_factor, recorded_at))
+
+    events = {}
+    for pair, pair_rows in grouped.items():
+        ex_days, price_factors, volume_factors, recorded = zip(*pair_rows)
+        events[pair] = (
+            np.array(ex_days, dtype=np.int64),
+            suffix_products(np.array(price_factors, dtype=float)),
+            suffix_products(np.array(volume_factors, dtype=float)),
+            max(recorded).date(),
+        )
+    with _events_lock:
+        _events = (version, events)
+    db.info['adjustment_events'] = (db.get_transaction(), events)
+    return events
+
+
+def suffix_products(factors):
+    # [f0 * f1 * ... , f1 * ..., ..., f[-1], 1]
+    return np.append(np.cumprod(factors[::-1])[::-1], 1.0)
+
+
+def cumulative_factors(pair_events, days):
+    """
+    (price, volume) factor arrays of the bars on days (days since 1970-01-01) of one symbol,
+    from its adjustment_events entry. An event applies to the bars strictly before its ex-date.
+    """
+    ex_days, price_suffix, volume_suffix, _ = pair_events
+    later = np.searchsorted(ex_days, days, side='right')
+    return price_suffix[later], volume_suffix[later]
+
+
+def adjust_arrays(arrays, events, symbol=None, country=None):
+    """
+    Apply adjustment_events to fetch_bars arrays in place. The arrays need the date column, and
+    symbol and country unless they hold the bars of the single given symbol and country.
+    Volume is expected as float and stays float.
+    """
+    days = arrays['date'].view(np.int64)
+    if 'symbol' in arrays:
+        sym, cty = arrays['symbol'], arrays['country']
+        starts = np.flatnonzero((sym[1:] != sym[:-1]) | (cty[1:] != cty[:-1])) + 1
+        starts = np.concatenate(([0], starts)) if len(days) else starts
+        bounds = zip(starts.tolist(), np.append(starts[1:], len(days)).tolist())
+        runs = [((sym[start], cty[start]), start, stop) for start, stop in bounds]
+    else:
+        runs = [((symbol, country), 0, len(days))]
+    runs = [(events[pair], start, stop) for pair, start, stop in runs if pair in events]
+    if not runs:
+        return arrays
+
+    # One factor per row, so each column is multiplied once however many symbols were adjusted
+    price = np.ones(len(days))
+    volume = np.ones(len(days))
+    for pair_events, start, stop in runs:
+        price[start:stop], volume[start:stop] = cumulative_factors(pair_events, days[start:stop])
+    for name in ('open', 'high', 'low', 'close'):
+        if name in arrays:
+            arrays[name] *= price
+    if 'volume' in arrays:
+        arrays['volume'] = np.rint(arrays['volume'] * volume)
+    return arrays
+
+
+def adjust_store(events, store):
+    # Apply adjustment_events to a BarStore in place
+    for i in range(len(store)):
+        pair = (store.symbols[store.series_symbol[i]], store.countries[store.series_country[i]])
+        if pair not in events:
+            continue
+        start, stop = int(store.offsets[i]), int(store.offsets[i + 1])
+        price, volume = cumulative_factors(events[pair], store.days[start:stop])
+        for column in (store.open, store.high, store.low, store.close):
+            column[start:stop] = column[start:stop] * price
+        store.volume[start:stop] = np.rint(store.volume[start:stop] * volume)
+    return store
+
+
+if __name__ == "__main__":
+    from src.database import SessionLocal
+    from src.database.schema import upgrade_schema
+
+    parser = argparse.ArgumentParser(description="Record a split or dividend for read-time bar adjustment")
+    parser.add_argument("kind", choices=[SPLIT, DIVIDEND])
+    parser.add_argument("symbol")
+    parser.add_argument("country")
+    parser.add_argument("ex_date", type=date.fromisoformat)
+    parser.add_argument("value", type=float, help="Shares per old share for a split, cash per share for a dividend")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        upgrade_schema(db.get_bind())
+        if args.kind == SPLIT:
+            record_split(db, args.symbol, args.country, args.ex_date, args.value)
+        else:
+            record_dividend(db, args.symbol, args.country, args.ex_date, args.value)
+        print(f"Recorded {args.kind} of {args.symbol} ({args.country}) on {args.ex_date}")
+    finally:
+        db.close()
@@ -0,0 +1,202 @@
+# src/database/bar_store.py
+
+from array import array
+from datetime import date
+
+import numpy as np
+
+from src.database.models import StockData
+
+# Bars are stored as days since 1970-01-01 so the int32 column converts straight to datetime64[D]
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class BarStore:
+    """
+    Daily bars for many symbols in contiguous arrays: int32 day numbers, float32 OHLC and int64
+    volume, ordered by (symbol, country, date). Each (symbol, country) series is a row range given
+    by offsets; symbol and country names are stored once in dictionaries and referenced by code.
+    """
+    __slots__ = ('days', 'open', 'high', 'low', 'close', 'volume',
+                 'symbols', 'countries', 'series_symbol', 'series_country', 'offsets', '_series_index')
+
+    def __init__(self, days, open_, high, low, close, volume, symbols, countries, series_symbol, series_country, offsets):
+        self.days = days
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.symbols = symbols
+        self.countries = countries
+        self.series_symbol = series_symbol
+        self.series_country = series_country
+        self.offsets = offsets
+        self._series_index = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build a store from (symbol, country, date, open, high, low, close, volume) rows sorted by
+        symbol, country and date. Rows with a missing price or volume are skipped.
+        Columns are accumulated in typed buffers, so no Python object is kept per bar.
+        """
+        days = array('i')
+        open_, high, low, close = array('f'), array('f'), array('f'), array('f')
+        volume = array('q')
+        symbols, countries = [], []
+        symbol_codes, country_codes = {}, {}
+        series_symbol, series_country, offsets = array('i'), array('h'), array('q')
+
+        current = None
+        for symbol, country, bar_date, o, h, l, c, v in rows:
+            if o is None or h is None or l is None or c is None or v is None:
+                continue
+            if (symbol, country) != current:
+                current = (symbol, country)
+                if symbol not in symbol_codes:
+                    symbol_codes[symbol] = len(symbols)
+                    symbols.append(symbol)
+                if country not in country_codes:
+                    country_codes[country] = len(countries)
+                    countries.append(country)
+                series_symbol.append(symbol_codes[symbol])
+                series_country.append(country_codes[country])
+                offsets.append(len(days))
+            days.append(bar_date.toordinal() - EPOCH_ORDINAL)
+            open_.append(o)
+            high.append(h)
+            low.append(l)
+            close.append(c)
+            volume.append(v)
+        offsets.append(len(days))
+
+        return cls(
+            np.frombuffer(days, dtype=np.int32),
+            np.frombuffer(open_, dtype=np.float32),
+            np.frombuffer(high, dtype=np.float32),
+            np.frombuffer(low, dtype=np.float32),
+            np.frombuffer(close, dtype=np.float32),
+            np.frombuffer(volume, dtype=np.int64),
+            symbols,
+            countries,
+            np.frombuffer(series_symbol, dtype=np.int32),
+            np.frombuffer(series_country, dtype=np.int16),
+            np.frombuffer(offsets, dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, db, countries=None, symbols=None, start_date=None, yield_per=10000, adjust=True):
+        # Selects only the bar columns and streams them, so no StockData instances are built.
+        # Bars are adjusted for recorded splits and dividends unless adjust is False
+        from src.database.adjustments import adjustment_events, adjust_store
+        query = db.query(
+            StockData.symbol, StockData.country, StockData.date,
+            StockData.open, StockData.high, StockData.low, StockData.close, StockData.volume
+        )
+        if countries is not None:
+            query = query.filter(StockData.country.in_(countries))
+        if symbols is not None:
+            query = query.filter(StockData.symbol.in_(symbols))
+        if start_date is not None:
+            query = query.filter(StockData.date >= start_date)
+        query = query.order_by(StockData.symbol, StockData.country, StockData.date)
+        store = cls.from_rows(query.yield_per(yield_per))
+        if adjust:
+            events = adjustment_events(db)
+            if events:
+                adjust_store(events, store)
+        return store
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.series(i)
+
+    def series(self, i):
+        return SymbolBars(self, i)
+
+    def view(self, symbol, country):
+        # Returns None when the store has no bars for the pair
+        if self._series_index is None:
+            self._series_index = {
+                (self.symbols[s], self.countries[c]): i
+                for i, (s, c) in enumerate(zip(self.series_symbol.tolist(), self.series_country.tolist()))
+            }
+        i = self._series_index.get((symbol, country))
+        return None if i is None else self.series(i)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (
+            self.days, self.open, self.high, self.low, self.close, self.volume,
+            self.series_symbol, self.series_country, self.offsets
+        ))
+
+
+class SymbolBars:
+    """
+    One (symbol, country) series of a BarStore. The column properties are slices of the
+    store's arrays, so they share memory with it instead of copying.
+    """
+    __slots__ = ('store', 'index', 'start', 'stop')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self.start = int(store.offsets[index])
+        self.stop = int(store.offsets[index + 1])
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def symbol(self):
+        return self.store.symbols[self.store.series_symbol[self.index]]
+
+    @property
+    def country(self):
+        return self.store.countries[self.store.series_country[self.index]]
+
+    @property
+    def days(self):
+        return self.store.days[self.start:self.stop]
+
+    @property
+    def dates(self):
+        # Converting to datetime64 allocates; use days for copy-free access
+        return self.days.astype('datetime64[D]')
+
+    @property
+    def open(self):
+        return self.store.open[self.start:self.stop]
+
+    @property
+    def high(self):
+        return self.store.high[self.start:self.stop]
+
+    @property
+    def low(self):
+        return self.store.low[self.start:self.stop]
+
+    @property
+    def close(self):
+        return self.store.close[self.start:self.stop]
+
+    @property
+    def volume(self):
+        return self.store.volume[self.start:self.stop]
+
+    def to_frame(self):
+        # Copies into a DataFrame with the columns the pandas-based code expects
+        import pandas as pd
+        return pd.DataFrame({
+            'date': self.dates.astype('datetime64[ns]'),
+            'open': self.open.astype(float),
+            'high': self.high.astype(float),
+            'low': self.low.astype(float),
+            'close': self.close.astype(float),
+            'volume': self.volume,
+        })
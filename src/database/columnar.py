@@ -0,0 +1,135 @@
+# src/database/columnar.py
+
+from datetime import date
+
+import numpy as np
+from sqlalchemy import func, select
+
+from src.database.adjustments import adjustment_events, adjust_arrays
+from src.database.bar_store import EPOCH_ORDINAL
+from src.database.models import StockData
+
+BAR_COLUMNS = ('date', 'open', 'high', 'low', 'close', 'volume')
+PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# Volume is read as float so missing values become NaN; it is cast to int64 once they are dropped
+COLUMN_DTYPES = {
+    'symbol': object,
+    'country': object,
+    'date': 'datetime64[D]',
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.float64,
+}
+
+
+def bar_conditions(symbol=None, country=None, symbols=None, countries=None, start_date=None, end_date=None):
+    table = StockData.__table__
+    conditions = []
+    if symbol is not None:
+        conditions.append(table.c.symbol == symbol)
+    if country is not None:
+        conditions.append(table.c.country == country)
+    if symbols is not None:
+        conditions.append(table.c.symbol.in_(list(symbols)))
+    if countries is not None:
+        conditions.append(table.c.country.in_(list(countries)))
+    if start_date is not None:
+        conditions.append(table.c.date >= start_date)
+    if end_date is not None:
+        conditions.append(table.c.date <= end_date)
+    return conditions
+
+
+def fetch_bars(db, symbol=None, country=None, symbols=None, countries=None, start_date=None, end_date=None,
+               columns=BAR_COLUMNS, chunk_size=10000, adjust=True, keep_missing_volume=False):
+    """
+    Read the requested stock_data columns straight from the cursor into NumPy arrays,
+    ordered by symbol, country and date. db is a Session or Connection.
+    The matching rows are counted first so every column is allocated once, then filled from
+    fetchmany chunks of a Core select; no ORM objects or per-row dicts are built.
+    Rows with a missing price or volume among the requested columns are dropped; with
+    keep_missing_volume only a missing price drops a row, and volume stays float64 with NaN.
+    Returns {column: array}: dates as datetime64[D], prices as float64, volume as int64 and
+    symbol/country as object arrays sharing one string per distinct value.
+    Prices and volume are adjusted for the splits and dividends in adjustment_factors unless
+    adjust is False; the columns needed to place the events are read along when not requested.
+    """
+    requested = columns = tuple(columns)
+    events = adjustment_events(db) if adjust and any(name in PRICE_COLUMNS for name in columns) else {}
+    if events:
+        single = symbol is not None and country is not None
+        columns += tuple(name for name in (() if single else ('symbol', 'country')) + ('date',) if name not in columns)
+    table = StockData.__table__
+    conditions = bar_conditions(symbol, country, symbols, countries, start_date, end_date)
+
+    total = db.execute(select(func.count()).select_from(table).where(*conditions)).scalar_one()
+    arrays = {name: np.empty(total, dtype=COLUMN_DTYPES[name]) for name in columns}
+
+    query = (
+        select(*[table.c[name] for name in columns])
+        .where(*conditions)
+        .order_by(table.c.symbol, table.c.country, table.c.date)
+        .execution_options(stream_results=True)
+    )
+    result = db.execute(query)
+
+    strings = {}
+    filled = 0
+    while True:
+        chunk = result.fetchmany(chunk_size)
+        if not chunk:
+            break
+        stop = filled + len(chunk)
+        if stop > len(arrays[columns[0]]):
+            # Rows were inserted between the count and the read
+            for name in columns:
+                arrays[name] = np.concatenate((arrays[name], np.empty(max(stop - filled, chunk_size), dtype=COLUMN_DTYPES[name])))
+        for name, values in zip(columns, zip(*chunk)):
+            if name == 'date':
+                # Day numbers via toordinal are much cheaper than NumPy parsing date objects
+                arrays[name].view(np.int64)[filled:stop] = np.fromiter(map(date.toordinal, values), np.int64, len(values)) - EPOCH_ORDINAL
+                continue
+            if COLUMN_DTYPES[name] is object:
+                values = [strings.setdefault(value, value) for value in values]
+            arrays[name][filled:stop] = values
+        filled = stop
+    result.close()
+
+    arrays = {name: values[:filled] for name, values in arrays.items()}
+
+    checked = [name for name in columns if name in PRICE_COLUMNS and not (keep_missing_volume and name == 'volume')]
+    if checked:
+        valid = np.ones(filled, dtype=bool)
+        for name in checked:
+            valid &= ~np.isnan(arrays[name])
+        if not valid.all():
+            arrays = {name: values[valid] for name, values in arrays.items()}
+    if events:
+        adjust_arrays(arrays, events, symbol, country)
+        arrays = {name: arrays[name] for name in requested}
+    if 'volume' in arrays and not keep_missing_volume:
+        arrays['volume'] = arrays['volume'].astype(np.int64)
+    return arrays
+
+
+def series_bounds(arrays):
+    """
+    Split a multi-symbol fetch_bars result (read with the symbol and country columns) into its
+    (symbol, country) runs. Returns a list of (symbol, country, start, stop) row ranges.
+    """
+    keys = list(zip(arrays['symbol'].tolist(), arrays['country'].tolist()))
+    starts = [i for i in range(len(keys)) if i == 0 or keys[i] != keys[i - 1]]
+    return [keys[start] + (start, stop) for start, stop in zip(starts, starts[1:] + [len(keys)])]
+
+
+def fetch_bars_frame(db, symbol=None, country=None, symbols=None, countries=None, start_date=None, end_date=None,
+                     columns=BAR_COLUMNS, adjust=True):
+    # DataFrame form of fetch_bars for the pandas-based research code
+    import pandas as pd
+    arrays = fetch_bars(db, symbol, country, symbols, countries, start_date, end_date, columns, adjust=adjust)
+    if 'date' in arrays:
+        arrays['date'] = arrays['date'].astype('datetime64[ns]')
+    return pd.DataFrame(arrays, columns=list(columns))
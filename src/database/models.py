@@ -1,6 +1,6 @@
 # src/database/models.py
 
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Index, Text
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -25,6 +25,7 @@ class ScreenedStock(Base):
     id = Column(Integer, primary_key=True)
     symbol = Column(String, nullable=False)
     country = Column(String, nullable=False)
+    run_id = Column(Integer, index=True)  # ResultRun that wrote the row; NULL for rows from before versioning
 
 class VCPStock(Base):
     __tablename__ = 'vcp_stocks'
@@ -34,3 +35,160 @@ class VCPStock(Base):
     stage = Column(String)
     country = Column(String)  # Add this line to include the country attribute
     detected_date = Column(Date)
+    run_id = Column(Integer, index=True)  # ResultRun that wrote the row; NULL for rows from before versioning
+    contraction_count = Column(Integer)  # Tightening pullbacks in the base
+    final_contraction = Column(Float)  # Depth of the last pullback as a fraction of its high
+    volume_ratio = Column(Float)  # Mean volume of the last 14 days over the 50-day average; NULL without volume data
+    volume_dry_up = Column(Float)  # Fall of the mean volume from the base's first pullback to its last; NULL without volume data
+
+
+class SupportResistanceLevel(Base):
+    __tablename__ = 'support_resistance_levels'
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    method = Column(String, nullable=False)  # 'v1' (pivots and zones) or 'v2' (fractal levels)
+    months = Column(Integer, nullable=False)  # Chart window the levels were computed for
+    kind = Column(String, nullable=False)  # 'pivot', 'resistance_zone', 'support_zone', 'resistance', 'support'
+    price = Column(Float)  # Pivot price, zone mean or level; NULL for pivots that are both high and low
+    low = Column(Float)  # Zone bounds
+    high = Column(Float)
+    count = Column(Integer)  # Pivots in the zone
+    pivot_date = Column(Date)
+    first_date = Column(Date, nullable=False)  # First and last bar of the window
+    last_date = Column(Date, nullable=False)
+    computed_date = Column(Date, nullable=False)
+
+    __table_args__ = (
+        Index('ix_support_resistance_levels_lookup', 'symbol', 'country', 'method', 'months'),
+    )
+
+
+class TrendLine(Base):
+    __tablename__ = 'trend_lines'
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # 'resistance' (through pivot highs) or 'support' (through pivot lows)
+    start_date = Column(Date, nullable=False)  # First and second anchor pivot
+    end_date = Column(Date, nullable=False)
+    start_price = Column(Float, nullable=False)  # Line value on start_date
+    slope = Column(Float, nullable=False)  # Price per trading bar
+    touches = Column(Integer, nullable=False)
+    violations = Column(Integer, nullable=False)
+    score = Column(Integer, nullable=False)
+    value_at_last = Column(Float, nullable=False)  # Line value on last_date
+    last_date = Column(Date, nullable=False)  # Last bar the line was fitted to
+    computed_date = Column(Date, nullable=False)
+
+    __table_args__ = (
+        Index('ix_trend_lines_symbol_country', 'symbol', 'country'),
+    )
+
+
+class RSRating(Base):
+    __tablename__ = 'rs_ratings'
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, index=True, nullable=False)
+    country = Column(String, nullable=False)
+    rs_rating = Column(Integer, nullable=False)  # 1-99 percentile within the country
+    weighted_return = Column(Float, nullable=False)
+    computed_date = Column(Date, nullable=False)
+
+
+class ResistanceLevel(Base):
+    __tablename__ = 'resistance_levels'
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    price = Column(Float, nullable=False)  # High of the pivot bar
+    pivot_date = Column(Date, nullable=False)
+    confirmed_date = Column(Date, nullable=False)  # Bar that completed the pivot window
+
+    __table_args__ = (
+        Index('ix_resistance_levels_symbol_country_date', 'symbol', 'country', 'pivot_date', unique=True),
+    )
+
+
+class AdjustmentFactor(Base):
+    __tablename__ = 'adjustment_factors'
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    date = Column(Date, nullable=False)  # Ex-date; bars before it are adjusted
+    kind = Column(String, nullable=False)  # 'split' or 'dividend'
+    price_factor = Column(Float, nullable=False)  # Multiplies the prices of earlier bars
+    volume_factor = Column(Float, nullable=False)  # Multiplies the volume of earlier bars
+    recorded_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_adjustment_factors_symbol_country_date', 'symbol', 'country', 'date', unique=True),
+    )
+
+
+class VCPEvent(Base):
+    __tablename__ = 'vcp_events'
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    date = Column(Date, nullable=False)
+    stage = Column(String, nullable=False)  # 'Stage 2' or 'Stage 4'
+    contraction = Column(Float, nullable=False)  # 10-day mean of ATR / close
+    close = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('ix_vcp_events_symbol_country_date', 'symbol', 'country', 'date', unique=True),
+        Index('ix_vcp_events_country_date', 'country', 'date'),
+    )
+
+class JobShard(Base):
+    __tablename__ = 'job_shards'
+
+    id = Column(Integer, primary_key=True)
+    job = Column(String, nullable=False)  # Run name, e.g. 'nightly-2026-10-19-india-usa'
+    stage = Column(String, nullable=False)  # 'screening' or 'vcp'
+    shard = Column(Integer, nullable=False)  # Position of the shard within the stage
+    run_id = Column(Integer)  # ResultRun the stage's shards write to
+    symbols = Column(Text, nullable=False)  # JSON list of [symbol, country] pairs
+    status = Column(String, nullable=False, default='pending')  # 'pending', 'running', 'done' or 'failed'; 'setup' while shard 0 holds the stage's setup claim
+    worker = Column(String)  # Host and process holding or last holding the shard
+    attempts = Column(Integer, nullable=False, default=0)
+    claimed_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    error = Column(Text)  # Last failure
+
+    __table_args__ = (
+        Index('ix_job_shards_job_stage_shard', 'job', 'stage', 'shard', unique=True),
+    )
+
+
+class ResultRun(Base):
+    __tablename__ = 'result_runs'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # 'screening' or 'vcp'
+    countries = Column(String, nullable=False)  # Comma-separated countries the run covers
+    job = Column(String)  # Sharded job that built the run, if any
+    started_at = Column(DateTime, nullable=False, default=datetime.now)
+    published_at = Column(DateTime)  # NULL while the run is being built
+
+
+class ActiveResult(Base):
+    __tablename__ = 'active_results'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    run_id = Column(Integer, nullable=False)  # Run served for the country
+    previous_run_id = Column(Integer)  # Kept until the next publish for readers that started before the flip
+    published_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_active_results_kind_country', 'kind', 'country', unique=True),
+    )
@@ -0,0 +1,117 @@
+# src/database/query_stats.py
+
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Counts the SQL statements and database time of a unit of work: an API request (see the
+# middleware in src/main.py) or a pipeline stage. Statements are also grouped by shape, the SQL
+# text with its parameters and literals replaced, so a query issued once per symbol or per row
+# shows up as one shape repeated many times. The stats of the current unit live in a context
+# variable, which follows the request into the thread pool that runs the handlers.
+
+REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', '50'))  # Same shape this often is reported as a likely N+1
+QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET', '0')) or None  # Default statement budget of a tracked unit
+STRICT = os.environ.get('SQL_QUERY_STRICT', '').lower() in ('1', 'true', 'yes')  # Raise when a unit exceeds its budget
+
+_current = ContextVar('query_stats', default=None)
+
+_PARAMETER = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?|\b\d+(?:\.\d+)?\b")
+_PARAMETER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class QueryStats:
+    def __init__(self, name, budget=None):
+        self.name = name
+        self.budget = budget
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        # [(shape, count)] of the shapes issued at least threshold times, most frequent first
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+    def summary(self):
+        return f"{self.name}: {self.count} queries, {self.seconds * 1000:.1f} ms in the database"
+
+
+def statement_shape(statement):
+    # 'SELECT ... WHERE symbol IN (?, ?, ?) AND date >= ?' -> 'SELECT ... WHERE symbol IN (?) AND date >= ?'
+    shape = _PARAMETER.sub('?', statement)
+    shape = _PARAMETER_LIST.sub('?', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def current_stats():
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._query_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    start = getattr(context, '_query_stats_start', None)
+    if stats is not None and start is not None:
+        # An executemany is one round of the driver, so it counts as one statement
+        stats.record(statement, time.perf_counter() - start)
+
+
+def install_query_counter(engine):
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def report(stats, threshold=REPEAT_THRESHOLD):
+    print(stats.summary())
+    for shape, count in stats.repeated(threshold):
+        # The FROM and WHERE clauses tell shapes apart, so long select lists are cut in the middle
+        print(f"  repeated {count}x: {shape if len(shape) <= 240 else shape[:100] + ' ... ' + shape[-135:]}")
+
+
+@contextmanager
+def track_queries(name, budget=QUERY_BUDGET, strict=STRICT, log=True):
+    """
+    Count the statements run inside the block, which yields the QueryStats. On exit the summary
+    and any repeated shapes are printed, unless log is off and the block neither repeated a
+    shape nor went over budget; in strict mode a block that ran more than budget statements
+    raises QueryBudgetExceeded. Blocks nest; an inner block's statements are not added to the
+    outer one.
+    """
+    stats = QueryStats(name, budget)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+    check_stats(stats, log, strict)
+
+
+def check_stats(stats, log=True, strict=STRICT):
+    # Report a finished unit and, in strict mode, raise when it went over budget
+    if log or stats.repeated() or stats.over_budget():
+        report(stats)
+    if strict and stats.over_budget():
+        raise QueryBudgetExceeded(f"{stats.name} ran {stats.count} queries, over its budget of {stats.budget}")
@@ -0,0 +1,28 @@
+# src/database/schema.py
+
+from sqlalchemy import inspect, text
+
+from src.database.models import Base
+
+
+def upgrade_schema(engine):
+    """
+    Create missing tables, then add columns and indexes that were added to existing tables'
+    models since they were created. create_all alone never alters an existing table.
+    Only nullable columns can be added this way, as existing rows get NULL.
+    """
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} to an existing table")
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
@@ -1,16 +1,14 @@
 # src/main.py
 import sys
 import os
+import asyncio
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
-from src.database import Base, engine, SessionLocal
-from src.controller.api import router as api_router
-from src.service.screener_service import run_screening
-from src.service.vcp_service import run_vcp_detection
+from src.controller.api import router as api_router, warm_up
 
 app = FastAPI()
 
@@ -23,15 +21,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Count the SQL statements and database time of every request and report them in response
+# headers. Requests that repeat a statement shape many times, a likely N+1, are printed; with
+# SQL_QUERY_STRICT=1 a request over SQL_QUERY_BUDGET statements fails.
+# The headers are sent before the body, so they only cover the statements run until the
+# response starts. Statements run while a streamed body is produced still go to the request's
+# stats, which are reported and checked again once the body is complete.
+@app.middleware("http")
+async def query_stats_middleware(request, call_next):
+    from src.database.query_stats import track_queries
+    with track_queries(f"{request.method} {request.url.path}", log=False) as stats:
+        response = await call_next(request)
+    response.headers['X-DB-Queries'] = str(stats.count)
+    response.headers['X-DB-Time-Ms'] = f"{stats.seconds * 1000:.1f}"
+    repeated = stats.repeated()
+    if repeated:
+        response.headers['X-DB-Repeated-Statements'] = str(len(repeated))
+    response.body_iterator = count_body_queries(response.body_iterator, stats, stats.count)
+    return response
+
+async def count_body_queries(body, stats, counted):
+    # The body runs in the request's context, so its statements are recorded on the same stats.
+    # In strict mode a body that takes the request over budget is cut off
+    from src.database.query_stats import check_stats
+    async for chunk in body:
+        yield chunk
+    if stats.count > counted:
+        check_stats(stats, log=False)
+
 # Include your API router
 app.include_router(api_router)  # Remove the prefix if it wasn't there before
 
+def report_warm_up(future):
+    # A failed warm-up would otherwise only show up on the first request that needs the module
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Warm-up failed: {future.exception()!r}")
+
 # Debug: Print all registered routes
 @app.on_event("startup")
 async def startup_event():
     print("Registered routes:")
     for route in app.routes:
-        print(f"{route.methods} {route.path}")
+        print(f"{getattr(route, 'methods', '')} {getattr(route, 'path', '')}")
+
+    # Create the tables and columns the read paths expect, as the pipeline does, so an API that
+    # starts before the first pipeline run after an upgrade does not fail on them. The chart
+    # endpoints read adjustment_factors and support_resistance_levels; with no snapshot yet they
+    # compute the levels live
+    from src.database import engine
+    from src.database.schema import upgrade_schema
+    await asyncio.get_running_loop().run_in_executor(None, upgrade_schema, engine)
+
+    # Set WARMUP_ON_STARTUP=1 to load the database and charting modules in the background
+    # instead of on the first request that needs them
+    if os.environ.get('WARMUP_ON_STARTUP', '').lower() in ('1', 'true', 'yes'):
+        app.state.warm_up = asyncio.get_running_loop().run_in_executor(None, warm_up)
+        app.state.warm_up.add_done_callback(report_warm_up)
+
+    # Set STREAM_SOURCE to an NDJSON replay file or tcp://host:port to evaluate VCP and breakout
+    # signals on live bar updates; clients follow them on /stream/events
+    stream_source = os.environ.get('STREAM_SOURCE')
+    if stream_source:
+        from src.service.stream_service import start_stream, stream_stopped
+        countries = os.environ.get('STREAM_COUNTRIES')
+        app.state.stream_task = asyncio.create_task(start_stream(
+            stream_source,
+            countries=countries.split(',') if countries else None,
+            interval=float(os.environ.get('STREAM_REPLAY_INTERVAL', '0'))
+        ))
+        app.state.stream_task.add_done_callback(stream_stopped)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    stream_task = getattr(app.state, 'stream_task', None)
+    if stream_task is not None and not stream_task.done():
+        stream_task.cancel()
+        await asyncio.gather(stream_task, return_exceptions=True)
 
 if __name__ == "__main__":
     uvicorn.run("src.main:app", host="0.0.0.0", port=8000, reload=True)
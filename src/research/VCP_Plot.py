@@ -2,33 +2,23 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from src.database.models import StockData, VCPStock
+from src.database.models import VCPStock
+from src.database.columnar import fetch_bars_frame
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
 
-def detect_and_plot_vcp(symbol='NELCO', country='india'):
-    # Create database connection
-    engine = create_engine(DATABASE_URL)  # Replace with your actual database URL
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    # Fetch data from the database
-    query = session.query(StockData).filter(
-        StockData.symbol == symbol,
-        StockData.country == country
-    ).order_by(StockData.date)
-    
-    df = pd.read_sql(query.statement, session.bind)
-    df.set_index('date', inplace=True)
-
-    # Calculate technical indicators manually
-
+def label_vcp_stages(df, lookback=20, contraction_threshold=0.9):
+    """
+    Add the 50/200-day SMAs, ATR, contraction and VCP_Stage columns to a date-ordered bar
+    DataFrame. A day after the first lookback days is a VCP when its contraction is below
+    contraction_threshold times the mean contraction of the lookback days before it; it is
+    'Stage 2' when close > 50 SMA > 200 SMA and 'Stage 4' when close < 50 SMA < 200 SMA.
+    Every day is labelled at once with rolling operations.
+    """
     # Simple Moving Averages
     df['50_SMA'] = df['close'].rolling(window=50).mean()
     df['200_SMA'] = df['close'].rolling(window=200).mean()
@@ -48,18 +38,33 @@ def detect_and_plot_vcp(symbol='NELCO', country='india'):
     df['ATR_Ratio'] = df['ATR'] / df['close']
     df['Contraction'] = df['ATR_Ratio'].rolling(window=10).mean()
 
-    # Identify VCP stages
-    df['VCP_Stage'] = np.nan
-    lookback = 20
-    contraction_threshold = 0.9  # Adjust as needed
+    # Mean of the lookback days before each day, skipping the ones without a contraction yet
+    prior_contraction = df['Contraction'].rolling(window=lookback, min_periods=1).mean().shift(1)
+    contracting = (df['Contraction'] < prior_contraction * contraction_threshold).to_numpy(copy=True)
+    contracting[:lookback] = False
+
+    close, sma_50, sma_200 = df['close'].to_numpy(), df['50_SMA'].to_numpy(), df['200_SMA'].to_numpy()
+    stages = np.full(len(df), np.nan, dtype=object)
+    stages[contracting & (close > sma_50) & (sma_50 > sma_200)] = 'Stage 2'
+    stages[contracting & (close < sma_50) & (sma_50 < sma_200)] = 'Stage 4'
+    df['VCP_Stage'] = stages
+    return df
+
+
+def detect_and_plot_vcp(symbol='NELCO', country='india'):
+    import plotly.graph_objects as go
+
+    # Create database connection
+    engine = create_engine(DATABASE_URL)  # Replace with your actual database URL
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    # Fetch data from the database
+    df = fetch_bars_frame(session, symbol=symbol, country=country)
+    df.set_index('date', inplace=True)
 
-    for i in range(lookback, len(df)):
-        recent_contractions = df['Contraction'].iloc[i-lookback:i]
-        if df['Contraction'].iloc[i] < recent_contractions.mean() * contraction_threshold:
-            if df['close'].iloc[i] > df['50_SMA'].iloc[i] > df['200_SMA'].iloc[i]:
-                df.loc[df.index[i], 'VCP_Stage'] = 'Stage 2'
-            elif df['close'].iloc[i] < df['50_SMA'].iloc[i] < df['200_SMA'].iloc[i]:
-                df.loc[df.index[i], 'VCP_Stage'] = 'Stage 4'
+    # Calculate technical indicators and identify VCP stages
+    label_vcp_stages(df)
 
     # Plot the stock data and VCP detections
     fig = go.Figure()
@@ -110,5 +115,5 @@ def detect_and_plot_vcp(symbol='NELCO', country='india'):
 
     session.close()
 
-# Call the function
-detect_and_plot_vcp('NELCO', 'india')
+if __name__ == "__main__":
+    detect_and_plot_vcp('NELCO', 'india')
@@ -2,15 +2,14 @@ import sys
 import os
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.database.models import StockData
+from src.database.columnar import fetch_bars_frame
+from src.research.pivots import find_pivots, PIVOT_HIGH
 
 # Constants
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -30,69 +29,33 @@ def create_db_session(database_url):
     return Session()
 
 def fetch_stock_data(session, symbol, country, start_date=None, end_date=None):
-    query = session.query(StockData).filter(
-        StockData.symbol == symbol,
-        StockData.country == country
-    )
-    
-    if start_date is not None:
-        query = query.filter(StockData.date >= start_date)
-    
-    if end_date is not None:
-        query = query.filter(StockData.date <= end_date)
-    
-    query = query.order_by(StockData.date)
-    
-    df = pd.read_sql(query.statement, session.bind)
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.drop_duplicates()
-    df = df.dropna(subset=['open', 'high', 'low', 'close', 'volume'])
-    return df.sort_values('date').reset_index(drop=True)
+    # Ordered by date and without missing values straight from the query
+    return fetch_bars_frame(session, symbol=symbol, country=country, start_date=start_date, end_date=end_date)
 
 def generate_buy_signal(df, open_price, close_price):
-    def pivotid(df, l, n1, n2):
-        if l - n1 < 0 or l + n2 >= len(df):
-            return 0
-
-        pividlow = 1
-        pividhigh = 1
-        for i in range(l - n1, l + n2 + 1):
-            if df['low'].iloc[l] > df['low'].iloc[i]:
-                pividlow = 0
-            if df['high'].iloc[l] < df['high'].iloc[i]:
-                pividhigh = 0
-        if pividlow and pividhigh:
-            return 3
-        elif pividlow:
-            return 1
-        elif pividhigh:
-            return 2
-        else:
-            return 0
-
-    df = df.copy()
-    df.reset_index(drop=True, inplace=True)
-
-    # Compute pivots
-    df['pivot'] = [pivotid(df, idx, PIVOT_WINDOW, PIVOT_WINDOW) for idx in range(len(df))]
-
-    # Extract high pivots (resistance levels)
-    high_pivots = df[df['pivot'] == 2].copy()
-    high_pivots['price'] = high_pivots['high']
-
-    # Sort high pivots by date descending to get recent ones first
-    high_pivots = high_pivots.sort_values(by='date', ascending=False)
-
-    # Get the last N resistance levels
-    recent_high_pivots = high_pivots.head(LAST_N_RESISTANCE_LEVELS)
+    high = df['high'].to_numpy(dtype=float)
+    pivots = find_pivots(high, df['low'].to_numpy(dtype=float), PIVOT_WINDOW, PIVOT_WINDOW)
+
+    # Get the last N resistance levels: the most recent high pivots
+    high_pivots = np.flatnonzero(pivots == PIVOT_HIGH)
+    most_recent_first = np.argsort(df['date'].to_numpy()[high_pivots], kind='stable')[::-1]
+    recent_high_pivots = high_pivots[most_recent_first[:LAST_N_RESISTANCE_LEVELS]]
 
     # Get resistance levels from recent pivots
-    resistance_levels = sorted(recent_high_pivots['price'].unique())
+    resistance_levels = sorted(np.unique(high[recent_high_pivots]))
 
     if not resistance_levels:
         # No resistance levels found
         return False, None, None
 
+    return evaluate_breakout(resistance_levels, open_price, close_price)
+
+def evaluate_breakout(resistance_levels, open_price, close_price):
+    """
+    Breakout rule shared by generate_buy_signal, the streaming service and the breakout scanner.
+    resistance_levels are the sorted recent resistance prices; returns
+    (signal, stop_loss_price, profit_target).
+    """
     # Now, check for breakout above any recent resistance level
     # A breakout occurs if open_price < level and close_price > level
     broken_levels = [level for level in resistance_levels if open_price < level < close_price]
@@ -133,6 +96,10 @@ def generate_buy_signal(df, open_price, close_price):
     return True, stop_loss_price, profit_target
 
 def main():
+    # Plotting is only needed for the chart below, not by the signal functions
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     if DATABASE_URL is None:
         print("Error: DATABASE_URL is not set in the environment variables.")
         return
@@ -0,0 +1,179 @@
+import numpy as np
+
+# Volatility contraction sequences from zigzag swings. A swing high is confirmed once the low
+# falls a threshold below it, and a swing low once the high rises that much above it. The
+# threshold is a multiple of the series' typical daily true range, so a volatile stock needs a
+# larger reversal than a quiet one and day-to-day noise does not count as a swing. Every
+# pullback from a swing high to the following swing low is a contraction, measured as a fraction
+# of the high. In a VCP every pullback from the top of the base goes less deep than the one
+# before, such as 25% -> 12% -> 6%, and the first is at least MIN_FIRST_CONTRACTION deep.
+
+ZIGZAG_RANGE_MULTIPLE = 3.0  # A swing ends on a reversal of this many median daily true ranges
+MIN_ZIGZAG_THRESHOLD = 0.03  # but never on less than 3%
+MIN_FIRST_CONTRACTION = 0.10  # The pullback off the base's high goes at least this deep
+TIGHT_CONTRACTION = 0.10  # A final pullback at most this deep is a tight base
+SWING_HIGH = 1
+SWING_LOW = -1
+
+
+def swing_threshold(high, low, close, multiple=ZIGZAG_RANGE_MULTIPLE, minimum=MIN_ZIGZAG_THRESHOLD):
+    """
+    Zigzag threshold of one bar series: multiple times its median daily true range as a
+    fraction of the previous close, and at least minimum. Gaps count as range, as in ATR.
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+    if len(close) < 2:
+        return minimum
+    previous = close[:-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ranges = (np.maximum(high[1:], previous) - np.minimum(low[1:], previous)) / previous
+    ranges = ranges[np.isfinite(ranges)]
+    return max(minimum, multiple * float(np.median(ranges))) if len(ranges) else minimum
+
+
+def zigzag(high, low, threshold=MIN_ZIGZAG_THRESHOLD):
+    """
+    Swings of one bar series, found in a single pass and then settled onto the extremes of
+    their legs (see settle_swings). Returns (swings, pending): swings is the list of
+    confirmed (index, price, kind) turning points in order, alternating SWING_HIGH and SWING_LOW,
+    and pending is the extreme of the leg still in progress, or None before the first reversal.
+    Each swing is the extreme of the bars between its neighbours, and no two swings share a bar,
+    so every leg spans at least one bar.
+    """
+    high = np.asarray(high, dtype=float).tolist()
+    low = np.asarray(low, dtype=float).tolist()
+    swings = []
+    if not high:
+        return swings, None
+
+    trend = 0  # 1 while rising to a swing high, -1 while falling to a swing low
+    high_index = low_index = 0
+    for i in range(1, len(high)):
+        # Extremes of the current leg before bar i, for merging legs below
+        leg_high, leg_low = high_index, low_index
+        if trend >= 0 and high[i] > high[high_index]:
+            high_index = i
+        if trend <= 0 and low[i] < low[low_index]:
+            low_index = i
+        if trend >= 0 and high_index < i and low[i] <= high[high_index] * (1 - threshold):
+            swings.append((high_index, high[high_index], SWING_HIGH))
+            trend = -1
+            # The new leg starts after the swing's bar, even when that bar's own low is lower;
+            # the bars in between stayed within threshold of the high, so bar i is the lowest
+            low_index = i
+        elif trend <= 0 and low_index < i and high[i] >= low[low_index] * (1 + threshold):
+            swings.append((low_index, low[low_index], SWING_LOW))
+            trend = 1
+            high_index = i
+        # Going past the swing that started the current leg without a reversal means the
+        # previous leg went on. The two legs merge, so the swing before them becomes the
+        # extreme of both
+        elif trend == 1 and swings and low[i] < swings[-1][1]:
+            swings.pop()
+            if swings and high[leg_high] > swings[-1][1]:
+                swings[-1] = (leg_high, high[leg_high], SWING_HIGH)
+            trend = -1
+            low_index = i
+        elif trend == -1 and swings and high[i] > swings[-1][1]:
+            swings.pop()
+            if swings and low[leg_low] < swings[-1][1]:
+                swings[-1] = (leg_low, low[leg_low], SWING_LOW)
+            trend = 1
+            high_index = i
+
+    if trend == 1:
+        pending = (high_index, high[high_index], SWING_HIGH)
+    elif trend == -1:
+        pending = (low_index, low[low_index], SWING_LOW)
+    else:
+        pending = None
+    if pending is None:
+        return swings, None
+    points = settle_swings(swings + [pending], high, low)
+    return points[:-1], points[-1]
+
+
+def settle_swings(points, high, low):
+    """
+    Move every point onto the extreme of the bars strictly between its neighbours, until none
+    moves. A bar whose range is wider than the threshold can end one leg and start the next;
+    the pass above keeps one of its ends, and the other can lie beyond a neighbouring swing.
+    Points only move to more extreme bars, so legs only grow and every move keeps the order.
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    points = list(points)
+    moved = True
+    while moved:
+        moved = False
+        for k, (index, price, kind) in enumerate(points):
+            start = points[k - 1][0] + 1 if k > 0 else 0
+            stop = points[k + 1][0] if k + 1 < len(points) else len(high)
+            if kind == SWING_HIGH:
+                best = start + int(np.argmax(high[start:stop]))
+                if high[best] > price:
+                    points[k] = (best, float(high[best]), kind)
+                    moved = True
+            else:
+                best = start + int(np.argmin(low[start:stop]))
+                if low[best] < price:
+                    points[k] = (best, float(low[best]), kind)
+                    moved = True
+    return points
+
+
+def contraction_legs(swings, pending=None):
+    """
+    The pullbacks from the highest swing high on, the left side of the base, as
+    [(high_index, low_index, depth)] with depth a fraction of the high they start from.
+    A decline still in progress counts as the last pullback.
+    """
+    points = swings + [pending] if pending is not None and pending[2] == SWING_LOW else list(swings)
+    highs = [i for i, (_, _, kind) in enumerate(points) if kind == SWING_HIGH]
+    if not highs:
+        return []
+    base_start = max(highs, key=lambda i: points[i][1])
+    legs = []
+    for i in range(base_start, len(points) - 1):
+        if points[i][2] == SWING_HIGH:
+            (high_index, high, _), (low_index, low, _) = points[i], points[i + 1]
+            legs.append((high_index, low_index, (high - low) / high))
+    return legs
+
+
+def contraction_volumes(volume, legs):
+    # Mean volume of the bars of each pullback, from its swing high to its swing low
+    volume = np.asarray(volume, dtype=float)
+    return [float(volume[high_index:low_index + 1].mean()) for high_index, low_index in legs]
+
+
+def classify_contractions(high, low, close, threshold=None):
+    """
+    The contraction sequence of a bar series' base: {'count', 'depths', 'legs', 'tightness'},
+    where legs are the (high_index, low_index) bars of each pullback and tightness is 'tight'
+    when the last pullback is at most TIGHT_CONTRACTION deep, else 'loose'.
+    threshold defaults to swing_threshold of the series. count is 0 unless every pullback from
+    the top of the base is shallower than the one before and the first one, off the base's
+    high, is at least MIN_FIRST_CONTRACTION deep.
+    """
+    if threshold is None:
+        threshold = swing_threshold(high, low, close)
+    legs = contraction_legs(*zigzag(high, low, threshold))
+    depths = [depth for _, _, depth in legs]
+    tightening = all(earlier > later for earlier, later in zip(depths, depths[1:]))
+    if not depths or not tightening or depths[0] < MIN_FIRST_CONTRACTION:
+        return {'count': 0, 'depths': [], 'legs': [], 'tightness': None}
+    return {
+        'count': len(depths),
+        'depths': depths,
+        'legs': [(high_index, low_index) for high_index, low_index, _ in legs],
+        'tightness': 'tight' if depths[-1] <= TIGHT_CONTRACTION else 'loose',
+    }
+
+
+def contraction_label(stage, contractions):
+    # 'Stage 2 3T tight 25.0/12.1/6.3': trend stage, contraction count, tightness and depths in percent
+    depths = '/'.join(f"{depth * 100:.1f}" for depth in contractions['depths'])
+    return f"{stage} {contractions['count']}T {contractions['tightness']} {depths}"
@@ -0,0 +1,110 @@
+import base64
+import json
+from functools import lru_cache
+
+import numpy as np
+import orjson
+
+# Builds Plotly figure dicts directly from arrays, in the same shape pio.to_json produces,
+# so the charts skip graph_objects validation and the encode/parse/encode round-trip.
+
+
+@lru_cache(maxsize=1)
+def default_template():
+    # The default template is what every serialized go.Figure carries; build it once per process
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    return json.loads(pio.to_json(go.Figure()))['layout']['template']
+
+
+def encode_array(values):
+    # Typed-array encoding used by Plotly for numeric arrays
+    values = np.ascontiguousarray(values, dtype='<f8')
+    return {'dtype': 'f8', 'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+
+
+def encode_dates(dates):
+    return np.datetime_as_string(np.asarray(dates, dtype='datetime64[s]')).tolist()
+
+
+def encode_date(value):
+    return str(np.datetime64(value, 's'))
+
+
+def candlestick_trace(dates, open_, high, low, close, name='OHLC'):
+    return {
+        'close': encode_array(close),
+        'decreasing': {'line': {'color': 'red'}},
+        'high': encode_array(high),
+        'increasing': {'line': {'color': 'green'}},
+        'low': encode_array(low),
+        'name': name,
+        'open': encode_array(open_),
+        'x': encode_dates(dates),
+        'type': 'candlestick',
+    }
+
+
+def marker_trace(dates, prices, name, color='blue', size=5):
+    return {
+        'marker': {'color': color, 'size': size},
+        'mode': 'markers',
+        'name': name,
+        'x': encode_dates(dates),
+        'y': encode_array(prices),
+        'type': 'scatter',
+    }
+
+
+def line_trace(dates, prices, name, color, width=2):
+    # Short point lists stay plain JSON numbers, as they were built from Python lists
+    return {
+        'line': {'color': color, 'width': width},
+        'mode': 'lines',
+        'name': name,
+        'x': encode_dates(dates),
+        'y': np.asarray(prices, dtype=float).tolist(),
+        'type': 'scatter',
+    }
+
+
+def hline_shapes(prices, color='blue', dash='dot'):
+    # Same shape fig.add_hline produces: spans the x domain at each price
+    return [
+        {'line': {'color': color, 'dash': dash}, 'type': 'line', 'x0': 0, 'x1': 1,
+         'xref': 'x domain', 'y0': price, 'y1': price, 'yref': 'y'}
+        for price in np.asarray(prices, dtype=float).tolist()
+    ]
+
+
+def hline_annotations(prices, text):
+    # Same annotation fig.add_hline produces with annotation_position="right"
+    return [
+        {'showarrow': False, 'text': text, 'x': 1, 'xanchor': 'left', 'xref': 'x domain',
+         'y': price, 'yanchor': 'middle', 'yref': 'y'}
+        for price in np.asarray(prices, dtype=float).tolist()
+    ]
+
+
+def chart_layout(title, y_range=None, shapes=None, annotations=None):
+    layout = {
+        'template': default_template(),
+        'xaxis': {'rangeslider': {'visible': False}, 'title': {'text': 'Date'}, 'showgrid': False},
+        'yaxis': {'title': {'text': 'Price'}, 'showgrid': False},
+        'title': {'text': title},
+        'paper_bgcolor': 'white',
+        'plot_bgcolor': 'white',
+    }
+    if y_range is not None:
+        layout['yaxis']['range'] = [float(y_range[0]), float(y_range[1])]
+    if shapes:
+        layout['shapes'] = shapes
+    if annotations:
+        layout['annotations'] = annotations
+    return layout
+
+
+def to_json_bytes(figure):
+    # Single encode of the whole figure; NaN becomes null as in pio.to_json
+    return orjson.dumps(figure, option=orjson.OPT_SERIALIZE_NUMPY)
+
@@ -2,12 +2,12 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from src.database.models import StockData
+from src.database.columnar import fetch_bars_frame
+from src.research.pivots import find_pivots
 import datetime
 
 # Replace 'your_database_url' with your actual database URL or ensure DATABASE_URL is set in your environment
@@ -20,12 +20,7 @@ def detect_and_plot_support_resistance(symbol, country):
     session = Session()
 
     # Fetch data from the database
-    query = session.query(StockData).filter(
-        StockData.symbol == symbol,
-        StockData.country == country
-    ).order_by(StockData.date)
-
-    df = pd.read_sql(query.statement, session.bind)
+    df = fetch_bars_frame(session, symbol=symbol, country=country)
     df.set_index('date', inplace=True)
 
     # Ensure the index is unique
@@ -44,32 +39,8 @@ def detect_and_plot_support_resistance(symbol, country):
     # Before pivot calculation
     print(f"Data types of columns:\n{df.dtypes}")
 
-    # Detect pivot points
-    def pivotid(df, l, n1, n2):  # n1 n2 before and after candle l
-        print(f"pivotid called with l={l}, n1={n1}, n2={n2}")  # Debug print
-        if not isinstance(l, int):
-            raise ValueError("l must be an integer, not a slice")
-        
-        if l - n1 < 0 or l + n2 >= len(df):
-            return 0
-
-        pividlow = 1
-        pividhigh = 1
-        for i in range(l - n1, l + n2 + 1):
-            if df['low'].iloc[l] > df['low'].iloc[i]:
-                pividlow = 0
-            if df['high'].iloc[l] < df['high'].iloc[i]:
-                pividhigh = 0
-        if pividlow and pividhigh:
-            return 3
-        elif pividlow:
-            return 1
-        elif pividhigh:
-            return 2
-        else:
-            return 0
-
-    df['pivot'] = df.apply(lambda x: pivotid(df, df.index.get_loc(x.name), 10, 10), axis=1)
+    # Detect pivot points: the lowest low or highest high of the 10 candles on each side
+    df['pivot'] = find_pivots(df['high'].values, df['low'].values, 10, 10)
 
     # Determine point positions for plotting
     def pointpos(x):
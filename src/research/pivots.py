@@ -0,0 +1,123 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Pivot codes, same as the pivotid helpers in the research scripts
+PIVOT_NONE = 0
+PIVOT_LOW = 1
+PIVOT_HIGH = 2
+PIVOT_BOTH = 3
+
+PIVOT_CACHE_SIZE = 256  # Series whose pyramids are kept by pivot_pyramid
+
+
+class PivotPyramid:
+    """
+    Sliding-window highs and lows of one series for any window size. Level j holds the highest
+    high and lowest low of the 2**j bars starting at each bar and is built from level j - 1 in
+    one vectorized step, so the levels up to the largest window asked for cost O(n log w)
+    together. A window of w bars is then the extreme of two overlapping level floor(log2 w)
+    windows. Pivot codes are kept per (n1, n2), so every scale is computed once per series.
+    """
+
+    def __init__(self, high, low):
+        self.high = np.asarray(high, dtype=float)
+        self.low = np.asarray(low, dtype=float)
+        self._highest = [self.high]
+        self._lowest = [self.low]
+        self._pivots = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.high)
+
+    def _levels(self, level):
+        while len(self._highest) <= level:
+            half = 1 << (len(self._highest) - 1)
+            self._highest.append(np.maximum(self._highest[-1][:-half], self._highest[-1][half:]))
+            self._lowest.append(np.minimum(self._lowest[-1][:-half], self._lowest[-1][half:]))
+
+    def window_extremes(self, window):
+        # (highest high, lowest low) of the window bars starting at each bar, n - window + 1 of each
+        level = window.bit_length() - 1
+        self._levels(level)
+        highest = self._highest[level]
+        lowest = self._lowest[level]
+        # NaN propagates like in a max or min over the window
+        shift = window - (1 << level)
+        count = len(self.high) - window + 1
+        return (np.maximum(highest[:count], highest[shift:shift + count]),
+                np.minimum(lowest[:count], lowest[shift:shift + count]))
+
+    def pivots(self, n1, n2=None):
+        """
+        Vectorized pivotid: a candle is a pivot low when its low is the lowest of the n1 candles
+        before and n2 (default n1) candles after it, and a pivot high when its high is the highest.
+        Candles without a full window on both sides are never pivots.
+        Returns a read-only int array of pivot codes, one per candle.
+        """
+        n2 = n1 if n2 is None else n2
+        with self._lock:
+            pivots = self._pivots.get((n1, n2))
+            if pivots is None:
+                n = len(self.high)
+                pivots = np.zeros(n, dtype=np.int8)
+                window = n1 + n2 + 1
+                if n >= window:
+                    centre = slice(n1, n - n2)
+                    highest, lowest = self.window_extremes(window)
+                    pivots[centre] = (lowest == self.low[centre]) * PIVOT_LOW + (highest == self.high[centre]) * PIVOT_HIGH
+                pivots.flags.writeable = False
+                self._pivots[(n1, n2)] = pivots
+            return pivots
+
+
+def find_pivots(high, low, n1, n2):
+    # Pivot codes of one series at one scale, without caching; see PivotPyramid.pivots
+    return PivotPyramid(high, low).pivots(n1, n2)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def series_key(high, low):
+    # Identifies an anonymous series by its contents, so any caller asking for the same bars shares a pyramid
+    digest = hashlib.blake2b(high.tobytes(), digest_size=16)
+    digest.update(low.tobytes())
+    return digest.hexdigest()
+
+
+def pivot_pyramid(high, low, key=None):
+    """
+    The PivotPyramid of a series from a process-wide LRU cache of PIVOT_CACHE_SIZE series.
+    key names the series, e.g. (symbol, country, last bar date), where the caller has them; a
+    pyramid cached under a key is only reused while its bars equal high and low, so bars adjusted
+    since are recomputed. Without a key, a digest of high and low is the key. The series length
+    is part of the key either way.
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    named = key is not None
+    key = (key if named else series_key(high, low), len(high))
+    with _cache_lock:
+        pyramid = _cache.get(key)
+    if pyramid is not None and (not named or (np.array_equal(pyramid.high, high, equal_nan=True)
+                                              and np.array_equal(pyramid.low, low, equal_nan=True))):
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+        return pyramid
+    # Copies, so a caller changing its arrays later cannot change the cached pivots
+    pyramid = PivotPyramid(high.copy(), low.copy())
+    with _cache_lock:
+        if named:
+            _cache[key] = pyramid
+        else:
+            pyramid = _cache.setdefault(key, pyramid)
+        _cache.move_to_end(key)
+        while len(_cache) > PIVOT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return pyramid
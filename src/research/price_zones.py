@@ -0,0 +1,75 @@
+import numpy as np
+
+
+def cluster_price_levels(prices, max_gap=0.05):
+    """
+    Group prices into zones where each price is within max_gap (percentage) of its
+    neighbour in the zone. Works on a sorted copy of the prices in linear time.
+    Returns (low, high, mean, count) arrays, one entry per zone, ordered by price.
+    """
+    prices = np.sort(np.asarray(prices, dtype=float))
+    if len(prices) == 0:
+        empty = np.empty(0)
+        return empty, empty, empty, np.empty(0, dtype=int)
+
+    # In a sorted group the closest member to the next price is always the previous one,
+    # so a new zone starts wherever the relative gap to the previous price exceeds max_gap
+    gaps = np.diff(prices) / prices[:-1]
+    starts = np.concatenate(([0], np.flatnonzero(gaps > max_gap) + 1))
+    ends = np.append(starts[1:], len(prices))
+
+    counts = ends - starts
+    lows = prices[starts]
+    highs = prices[ends - 1]
+    means = np.add.reduceat(prices, starts) / counts
+    return lows, highs, means, counts
+
+
+def zone_shapes(lows, highs, means, counts, x0, x1, line_color, rgb, max_height_pct=0.05):
+    """
+    Build Plotly shape dicts for the zones returned by cluster_price_levels.
+    Single-pivot zones are drawn as a dash-dot line, the rest as a translucent
+    rectangle clipped to max_height_pct of the zone mean.
+    """
+    # Clip tall zones around their midpoint
+    max_heights = means * max_height_pct
+    mids = (lows + highs) / 2
+    too_tall = (highs - lows) > max_heights
+    y0s = np.where(too_tall, mids - max_heights / 2, lows)
+    y1s = np.where(too_tall, mids + max_heights / 2, highs)
+
+    shapes = []
+    for count, mean_price, y0, y1 in zip(counts.tolist(), means.tolist(), y0s.tolist(), y1s.tolist()):
+        if count == 1:
+            # Single pivot point, draw a line instead of a rectangle
+            shapes.append({
+                'type': 'line',
+                'xref': 'x',
+                'yref': 'y',
+                'x0': x0,
+                'y0': mean_price,
+                'x1': x1,
+                'y1': mean_price,
+                'line': {
+                    'color': line_color,
+                    'width': 2,
+                    'dash': 'dashdot',
+                },
+                'layer': 'below',
+            })
+        else:
+            shapes.append({
+                'type': 'rect',
+                'xref': 'x',
+                'yref': 'y',
+                'x0': x0,
+                'y0': y0,
+                'x1': x1,
+                'y1': y1,
+                'line': {
+                    'color': f'rgba({rgb}, 0)',  # transparent line
+                },
+                'fillcolor': f'rgba({rgb}, 0.2)',  # zone color with transparency
+                'layer': 'below',  # draw below traces
+            })
+    return shapes
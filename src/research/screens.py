@@ -0,0 +1,316 @@
+import re
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# A small expression language for stock screens, e.g.
+#   close > sma(50) and sma(50) > sma(150) and close >= 1.3 * low(252)
+# Names are the bar columns on the screening day (open, high, low, close, volume) and rs, the
+# symbol's RS rating. Window functions take a period and an optional lag in bars:
+#   sma(n, lag)   mean of the n closes ending lag bars before the screening day
+#   low(n, lag)   lowest close of those bars, high(n, lag) the highest
+# and a bar column first to use another column, as in sma(volume, 50). Expressions combine
+# + - * /, comparisons, and, or, not and parentheses. A moving average needs all of its bars;
+# a comparison with a missing value is false, so short histories fail such conditions.
+#
+# Screens are parsed once and compiled into a program of vectorized steps over symbol x date
+# matrices. Identical subexpressions, also across screens, become one step, so evaluating
+# several screens together computes each moving average and window extreme once.
+
+BAR_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+SYMBOL_VALUES = ('rs',)  # One value per symbol rather than per bar
+WINDOW_FUNCTIONS = {
+    'sma': lambda windows: windows.mean(axis=-1),
+    # fmin and fmax skip the missing bars before a short history starts
+    'low': lambda windows: np.fmin.reduce(windows, axis=-1),
+    'high': lambda windows: np.fmax.reduce(windows, axis=-1),
+}
+MAX_LOOKBACK = 1260  # Bars a window may reach back, about five years
+
+ARITHMETIC = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+COMPARISONS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+               '==': np.equal, '!=': np.not_equal}
+# a < b is compiled as b > a, so both spellings share a step
+MIRRORED = {'<': '>', '<=': '>='}
+COMMUTATIVE = {'+', '*', '==', '!=', 'and', 'or'}
+BOOLEAN = ('compare', 'and', 'or', 'not')
+
+_TOKEN = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|([A-Za-z_]\w*)|(<=|>=|==|!=|[<>()+\-*/,]))")
+
+
+def tokenize(text):
+    # [(kind, value, position)] with kind 'number', 'name' or 'op', ending with ('end', None, len)
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            rest = text[position:].lstrip()
+            raise ValueError(f"Unexpected character {rest[:1]!r} at {len(text) - len(rest)}")
+        number, name, op = match.groups()
+        if number is not None:
+            tokens.append(('number', float(number), match.start(1)))
+        elif name is not None:
+            tokens.append(('name', name.lower(), match.start(2)))
+        else:
+            tokens.append(('op', op, match.start(3)))
+        position = match.end()
+    tokens.append(('end', None, len(text)))
+    return tokens
+
+
+class _Parser:
+    # Recursive descent, loosest binding first: or, and, not, comparison, + -, * /, unary minus
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def take(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, op):
+        kind, value, position = self.take()
+        if kind != 'op' or value != op:
+            raise ValueError(f"Expected {op!r} at {position}, got {_describe(kind, value)}")
+
+    def at(self, kind, value):
+        token = self.peek()
+        return token[0] == kind and token[1] == value
+
+    def parse(self):
+        node = self.disjunction()
+        kind, value, position = self.peek()
+        if kind != 'end':
+            raise ValueError(f"Unexpected {_describe(kind, value)} at {position}")
+        return node
+
+    def disjunction(self):
+        node = self.conjunction()
+        while self.at('name', 'or'):
+            self.take()
+            node = _logical('or', node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.at('name', 'and'):
+            self.take()
+            node = _logical('and', node, self.negation())
+        return node
+
+    def negation(self):
+        if self.at('name', 'not'):
+            self.take()
+            return ('not', _boolean(self.negation(), 'not'))
+        return self.comparison()
+
+    def comparison(self):
+        node = self.sum()
+        kind, op, position = self.peek()
+        if kind == 'op' and op in COMPARISONS:
+            self.take()
+            node = _compare(op, node, self.sum())
+            kind, op, position = self.peek()
+            if kind == 'op' and op in COMPARISONS:
+                raise ValueError(f"Chained comparison at {position}; join the comparisons with 'and'")
+        return node
+
+    def sum(self):
+        node = self.product()
+        while self.peek()[0] == 'op' and self.peek()[1] in ('+', '-'):
+            node = _arithmetic(self.take()[1], node, self.product())
+        return node
+
+    def product(self):
+        node = self.unary()
+        while self.peek()[0] == 'op' and self.peek()[1] in ('*', '/'):
+            node = _arithmetic(self.take()[1], node, self.unary())
+        return node
+
+    def unary(self):
+        if self.at('op', '-'):
+            self.take()
+            node = _number(self.unary(), 'unary minus')
+            return ('number', -node[1]) if node[0] == 'number' else ('negate', node)
+        return self.primary()
+
+    def primary(self):
+        kind, value, position = self.take()
+        if kind == 'number':
+            return ('number', value)
+        if kind == 'op' and value == '(':
+            node = self.disjunction()
+            self.expect(')')
+            return node
+        if kind == 'name':
+            if self.at('op', '('):
+                return self.call(value, position)
+            if value in BAR_COLUMNS:
+                return ('column', value)
+            if value in SYMBOL_VALUES:
+                return ('value', value)
+            raise ValueError(f"Unknown name {value!r} at {position}")
+        raise ValueError(f"Unexpected {_describe(kind, value)} at {position}")
+
+    def call(self, function, position):
+        if function not in WINDOW_FUNCTIONS:
+            raise ValueError(f"Unknown function {function!r} at {position}")
+        self.expect('(')
+        column = 'close'
+        if self.peek()[0] == 'name' and self.peek()[1] in BAR_COLUMNS and not self.tokens[self.index + 1][1] == '(':
+            column = self.take()[1]
+            self.expect(',')
+        arguments = [self.take()]
+        while self.at('op', ','):
+            self.take()
+            arguments.append(self.take())
+        self.expect(')')
+        if len(arguments) > 2 or any(kind != 'number' or value != int(value) for kind, value, _ in arguments):
+            raise ValueError(f"{function}() at {position} takes a whole number of bars and an optional whole lag")
+        period, lag = [int(value) for _, value, _ in arguments] + [0] * (2 - len(arguments))
+        if period < 1 or period + lag > MAX_LOOKBACK:
+            raise ValueError(f"{function}() at {position} must cover 1 to {MAX_LOOKBACK} bars")
+        return ('window', function, column, period, lag)
+
+
+def _describe(kind, value):
+    return 'end of expression' if kind == 'end' else repr(value)
+
+
+def _is_boolean(node):
+    return node[0] in BOOLEAN
+
+
+def _number(node, context):
+    if _is_boolean(node):
+        raise ValueError(f"{context} needs a number, not a condition")
+    return node
+
+
+def _boolean(node, context):
+    if not _is_boolean(node):
+        raise ValueError(f"'{context}' needs a condition, not a number")
+    return node
+
+
+def _ordered(op, a, b):
+    # Operands of commutative operators in a fixed order, so a + b and b + a are one step
+    return (op, *sorted((a, b), key=repr)) if op in COMMUTATIVE else (op, a, b)
+
+
+def _logical(op, a, b):
+    return (op, *_ordered(op, _boolean(a, op), _boolean(b, op))[1:])
+
+
+def _compare(op, a, b):
+    a, b = _number(a, op), _number(b, op)
+    if op in MIRRORED:
+        op, a, b = MIRRORED[op], b, a
+    return ('compare', *_ordered(op, a, b))
+
+
+def _arithmetic(op, a, b):
+    a, b = _number(a, op), _number(b, op)
+    return ('arithmetic', *_ordered(op, a, b))
+
+
+def parse_screen(text):
+    """
+    Parse a screen into its expression tree of tuples; raises ValueError with the position of
+    the problem. The tree must be a condition, not a number.
+    """
+    node = _Parser(text).parse()
+    if not _is_boolean(node):
+        raise ValueError("A screen must be a condition, e.g. close > sma(50)")
+    return node
+
+
+class ScreenProgram:
+    """
+    Named screens, {name: expression}, compiled into one list of steps; raises ValueError
+    naming the first screen that does not parse. Each distinct subexpression is one step,
+    whose arguments are earlier steps, so shared terms are computed once per evaluation.
+    lookback is the number of bars before and including a screening day the windows need,
+    columns the bar columns and values the per-symbol values the screens read.
+    """
+
+    def __init__(self, screens):
+        self.steps = []
+        self._slots = {}
+        self.outputs = {}
+        for name, text in screens.items():
+            try:
+                tree = parse_screen(text)
+            except ValueError as e:
+                raise ValueError(f"Screen {name!r}: {e}") from None
+            self.outputs[name] = self._emit(tree)
+        windows = [node for node in self._slots if node[0] == 'window']
+        self.lookback = max([period + lag for _, _, _, period, lag in windows] + [1])
+        self.columns = sorted({node[1] for node in self._slots if node[0] == 'column'} | {node[2] for node in windows})
+        self.values = sorted({node[1] for node in self._slots if node[0] == 'value'})
+        del self._slots
+
+    def _emit(self, node):
+        slot = self._slots.get(node)
+        if slot is not None:
+            return slot
+        kind = node[0]
+        if kind in ('arithmetic', 'compare'):
+            step = (kind, node[1], self._emit(node[2]), self._emit(node[3]))
+        elif kind in ('and', 'or'):
+            step = (kind, self._emit(node[1]), self._emit(node[2]))
+        elif kind in ('not', 'negate'):
+            step = (kind, self._emit(node[1]))
+        else:
+            step = node
+        self.steps.append(step)
+        self._slots[node] = len(self.steps) - 1
+        return len(self.steps) - 1
+
+    def evaluate(self, bars, values=None, days=1):
+        """
+        Evaluate every screen for the last days columns of the symbol x date matrices in bars,
+        {column: float matrix}, which must be at least lookback + days - 1 columns wide and hold
+        NaN before a symbol's first bar. values maps each per-symbol value to a vector.
+        Returns {name: bool matrix of symbols x days}.
+        """
+        width = next(iter(bars.values())).shape[1] if bars else self.lookback + days - 1
+        if width < self.lookback + days - 1:
+            raise ValueError(f"Screens need {self.lookback + days - 1} bars, got {width}")
+        results = []
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for step in self.steps:
+                kind = step[0]
+                if kind == 'number':
+                    result = step[1]
+                elif kind == 'column':
+                    result = bars[step[1]][:, width - days:]
+                elif kind == 'value':
+                    result = np.asarray(values[step[1]], dtype=float)[:, None]
+                elif kind == 'window':
+                    _, function, column, period, lag = step
+                    span = bars[column][:, width - days - lag - period + 1:width - lag]
+                    result = WINDOW_FUNCTIONS[function](sliding_window_view(span, period, axis=1))
+                elif kind == 'negate':
+                    result = -results[step[1]]
+                elif kind == 'arithmetic':
+                    result = ARITHMETIC[step[1]](results[step[2]], results[step[3]])
+                elif kind == 'compare':
+                    result = COMPARISONS[step[1]](results[step[2]], results[step[3]])
+                elif kind == 'and':
+                    result = results[step[1]] & results[step[2]]
+                elif kind == 'or':
+                    result = results[step[1]] | results[step[2]]
+                else:
+                    result = ~results[step[1]]
+                results.append(result)
+        rows = len(next(iter(bars.values()))) if bars else len(next(iter(values.values())))
+        return {name: np.broadcast_to(results[slot], (rows, days)) for name, slot in self.outputs.items()}
+
@@ -1,304 +1,92 @@
 import sys
 import os
-import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
-import json
-import plotly.io as pio
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.database.models import StockData
+from src.database import SessionLocal
+from src.database.columnar import fetch_bars_frame
+from src.research.figure_spec import (
+    candlestick_trace, chart_layout, encode_date, hline_annotations, hline_shapes, marker_trace
+)
+from src.research.pivots import pivot_pyramid, PIVOT_NONE, PIVOT_LOW, PIVOT_HIGH
+from src.research.price_zones import cluster_price_levels, zone_shapes
 
-# Replace 'your_database_url' with your actual database URL or ensure DATABASE_URL is set in your environment
-DATABASE_URL = os.environ.get('DATABASE_URL')
+PIVOT_WINDOW = 5
+MAX_GAP = 0.05  # 5%
 
 def detect_and_plot_support_resistance(symbol, country, months=6):
-    # Create database connection
-    engine = create_engine(DATABASE_URL)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    # Calculate the date N months ago from today
-    start_date = datetime.now() - timedelta(days=months * 30)
-
-    # Fetch data from the database for the last N months
-    query = session.query(StockData).filter(
-        StockData.symbol == symbol,
-        StockData.country == country,
-        StockData.date >= start_date
-    ).order_by(StockData.date)
-
-    df = pd.read_sql(query.statement, session.bind)
-
-    # Ensure 'date' is a datetime object
-    df['date'] = pd.to_datetime(df['date'])
-
-    # Optionally, drop duplicates if necessary
-    df = df.drop_duplicates()
-
-    # Ensure there are no missing values
-    df = df.dropna(subset=['open', 'high', 'low', 'close', 'volume'])
-
-    # Detect pivot points
-    def pivotid(df, l, n1, n2):  # n1 and n2 before and after candle l
-        if not isinstance(l, int):
-            raise ValueError("l must be an integer, not a slice")
-
-        if l - n1 < 0 or l + n2 >= len(df):
-            return 0
-
-        pividlow = 1
-        pividhigh = 1
-        for i in range(l - n1, l + n2 + 1):
-            if df['low'].iloc[l] > df['low'].iloc[i]:
-                pividlow = 0
-            if df['high'].iloc[l] < df['high'].iloc[i]:
-                pividhigh = 0
-        if pividlow and pividhigh:
-            return 3
-        elif pividlow:
-            return 1
-        elif pividhigh:
-            return 2
-        else:
-            return 0
-
-    # Keep n1 and n2 at 10 as per your request
-    df['pivot'] = df.apply(lambda x: pivotid(df, df.index.get_loc(x.name), 5, 5), axis=1)
-
-    # Determine point positions for plotting
-    def pointpos(x):
-        if x['pivot'] == 1:
-            return x['low'] - (df['low'].max() * 0.001)
-        elif x['pivot'] == 2:
-            return x['high'] + (df['high'].max() * 0.001)
-        else:
-            return np.nan
-
-    df['pointpos'] = df.apply(lambda row: pointpos(row), axis=1)
-
-    # Extract pivot points
-    pivot_points = df[df['pivot'] > 0].copy()
-
-    # Get the price for each pivot point
-    def get_pivot_price(row):
-        if row['pivot'] == 1:
-            return row['low']
-        elif row['pivot'] == 2:
-            return row['high']
-        else:
-            return np.nan
-
-    pivot_points['price'] = pivot_points.apply(get_pivot_price, axis=1)
-
-    # Function to group pivot points within 5% price range
-    def group_pivot_points(pivot_points, max_gap=0.05):
-        """
-        Group pivot points that are within max_gap (percentage) of each other's price.
-        Returns a list of groups, each group is a DataFrame of pivot points.
-        """
-        # Sort the pivot points by price
-        pivot_points = pivot_points.sort_values(by='price')
-        pivot_points = pivot_points.reset_index(drop=True)
-
-        groups = []
-        current_group = []
-        group_prices = []
-
-        for idx, row in pivot_points.iterrows():
-            price = row['price']
-            if not current_group:
-                current_group.append(row)
-                group_prices.append(price)
-            else:
-                # Compare price with the prices in the current group
-                if any(abs(price - gp) / gp <= max_gap for gp in group_prices):
-                    current_group.append(row)
-                    group_prices.append(price)
-                else:
-                    groups.append(pd.DataFrame(current_group))
-                    current_group = [row]
-                    group_prices = [price]
-
-        # Add the last group
-        if current_group:
-            groups.append(pd.DataFrame(current_group))
-
-        return groups
-
-    max_gap = 0.05  # 5%
-
-    # Separate high pivots and low pivots
-    high_pivots_grouping = pivot_points[pivot_points['pivot'] == 2]
-    low_pivots_grouping = pivot_points[pivot_points['pivot'] == 1]
-
-    # Group the pivot points
-    high_groups = group_pivot_points(high_pivots_grouping, max_gap=max_gap)
-    low_groups = group_pivot_points(low_pivots_grouping, max_gap=max_gap)
-
-    # Prepare shapes for Plotly
-    shapes = []
-
+    df = fetch_price_history(symbol, country, months)
+    levels = compute_support_resistance_levels(df, pair=(symbol, country))
+    return build_support_resistance_figure(symbol, df, levels)
+
+
+def fetch_price_history(symbol, country, months=6, db=None):
+    # Uses the caller's session when given, otherwise a short-lived one on the shared engine
+    session = db if db is not None else SessionLocal()
+    try:
+        # Calculate the date N months ago from today
+        start_date = datetime.now() - timedelta(days=months * 30)
+
+        # Only the chart columns are read, already ordered and without missing values
+        return fetch_bars_frame(session, symbol=symbol, country=country, start_date=start_date)
+    finally:
+        if db is None:
+            session.close()
+
+
+def compute_support_resistance_levels(df, pivot_window=PIVOT_WINDOW, max_gap=MAX_GAP, pair=None):
+    """
+    Find pivot points and cluster them into resistance (pivot highs) and support (pivot lows) zones.
+    Zones are the (low, high, mean, count) arrays from cluster_price_levels. pair, the
+    (symbol, country) of the bars when known, names them in the pivot cache.
+    """
+    high = df['high'].values
+    low = df['low'].values
+    # Shared with the trend line chart, which asks for the same bars
+    key = (*pair, df['date'].values[-1]) if pair is not None and len(df) else None
+    pivots = pivot_pyramid(high, low, key=key).pivots(pivot_window)
+
+    # Pivot price is the low for pivot lows and the high for pivot highs (NaN when it is both)
+    is_pivot = pivots > PIVOT_NONE
+    pivot_price = np.where(pivots == PIVOT_LOW, low, np.where(pivots == PIVOT_HIGH, high, np.nan))[is_pivot]
+    pivot_kind = pivots[is_pivot]
+
+    return {
+        'pivot_dates': df['date'].values[is_pivot],
+        'pivot_prices': pivot_price,
+        'resistance_zones': cluster_price_levels(pivot_price[pivot_kind == PIVOT_HIGH], max_gap=max_gap),
+        'support_zones': cluster_price_levels(pivot_price[pivot_kind == PIVOT_LOW], max_gap=max_gap),
+    }
+
+
+def build_support_resistance_figure(symbol, df, levels):
     # Get the x-axis range
-    dfpl = df.copy()  # Plot all data fetched
-    x0 = dfpl['date'].min()
-    x1 = dfpl['date'].max()
-
-    # For high pivot groups (resistance zones)
-    for group in high_groups:
-        prices = group['price'].values
-        min_price = min(prices)
-        max_price = max(prices)
-        mean_price = np.mean(prices)
-
-        # Ensure height <=5% of mean price
-        height = max_price - min_price
-        max_height = mean_price * 0.05  # 5% of mean price
-
-        if len(group) == 1:
-            # Single pivot point, draw a line instead of a rectangle
-            shape = {
-                'type': 'line',
-                'xref': 'x',
-                'yref': 'y',
-                'x0': x0,
-                'y0': mean_price,
-                'x1': x1,
-                'y1': mean_price,
-                'line': {
-                    'color': 'red',
-                    'width': 2,
-                    'dash': 'dashdot',
-                },
-                'layer': 'below',
-            }
-        else:
-            if height > max_height:
-                # Adjust min_price and max_price to have height of 5%
-                mid_price = (min_price + max_price) / 2
-                min_price = mid_price - max_height / 2
-                max_price = mid_price + max_height / 2
+    dates = df['date'].values
+    x0 = encode_date(dates.min())
+    x1 = encode_date(dates.max())
 
-            # Create the rectangle shape
-            shape = {
-                'type': 'rect',
-                'xref': 'x',
-                'yref': 'y',
-                'x0': x0,
-                'y0': min_price,
-                'x1': x1,
-                'y1': max_price,
-                'line': {
-                    'color': 'rgba(255, 0, 0, 0)',  # transparent line
-                },
-                'fillcolor': 'rgba(255, 0, 0, 0.2)',  # red color with transparency
-                'layer': 'below',  # draw below traces
-            }
-        shapes.append(shape)
+    pivot_prices = levels['pivot_prices']
 
-    # For low pivot groups (support zones)
-    for group in low_groups:
-        prices = group['price'].values
-        min_price = min(prices)
-        max_price = max(prices)
-        mean_price = np.mean(prices)
-
-        # Ensure height <=5% of mean price
-        height = max_price - min_price
-        max_height = mean_price * 0.05  # 5% of mean price
-
-        if len(group) == 1:
-            # Single pivot point, draw a line instead of a rectangle
-            shape = {
-                'type': 'line',
-                'xref': 'x',
-                'yref': 'y',
-                'x0': x0,
-                'y0': mean_price,
-                'x1': x1,
-                'y1': mean_price,
-                'line': {
-                    'color': 'green',
-                    'width': 2,
-                    'dash': 'dashdot',
-                },
-                'layer': 'below',
-            }
-        else:
-            if height > max_height:
-                # Adjust min_price and max_price to have height of 5%
-                mid_price = (min_price + max_price) / 2
-                min_price = mid_price - max_height / 2
-                max_price = mid_price + max_height / 2
-
-            # Create the rectangle shape
-            shape = {
-                'type': 'rect',
-                'xref': 'x',
-                'yref': 'y',
-                'x0': x0,
-                'y0': min_price,
-                'x1': x1,
-                'y1': max_price,
-                'line': {
-                    'color': 'rgba(0, 255, 0, 0)',  # transparent line
-                },
-                'fillcolor': 'rgba(0, 255, 0, 0.2)',  # green color with transparency
-                'layer': 'below',
-            }
-        shapes.append(shape)
-
-    # Plot the data
-    fig = go.Figure(data=[go.Candlestick(
-        x=dfpl['date'],
-        open=dfpl['open'],
-        high=dfpl['high'],
-        low=dfpl['low'],
-        close=dfpl['close'],
-        increasing_line_color='green',
-        decreasing_line_color='red',
-        name='OHLC'
-    )])
-
-    # Add pivot points to the plot
-    fig.add_trace(go.Scatter(
-        x=pivot_points['date'],
-        y=pivot_points['price'],
-        mode='markers',
-        marker=dict(size=5, color='blue'),
-        name='Pivot Points'
-    ))
-
-    # Add horizontal lines at pivot points
-    for idx, row in pivot_points.iterrows():
-        fig.add_hline(y=row['price'], line_dash="dot", line_color="blue",
-                      annotation_text=f"<---", annotation_position="right")
+    # Horizontal lines at pivot points, then resistance and support zones
+    shapes = hline_shapes(pivot_prices)
+    shapes += zone_shapes(*levels['resistance_zones'], x0, x1, line_color='red', rgb='255, 0, 0')
+    shapes += zone_shapes(*levels['support_zones'], x0, x1, line_color='green', rgb='0, 255, 0')
 
     # Get min and max prices for y-axis range
-    y_min = min(dfpl['low'].min(), pivot_points['price'].min())
-    y_max = max(dfpl['high'].max(), pivot_points['price'].max())
-
-    # Update layout with shapes and y-axis range
-    fig.update_layout(
-        title=f'Support and Resistance Zones for {symbol}',
-        xaxis_title='Date',
-        yaxis_title='Price',
-        xaxis_rangeslider_visible=False,
-        xaxis=dict(showgrid=False),
-        yaxis=dict(range=[y_min * 0.95, y_max * 1.05], showgrid=False),
-        paper_bgcolor='white',
-        plot_bgcolor='white',
-        shapes=shapes
-    )
-
-    # Instead of fig.show(), return the JSON data
-    fig_json = json.loads(pio.to_json(fig))
-    return fig_json
-
-# Remove or comment out the following lines:
-# if __name__ == "__main__":
-#     detect_and_plot_support_resistance("BLS", "india")
\ No newline at end of file
+    y_min = np.nanmin(np.concatenate((df['low'].values, pivot_prices)))
+    y_max = np.nanmax(np.concatenate((df['high'].values, pivot_prices)))
+
+    return {
+        'data': [
+            candlestick_trace(dates, df['open'].values, df['high'].values, df['low'].values, df['close'].values),
+            marker_trace(levels['pivot_dates'], pivot_prices, name='Pivot Points'),
+        ],
+        'layout': chart_layout(
+            f'Support and Resistance Zones for {symbol}',
+            y_range=(y_min * 0.95, y_max * 1.05),
+            shapes=shapes,
+            annotations=hline_annotations(pivot_prices, '<---'),
+        ),
+    }
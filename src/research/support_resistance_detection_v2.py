@@ -1,157 +1,128 @@
 import sys
 import os
-import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
-import json
-import plotly.io as pio
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.database.models import StockData
+from src.database import SessionLocal
+from src.database.columnar import fetch_bars_frame
+from src.research.figure_spec import candlestick_trace, chart_layout, encode_date
+
+N1 = 3
+N2 = 2
+MAX_GAP_PERCENT = 0.005  # 0.5%
+
+
+def _rolling_all(flags, window):
+    # out[j] is True when flags[j - window + 1 .. j] are all True
+    if window == 0:
+        return np.ones(len(flags), dtype=bool)
+    counts = np.concatenate(([0], np.cumsum(flags, dtype=np.int64)))
+    out = np.zeros(len(flags), dtype=bool)
+    out[window - 1:] = (counts[window:] - counts[:-window]) == window
+    return out
+
+
+def detect_fractal_levels(low, high, n1, n2):
+    """
+    Find candles whose low closes a run of n1 non-rising bars and opens a run of n2 non-falling
+    bars (support), and candles whose high does the opposite (resistance).
+    Returns the row indexes of the support and resistance candles.
+    """
+    low = np.asarray(low, dtype=float)
+    high = np.asarray(high, dtype=float)
+    rows = np.arange(n1, len(low) - n2)
+    if len(rows) == 0:
+        empty = np.empty(0, dtype=int)
+        return empty, empty
+
+    # Signs of the bar-to-bar steps; step j compares bar j + 1 with bar j.
+    # Only a strict move the wrong way breaks a run, so NaN steps behave like the scalar checks did
+    low_sign = np.sign(np.diff(low))
+    high_sign = np.sign(np.diff(high))
+
+    # For candle l the n1 steps before it end at step l - 1 and the n2 steps after it end at l + n2 - 1
+    before = rows - 1
+    after = rows + n2 - 1
+    is_support = _rolling_all(~(low_sign > 0), n1)[before] & _rolling_all(~(low_sign < 0), n2)[after]
+    is_resistance = _rolling_all(~(high_sign < 0), n1)[before] & _rolling_all(~(high_sign > 0), n2)[after]
+    return rows[is_support], rows[is_resistance]
+
+
+def get_unique_levels(levels, max_gap_percent):
+    """
+    Sort the levels and keep each one that is more than max_gap_percent away from the last kept level.
+    Jumps between kept levels with searchsorted instead of walking every level.
+    """
+    levels = np.sort(np.asarray(levels, dtype=float))
+    n = len(levels)
+    keep = []
+    i = 0
+    while i < n:
+        last_level = levels[i]
+        keep.append(i)
+        # The gap test is monotone on sorted levels, so search near the threshold and then
+        # settle on the exact first level that passes it
+        j = max(int(np.searchsorted(levels, last_level * (1 + max_gap_percent), side='right')), i + 1)
+        while j > i + 1 and abs(levels[j - 1] - last_level) / last_level > max_gap_percent:
+            j -= 1
+        while j < n and not abs(levels[j] - last_level) / last_level > max_gap_percent:
+            j += 1
+        i = j
+    return levels[keep]
 
-# Replace 'your_database_url' with your actual database URL or ensure DATABASE_URL is set in your environment
-DATABASE_URL = os.environ.get('DATABASE_URL')
 
 def detect_and_plot_support_resistance(symbol, country, months=6):
-    # Create database connection
-    engine = create_engine(DATABASE_URL)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    # Calculate the date N months ago from today
-    start_date = datetime.now() - timedelta(days=months * 30)
-
-    # Fetch data from the database for the last N months
-    query = session.query(StockData).filter(
-        StockData.symbol == symbol,
-        StockData.country == country,
-        StockData.date >= start_date
-    ).order_by(StockData.date)
-
-    df = pd.read_sql(query.statement, session.bind)
-
-    # Ensure 'date' is a datetime object
-    df['date'] = pd.to_datetime(df['date'])
-
-    # Optionally, drop duplicates if necessary
-    df = df.drop_duplicates()
-
-    # Ensure there are no missing values
-    df = df.dropna(subset=['open', 'high', 'low', 'close', 'volume'])
-
-    df = df.reset_index(drop=True)  # Reset index to ensure integer indexing
-
-    # Implement support and resistance detection
-
-    def support(df, l, n1, n2):
-        if l - n1 < 0 or l + n2 >= len(df):
-            return 0
-        for i in range(l - n1 + 1, l + 1):
-            if df['low'].iloc[i] > df['low'].iloc[i - 1]:
-                return 0
-        for i in range(l + 1, l + n2 + 1):
-            if df['low'].iloc[i] < df['low'].iloc[i - 1]:
-                return 0
-        return 1
-
-    def resistance(df, l, n1, n2):
-        if l - n1 < 0 or l + n2 >= len(df):
-            return 0
-        for i in range(l - n1 + 1, l + 1):
-            if df['high'].iloc[i] < df['high'].iloc[i - 1]:
-                return 0
-        for i in range(l + 1, l + n2 + 1):
-            if df['high'].iloc[i] > df['high'].iloc[i - 1]:
-                return 0
-        return 1
-
-    sr = []
-    n1 = 3
-    n2 = 2
-    for row in range(n1, len(df) - n2):
-        if support(df, row, n1, n2):
-            sr.append((row, df['low'].iloc[row], 1))
-        if resistance(df, row, n1, n2):
-            sr.append((row, df['high'].iloc[row], 2))
-
-    # Collect support and resistance levels
-    support_levels = pd.DataFrame([(row, price) for row, price, typ in sr if typ == 1], columns=['index', 'price'])
-    resistance_levels = pd.DataFrame([(row, price) for row, price, typ in sr if typ == 2], columns=['index', 'price'])
-
-    # Remove duplicates within a certain percentage
-    max_gap_percent = 0.005  # 0.5%
-
-    def get_unique_levels(levels, max_gap_percent):
-        unique_levels = []
-        levels = sorted(levels)
-        last_level = None
-        for price in levels:
-            if last_level is None:
-                unique_levels.append(price)
-                last_level = price
-            else:
-                if abs(price - last_level) / last_level > max_gap_percent:
-                    unique_levels.append(price)
-                    last_level = price
-        return unique_levels
-
-    unique_support_levels = get_unique_levels(support_levels['price'].tolist(), max_gap_percent)
-    unique_resistance_levels = get_unique_levels(resistance_levels['price'].tolist(), max_gap_percent)
-
-    # Plot the data
-    fig = go.Figure(data=[go.Candlestick(
-        x=df['date'],
-        open=df['open'],
-        high=df['high'],
-        low=df['low'],
-        close=df['close'],
-        increasing_line_color='green',
-        decreasing_line_color='red',
-        name='OHLC'
-    )])
-
-    # Add support levels
-    for level in unique_support_levels:
-        fig.add_shape(type='line',
-            x0=df['date'].min(),
-            y0=level,
-            x1=df['date'].max(),
-            y1=level,
-            line=dict(color='green', width=1, dash='dash'),
-            name='Support Level'
-        )
-
-    # Add resistance levels
-    for level in unique_resistance_levels:
-        fig.add_shape(type='line',
-            x0=df['date'].min(),
-            y0=level,
-            x1=df['date'].max(),
-            y1=level,
-            line=dict(color='red', width=1, dash='dash'),
-            name='Resistance Level'
-        )
-
-    # Update layout
-    fig.update_layout(
-        title=f'Support and Resistance Zones for {symbol}',
-        xaxis_title='Date',
-        yaxis_title='Price',
-        xaxis_rangeslider_visible=False,
-        xaxis=dict(showgrid=False),
-        yaxis=dict(showgrid=False),
-        paper_bgcolor='white',
-        plot_bgcolor='white'
-    )
-
-    # Instead of fig.show(), return the JSON data
-    fig_json = json.loads(pio.to_json(fig))
-    return fig_json
-
-# Remove or comment out the following lines:
-# if __name__ == "__main__":
-#     detect_and_plot_support_resistance("BLS", "india")
\ No newline at end of file
+    df = fetch_price_history(symbol, country, months)
+    levels = compute_support_resistance_levels(df)
+    return build_support_resistance_figure(symbol, df, levels)
+
+
+def fetch_price_history(symbol, country, months=6, db=None):
+    # Uses the caller's session when given, otherwise a short-lived one on the shared engine
+    session = db if db is not None else SessionLocal()
+    try:
+        # Calculate the date N months ago from today
+        start_date = datetime.now() - timedelta(days=months * 30)
+
+        # Only the chart columns are read, already ordered and without missing values
+        return fetch_bars_frame(session, symbol=symbol, country=country, start_date=start_date)
+    finally:
+        if db is None:
+            session.close()
+
+
+def compute_support_resistance_levels(df, n1=N1, n2=N2, max_gap_percent=MAX_GAP_PERCENT, pair=None):
+    # Detect support and resistance levels, then remove duplicates within max_gap_percent.
+    # pair is accepted for the same calls as v1's, which caches pivots by it; v2 caches nothing
+    support_rows, resistance_rows = detect_fractal_levels(df['low'].values, df['high'].values, n1, n2)
+    return {
+        'support_levels': get_unique_levels(df['low'].values[support_rows], max_gap_percent),
+        'resistance_levels': get_unique_levels(df['high'].values[resistance_rows], max_gap_percent),
+    }
+
+
+def build_support_resistance_figure(symbol, df, levels):
+    dates = df['date'].values
+    x0 = encode_date(dates.min())
+    x1 = encode_date(dates.max())
+
+    # Support and resistance lines across the whole date range
+    shapes = [
+        {'line': {'color': 'green', 'dash': 'dash', 'width': 1}, 'name': 'Support Level', 'type': 'line',
+         'x0': x0, 'x1': x1, 'y0': level, 'y1': level}
+        for level in np.asarray(levels['support_levels'], dtype=float).tolist()
+    ]
+    shapes += [
+        {'line': {'color': 'red', 'dash': 'dash', 'width': 1}, 'name': 'Resistance Level', 'type': 'line',
+         'x0': x0, 'x1': x1, 'y0': level, 'y1': level}
+        for level in np.asarray(levels['resistance_levels'], dtype=float).tolist()
+    ]
+
+    return {
+        'data': [
+            candlestick_trace(dates, df['open'].values, df['high'].values, df['low'].values, df['close'].values),
+        ],
+        'layout': chart_layout(f'Support and Resistance Zones for {symbol}', shapes=shapes),
+    }
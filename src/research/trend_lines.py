@@ -0,0 +1,111 @@
+import numpy as np
+
+from src.research.pivots import find_pivots, PIVOT_LOW, PIVOT_HIGH
+
+PIVOT_WINDOW = 5
+MAX_PIVOTS = 20  # Only the most recent pivots are used as anchors
+TOUCH_TOLERANCE = 0.01  # A pivot within 1% of the line counts as a touch
+VIOLATION_TOLERANCE = 0.01  # A close more than 1% through the line counts as a violation
+VIOLATION_PENALTY = 2
+TOP_N_LINES = 3
+
+TREND_LINE_DTYPE = np.dtype([
+    ('start_index', np.int64),
+    ('end_index', np.int64),
+    ('slope', np.float64),
+    ('intercept', np.float64),
+    ('touches', np.int64),
+    ('violations', np.int64),
+    ('score', np.int64),
+    ('value_at_last', np.float64),
+])
+
+
+def fit_trend_lines(pivot_index, pivot_price, close, kind,
+                    touch_tolerance=TOUCH_TOLERANCE,
+                    violation_tolerance=VIOLATION_TOLERANCE,
+                    violation_penalty=VIOLATION_PENALTY,
+                    top_n=TOP_N_LINES):
+    """
+    Evaluate every line through a pair of pivots in one pass.
+    kind is 'resistance' (lines through pivot highs, closes above are violations) or
+    'support' (lines through pivot lows, closes below are violations).
+    Touches are pivots from the first anchor on that sit within touch_tolerance of the line;
+    violations are closes from the first anchor to the last bar beyond violation_tolerance.
+    Returns a structured array of the top_n lines ranked by touches minus penalised violations.
+    """
+    pivot_index = np.asarray(pivot_index, dtype=np.int64)
+    pivot_price = np.asarray(pivot_price, dtype=float)
+    close = np.asarray(close, dtype=float)
+
+    first, second = np.triu_indices(len(pivot_index), k=1)
+    if len(first) == 0:
+        return np.empty(0, dtype=TREND_LINE_DTYPE)
+
+    # Line parameters for every candidate, in price per bar
+    x0 = pivot_index[first]
+    x1 = pivot_index[second]
+    slope = (pivot_price[second] - pivot_price[first]) / (x1 - x0)
+    intercept = pivot_price[first] - slope * x0
+
+    # Touches: candidates x pivots
+    line_at_pivots = slope[:, None] * pivot_index[None, :] + intercept[:, None]
+    near = np.abs(pivot_price[None, :] - line_at_pivots) <= touch_tolerance * np.abs(line_at_pivots)
+    touches = (near & (pivot_index[None, :] >= x0[:, None])).sum(axis=1)
+
+    # Violations: candidates x bars
+    bars = np.arange(len(close))
+    line_at_bars = slope[:, None] * bars[None, :] + intercept[:, None]
+    if kind == 'resistance':
+        through = close[None, :] > line_at_bars * (1 + violation_tolerance)
+    else:
+        through = close[None, :] < line_at_bars * (1 - violation_tolerance)
+    violations = (through & (bars[None, :] >= x0[:, None])).sum(axis=1)
+
+    score = touches - violation_penalty * violations
+
+    # Best score first, ties go to the line with the most recent second anchor, then the longest span
+    order = np.lexsort((x0, -x1, -score))[:top_n]
+
+    lines = np.empty(len(order), dtype=TREND_LINE_DTYPE)
+    lines['start_index'] = x0[order]
+    lines['end_index'] = x1[order]
+    lines['slope'] = slope[order]
+    lines['intercept'] = intercept[order]
+    lines['touches'] = touches[order]
+    lines['violations'] = violations[order]
+    lines['score'] = score[order]
+    lines['value_at_last'] = slope[order] * (len(close) - 1) + intercept[order]
+    return lines
+
+
+def fit_symbol_trend_lines(dates, high, low, close, pivot_window=PIVOT_WINDOW,
+                           max_pivots=MAX_PIVOTS, top_n=TOP_N_LINES):
+    """
+    Fit resistance lines through pivot highs and support lines through pivot lows for one symbol.
+    Returns a list of dicts with the line parameters; slope is in price per trading bar and the
+    anchor dates are included so callers can project the line onto new bars.
+    """
+    dates = np.asarray(dates)
+    pivots = find_pivots(high, low, pivot_window, pivot_window)
+
+    results = []
+    for kind, code, prices in (('resistance', PIVOT_HIGH, high), ('support', PIVOT_LOW, low)):
+        pivot_index = np.flatnonzero(pivots == code)[-max_pivots:]
+        lines = fit_trend_lines(pivot_index, np.asarray(prices, dtype=float)[pivot_index], close, kind, top_n=top_n)
+        for line in lines.tolist():
+            start_index, end_index, slope, intercept, touches, violations, score, value_at_last = line
+            results.append({
+                'kind': kind,
+                'start_date': dates[start_index],
+                'end_date': dates[end_index],
+                'start_index': start_index,
+                'end_index': end_index,
+                'slope': slope,
+                'intercept': intercept,
+                'touches': touches,
+                'violations': violations,
+                'score': score,
+                'value_at_last': value_at_last,
+            })
+    return results
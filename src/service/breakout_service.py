@@ -0,0 +1,140 @@
+# src/service/breakout_service.py
+
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from src.database.models import ResistanceLevel, StockData
+from src.database.adjustments import adjustment_events, cumulative_factors
+from src.database.bar_store import EPOCH_ORDINAL
+from src.database.columnar import fetch_bars, series_bounds
+from src.research.breakout_signals import (
+    evaluate_breakout, LAST_N_RESISTANCE_LEVELS, PIVOT_WINDOW, REQUIRED_MONTHS
+)
+from src.research.pivots import find_pivots, PIVOT_HIGH
+
+# A daily update only reads enough bars for pivots to confirm, with slack for holidays and missed runs
+INDEX_UPDATE_DAYS = 60
+# Levels are kept while they can still be inside the breakout window of a scan
+INDEX_RETENTION_DAYS = REQUIRED_MONTHS * 31 + 31
+
+def update_resistance_index(db: Session, countries: list, rebuild=False):
+    """
+    Add the pivot highs confirmed since the last update to resistance_levels and drop the ones
+    that have aged out of the breakout window. A pivot's status only depends on the PIVOT_WINDOW
+    bars on each side, so a daily update reads the last INDEX_UPDATE_DAYS of bars for the whole
+    universe in one query; the first run, or rebuild=True, reads the full retention window.
+    Pivots are found on adjusted bars but stored at their raw price, so splits and dividends
+    recorded later are applied by scan_breakouts instead of invalidating the index.
+    """
+    today = date.today()
+    if rebuild:
+        db.query(ResistanceLevel).filter(ResistanceLevel.country.in_(countries)).delete(synchronize_session=False)
+    indexed = db.query(ResistanceLevel.id).filter(ResistanceLevel.country.in_(countries)).first() is not None
+    start_date = today - timedelta(days=INDEX_UPDATE_DAYS if indexed else INDEX_RETENTION_DAYS)
+
+    bars = fetch_bars(db, countries=countries, start_date=start_date,
+                      columns=('symbol', 'country', 'date', 'high', 'low'))
+    existing = set(db.query(ResistanceLevel.symbol, ResistanceLevel.country, ResistanceLevel.pivot_date).filter(
+        ResistanceLevel.country.in_(countries),
+        ResistanceLevel.pivot_date >= start_date
+    ).all())
+
+    events = adjustment_events(db)
+
+    rows = []
+    for symbol, country, start, stop in series_bounds(bars):
+        pivots = find_pivots(bars['high'][start:stop], bars['low'][start:stop], PIVOT_WINDOW, PIVOT_WINDOW)
+        raw_high = bars['high'][start:stop]
+        if (symbol, country) in events:
+            raw_high = raw_high / cumulative_factors(events[(symbol, country)], bars['date'][start:stop].view(np.int64))[0]
+        for i in (start + np.flatnonzero(pivots == PIVOT_HIGH)).tolist():
+            pivot_date = bars['date'][i].item()
+            if (symbol, country, pivot_date) in existing:
+                continue
+            rows.append({
+                'symbol': symbol,
+                'country': country,
+                'price': float(raw_high[i - start]),
+                'pivot_date': pivot_date,
+                'confirmed_date': bars['date'][i + PIVOT_WINDOW].item(),
+            })
+
+    db.bulk_insert_mappings(ResistanceLevel, rows)
+    db.query(ResistanceLevel).filter(
+        ResistanceLevel.country.in_(countries),
+        ResistanceLevel.pivot_date < today - timedelta(days=INDEX_RETENTION_DAYS)
+    ).delete(synchronize_session=False)
+    db.commit()
+    print(f"Indexed {len(rows)} new resistance levels")
+
+def scan_breakouts(db: Session, countries: list, scan_date=None):
+    """
+    Symbols whose bar on scan_date (default: the latest bar date) opened below and closed above
+    one of their active resistance levels, with the profit target and stop loss of
+    generate_buy_signal. Active levels are the LAST_N_RESISTANCE_LEVELS most recent indexed pivot
+    highs within REQUIRED_MONTHS of scan_date that were confirmed by then.
+    The level comparison runs over all symbols at once; only the hits go through the target rule.
+    """
+    if scan_date is None:
+        scan_date = db.query(func.max(StockData.date)).filter(StockData.country.in_(countries)).scalar()
+        if scan_date is None:
+            return []
+    window_start = (pd.Timestamp(scan_date) - pd.DateOffset(months=REQUIRED_MONTHS)).date()
+
+    levels = db.query(ResistanceLevel.symbol, ResistanceLevel.country, ResistanceLevel.price, ResistanceLevel.pivot_date).filter(
+        ResistanceLevel.country.in_(countries),
+        ResistanceLevel.pivot_date >= window_start,
+        ResistanceLevel.confirmed_date <= scan_date
+    ).order_by(ResistanceLevel.symbol, ResistanceLevel.country, ResistanceLevel.pivot_date).all()
+    if not levels:
+        return []
+
+    # Rows are ordered by pivot date within each symbol, so row i is among the last N of its
+    # symbol when row i + N belongs to another symbol
+    keys = [(symbol, country) for symbol, country, _, _ in levels]
+    keep = [i for i in range(len(keys)) if i + LAST_N_RESISTANCE_LEVELS >= len(keys) or keys[i + LAST_N_RESISTANCE_LEVELS] != keys[i]]
+    keys = [keys[i] for i in keep]
+    prices = np.array([levels[i][2] for i in keep], dtype=float)
+
+    # Levels are stored at raw prices; bring them to the adjusted scale of the bars
+    events = adjustment_events(db)
+    for j, i in enumerate(keep):
+        if keys[j] in events:
+            pivot_day = levels[i][3].toordinal() - EPOCH_ORDINAL
+            prices[j] *= cumulative_factors(events[keys[j]], np.array([pivot_day]))[0][0]
+
+    bars = fetch_bars(db, countries=countries, start_date=scan_date, end_date=scan_date,
+                      columns=('symbol', 'country', 'open', 'close'))
+    if len(bars['open']) == 0:
+        return []
+    bar_index = {key: i for i, key in enumerate(zip(bars['symbol'].tolist(), bars['country'].tolist()))}
+    row = np.array([bar_index.get(key, -1) for key in keys], dtype=np.int64)
+    has_bar = row >= 0
+    opens = np.where(has_bar, bars['open'][row], np.nan)
+    closes = np.where(has_bar, bars['close'][row], np.nan)
+
+    broken = (opens < prices) & (prices < closes)
+
+    symbol_levels = {}
+    for key, price in zip(keys, prices.tolist()):
+        symbol_levels.setdefault(key, set()).add(price)
+
+    breakouts = []
+    for key in dict.fromkeys(keys[i] for i in np.flatnonzero(broken).tolist()):
+        open_price = float(bars['open'][bar_index[key]])
+        close_price = float(bars['close'][bar_index[key]])
+        resistance_levels = sorted(symbol_levels[key])
+        _, stop_loss, profit_target = evaluate_breakout(resistance_levels, open_price, close_price)
+        breakouts.append({
+            'symbol': key[0],
+            'country': key[1],
+            'date': scan_date,
+            'open': open_price,
+            'close': close_price,
+            'level': max(level for level in resistance_levels if open_price < level < close_price),
+            'stop_loss': float(stop_loss),
+            'profit_target': float(profit_target),
+        })
+    return breakouts
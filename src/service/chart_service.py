@@ -0,0 +1,140 @@
+# src/service/chart_service.py
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import orjson
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from src.database.columnar import fetch_bars, series_bounds, BAR_COLUMNS
+from src.service.levels_service import load_levels_snapshots
+
+# Charts for a whole watchlist in one request: the bars of every symbol are read with one
+# query, the levels come from the nightly snapshot where it covers the bars, and the remaining
+# levels and the figures are computed on a pool of worker processes. Each chart is streamed as
+# one NDJSON line as soon as it is ready.
+
+CHART_METHODS = {
+    'v1': 'src.research.support_resistance_detection',
+    'v2': 'src.research.support_resistance_detection_v2',
+}
+MAX_BATCH_SYMBOLS = 200
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', '0')) or None  # Default: one per CPU
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_chart_pool():
+    # One pool for the API process, started on first use. Workers are spawned rather than forked
+    # because the server process runs threads
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def discard_chart_pool(pool):
+    # A worker that died breaks its pool for good; the next request starts a new one
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_symbol_list(value):
+    # 'AAPL:usa,TCS:india' -> [('AAPL', 'usa'), ('TCS', 'india')], without duplicates
+    pairs = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        symbol, sep, country = item.rpartition(':')
+        if not sep or not symbol or not country:
+            raise ValueError(f"'{item}' is not SYMBOL:country")
+        pairs.append((symbol, country))
+    return list(dict.fromkeys(pairs))
+
+
+def fetch_chart_frames(db: Session, pairs, months):
+    # {(symbol, country): bars DataFrame} for the chart window, as fetch_price_history returns them
+    start_date = datetime.now() - timedelta(days=months * 30)
+    bars = fetch_bars(
+        db,
+        symbols={symbol for symbol, _ in pairs},
+        countries={country for _, country in pairs},
+        start_date=start_date,
+        columns=('symbol', 'country') + BAR_COLUMNS
+    )
+    bars['date'] = bars['date'].astype('datetime64[ns]')
+    wanted = set(pairs)
+    frames = {}
+    for symbol, country, start, stop in series_bounds(bars):
+        if (symbol, country) in wanted:
+            frames[(symbol, country)] = pd.DataFrame({name: bars[name][start:stop] for name in BAR_COLUMNS})
+    return frames
+
+
+def render_chart(job):
+    # Runs in a worker process: compute the levels unless they came from the snapshot and
+    # return the encoded figure
+    import importlib
+    from src.research.figure_spec import to_json_bytes
+    method, symbol, country, df, levels = job
+    module = importlib.import_module(CHART_METHODS[method])
+    if levels is None:
+        levels = module.compute_support_resistance_levels(df, pair=(symbol, country))
+    return to_json_bytes(module.build_support_resistance_figure(symbol, df, levels))
+
+
+def chart_line(symbol, country, figure=None, error=None):
+    head = orjson.dumps({'symbol': symbol, 'country': country})[:-1]
+    if error is not None:
+        return head + b',"error":' + orjson.dumps(error) + b'}\n'
+    # The figure is already encoded, so it is spliced in rather than decoded and encoded again
+    return head + b',"figure":' + figure + b'}\n'
+
+
+def stream_charts(db: Session, pairs, method='v1', months=6, pool=None):
+    """
+    Read the bars and snapshots for pairs, then return an iterator of one NDJSON line per pair,
+    {"symbol", "country", "figure"} or {"symbol", "country", "error"}, in the order the charts
+    finish. The database is only used before this returns, not while the response streams.
+    """
+    frames = fetch_chart_frames(db, pairs, months)
+    snapshots = load_levels_snapshots(db, method, months, frames)
+    return iter_chart_lines(pairs, method, frames, snapshots, pool or get_chart_pool())
+
+
+def iter_chart_lines(pairs, method, frames, snapshots, pool):
+    for symbol, country in pairs:
+        if (symbol, country) not in frames:
+            yield chart_line(symbol, country, error="No price data")
+
+    futures = {}
+    try:
+        for (symbol, country), df in frames.items():
+            futures[pool.submit(render_chart, (method, symbol, country, df, snapshots.get((symbol, country))))] = (symbol, country)
+        for future in as_completed(futures):
+            symbol, country = futures[future]
+            try:
+                yield chart_line(symbol, country, figure=future.result())
+            except BrokenProcessPool:
+                discard_chart_pool(pool)
+                raise
+            except Exception as e:
+                yield chart_line(symbol, country, error=f"Error generating graph: {e}")
+    except BrokenProcessPool:
+        discard_chart_pool(pool)
+        raise
+    finally:
+        # A client that disconnects stops the charts that have not started
+        for future in futures:
+            future.cancel()
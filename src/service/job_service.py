@@ -0,0 +1,268 @@
+# src/service/job_service.py
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from sqlalchemy import case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.database import engine, SessionLocal
+from src.database.models import JobShard
+from src.database.query_stats import track_queries
+from src.database.schema import upgrade_schema
+from src.service.rs_service import run_rs_rating
+from src.service.results_service import start_run, publish_run
+from src.service.screener_service import screening_universe, screen_symbols, write_screening_results
+from src.service.vcp_service import vcp_universe, detect_vcp_symbols, write_vcp_results
+
+# A job splits the screening and VCP stages into shards of symbols recorded in job_shards.
+# Any number of workers, in one process pool or on several hosts sharing the database, run the
+# same job name: each claims pending shards one at a time, writes the shard's results and marks
+# it done in the same transaction. Rerunning a job that was interrupted skips the done shards.
+# A stage's shards write to one result run, which is published once every shard is done.
+
+SHARD_SIZE = 200
+LEASE_SECONDS = 30 * 60  # A running shard not done within this is assumed to belong to a dead worker
+MAX_ATTEMPTS = 3  # Claims of a shard before it is marked failed
+POLL_SECONDS = 5  # Wait between claims while other workers finish the last shards of a stage
+
+
+def process_screening_shard(db: Session, run_id, pairs):
+    write_screening_results(db, run_id, pairs, screen_symbols(db, pairs))
+
+
+def process_vcp_shard(db: Session, run_id, pairs):
+    write_vcp_results(db, run_id, pairs, detect_vcp_symbols(db, pairs))
+
+
+# Stages in run order: name (also the result kind), universe of (symbol, country) pairs and
+# shard writer
+STAGES = [
+    ('screening', screening_universe, process_screening_shard),
+    ('vcp', vcp_universe, process_vcp_shard),
+]
+
+
+def default_job_name(countries):
+    return f"nightly-{date.today()}-{'-'.join(sorted(countries))}"
+
+
+def claim_stage(db: Session, job, stage, worker, lease_seconds=LEASE_SECONDS):
+    """
+    Claim the setup of a stage: rating, starting its result run and creating its shards. The
+    claim is shard 0 inserted with status 'setup' under the unique (job, stage, shard) index, so
+    of several workers starting together exactly one wins. A setup left by a crashed worker is
+    taken over by the same worker name or once its lease has expired.
+    Returns False when the stage is set up or being set up by another worker.
+    """
+    now = datetime.now()
+    try:
+        db.add(JobShard(job=job, stage=stage, shard=0, symbols='[]', status='setup', worker=worker,
+                        claimed_at=now, attempts=1))
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+    taken = db.query(JobShard).filter(
+        JobShard.job == job,
+        JobShard.stage == stage,
+        JobShard.shard == 0,
+        JobShard.status == 'setup',
+        (JobShard.worker == worker) | (JobShard.claimed_at < now - timedelta(seconds=lease_seconds))
+    ).update({'worker': worker, 'claimed_at': now, 'attempts': JobShard.attempts + 1}, synchronize_session=False)
+    db.commit()
+    return taken == 1
+
+
+def create_shards(db: Session, job, stage, run_id, pairs, shard_size=SHARD_SIZE):
+    # Turns the setup claim into shard 0 and adds the other shards in the same commit. A stage
+    # without symbols still gets one empty shard, recording that it ran
+    rows = [
+        {'job': job, 'stage': stage, 'shard': i // shard_size, 'run_id': run_id,
+         'symbols': json.dumps(pairs[i:i + shard_size]), 'status': 'pending', 'attempts': 0}
+        for i in range(0, max(len(pairs), 1), shard_size)
+    ]
+    db.query(JobShard).filter(JobShard.job == job, JobShard.stage == stage, JobShard.shard == 0).update(
+        dict(rows[0], worker=None, claimed_at=None), synchronize_session=False)
+    db.bulk_insert_mappings(JobShard, rows[1:])
+    db.commit()
+    print(f"Created {len(rows)} {stage} shards for job {job}")
+
+
+def ensure_shards(db: Session, job, stage, countries, universe, worker, shard_size=SHARD_SIZE):
+    """
+    Create the shards of a stage unless they exist; only the worker that claims the stage's setup
+    rates the universe and starts the run, the others wait for its shards. On a rerun, shards
+    that failed go back to pending, as do running shards held by this worker name, which were
+    left by a crashed run.
+    """
+    while not claim_stage(db, job, stage, worker):
+        status = db.query(JobShard.status).filter(JobShard.job == job, JobShard.stage == stage, JobShard.shard == 0).scalar()
+        db.rollback()
+        if status != 'setup':
+            break
+        time.sleep(POLL_SECONDS)
+    else:
+        if stage == 'screening':
+            # Screening reads the RS ratings, which are ranked across the whole universe
+            run_rs_rating(db, countries)
+        run_id = start_run(db, stage, countries, job=job)
+        create_shards(db, job, stage, run_id, [list(pair) for pair in universe(db, countries)], shard_size)
+        return
+    db.query(JobShard).filter(JobShard.job == job, JobShard.stage == stage).filter(
+        (JobShard.status == 'failed') | ((JobShard.status == 'running') & (JobShard.worker == worker))
+    ).update({'status': 'pending', 'attempts': 0}, synchronize_session=False)
+    db.commit()
+
+
+def claim_shard(db: Session, job, stage, worker, lease_seconds=LEASE_SECONDS):
+    """
+    Claim the next pending shard of the stage, or a running one whose lease has expired.
+    The claim is a conditional UPDATE on the status and claim time read with the candidate, so
+    of two workers reading the same shard only one updates a row; the other tries the next one.
+    On PostgreSQL the candidate is read FOR UPDATE SKIP LOCKED, so concurrent workers pass over
+    rows being claimed instead of racing for them. Returns None when nothing can be claimed.
+    """
+    while True:
+        now = datetime.now()
+        query = db.query(JobShard.id, JobShard.status, JobShard.claimed_at).filter(
+            JobShard.job == job,
+            JobShard.stage == stage,
+            (JobShard.status == 'pending') | ((JobShard.status == 'running') & (JobShard.claimed_at < now - timedelta(seconds=lease_seconds)))
+        ).order_by(JobShard.shard)
+        if db.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        candidate = query.first()
+        if candidate is None:
+            db.rollback()
+            return None
+
+        claimed_at = JobShard.claimed_at.is_(None) if candidate.claimed_at is None else JobShard.claimed_at == candidate.claimed_at
+        claimed = db.query(JobShard).filter(
+            JobShard.id == candidate.id,
+            JobShard.status == candidate.status,
+            claimed_at
+        ).update({'status': 'running', 'worker': worker, 'claimed_at': now, 'attempts': JobShard.attempts + 1},
+                 synchronize_session=False)
+        db.commit()
+        if claimed == 1:
+            return db.get(JobShard, candidate.id)
+
+
+def complete_shard(db: Session, shard, worker):
+    # Marks the shard done in the transaction holding its results; False if another worker took
+    # over the shard after the lease expired, in which case the caller rolls back
+    done = db.query(JobShard).filter(
+        JobShard.id == shard.id,
+        JobShard.status == 'running',
+        JobShard.worker == worker
+    ).update({'status': 'done', 'completed_at': datetime.now(), 'error': None}, synchronize_session=False)
+    return done == 1
+
+
+def release_shard(db: Session, shard, worker, error):
+    # Returns a shard that raised to pending, or marks it failed after MAX_ATTEMPTS claims
+    db.query(JobShard).filter(
+        JobShard.id == shard.id,
+        JobShard.status == 'running',
+        JobShard.worker == worker
+    ).update({'status': case((JobShard.attempts >= MAX_ATTEMPTS, 'failed'), else_='pending'), 'error': error[:2000]},
+             synchronize_session=False)
+    db.commit()
+
+
+def stage_status(db: Session, job, stage):
+    # {status: shard count}
+    rows = db.query(JobShard.status).filter(JobShard.job == job, JobShard.stage == stage).all()
+    counts = {}
+    for (status,) in rows:
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def run_job(job, countries, shard_size=SHARD_SIZE, worker=None):
+    """
+    Work on a job until every stage is done. Safe to start on several hosts or processes at once
+    and to rerun after a failure. Raises if a stage ends with failed shards.
+    """
+    worker = worker or socket.gethostname()
+    db = SessionLocal()
+    try:
+        for stage, universe, process_shard in STAGES:
+            ensure_shards(db, job, stage, countries, universe, worker, shard_size)
+            while True:
+                shard = claim_shard(db, job, stage, worker)
+                if shard is None:
+                    status = stage_status(db, job, stage)
+                    db.rollback()
+                    if not status.get('pending') and not status.get('running'):
+                        break
+                    # Other workers hold the remaining shards; retry in case one of them dies
+                    time.sleep(POLL_SECONDS)
+                    continue
+
+                pairs = [tuple(pair) for pair in json.loads(shard.symbols)]
+                print(f"{worker}: {stage} shard {shard.shard} ({len(pairs)} symbols, attempt {shard.attempts})")
+                try:
+                    with track_queries(f"{worker}: {stage} shard {shard.shard}"):
+                        process_shard(db, shard.run_id, pairs)
+                    if complete_shard(db, shard, worker):
+                        db.commit()
+                    else:
+                        db.rollback()
+                except Exception as e:
+                    db.rollback()
+                    print(f"{worker}: {stage} shard {shard.shard} failed: {e!r}")
+                    release_shard(db, shard, worker, repr(e))
+
+            status = stage_status(db, job, stage)
+            if status.get('failed'):
+                raise RuntimeError(f"{status['failed']} {stage} shards of job {job} failed; rerun the job to retry them")
+
+            # Every shard is done, so the stage's run can be served. Each worker reaching this
+            # point publishes it again, which changes nothing after the first
+            run_id = db.query(JobShard.run_id).filter(JobShard.job == job, JobShard.stage == stage).first()[0]
+            publish_run(db, stage, run_id, countries)
+        print(f"{worker}: job {job} done")
+    finally:
+        db.close()
+
+
+def init_worker():
+    # Forked workers must not reuse the parent's pooled connections
+    engine.dispose(close=False)
+
+
+def run_job_processes(job, countries, shard_size=SHARD_SIZE, processes=1, worker=None):
+    # Runs the job in several local worker processes, named worker-1, worker-2, ...
+    worker = worker or socket.gethostname()
+    if processes <= 1:
+        run_job(job, countries, shard_size, worker)
+        return
+    engine.dispose()
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker) as executor:
+        futures = [executor.submit(run_job, job, countries, shard_size, f"{worker}-{i + 1}") for i in range(processes)]
+        for future in futures:
+            future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run or join a sharded screening and VCP job")
+    parser.add_argument("--countries", nargs="+", default=["usa"])
+    parser.add_argument("--job", default=None, help="Job name shared by all workers (default: nightly-<date>-<countries>)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes on this host")
+    parser.add_argument("--worker", default=None, help="Worker name (default: host name); reuse it when restarting a crashed worker")
+    args = parser.parse_args()
+    upgrade_schema(engine)
+    run_job_processes(args.job or default_job_name(args.countries), args.countries,
+                      shard_size=args.shard_size, processes=args.processes, worker=args.worker)
@@ -0,0 +1,164 @@
+# src/service/levels_service.py
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
+from src.database.models import SupportResistanceLevel
+from src.database.adjustments import adjustment_events
+from src.database.columnar import fetch_bars, series_bounds, BAR_COLUMNS
+from src.service.results_service import active_pairs
+from src.research import support_resistance_detection as levels_v1
+from src.research import support_resistance_detection_v2 as levels_v2
+
+def run_level_snapshots(db: Session, countries: list, months=6, workers=None):
+    """
+    Precompute v1 pivots/zones and v2 levels for every screened or VCP symbol of the given
+    countries and store them in support_resistance_levels, replacing the previous snapshot.
+    Bars are read with one columnar query; the per-symbol computation runs on a process pool.
+    """
+    # Symbols charted from the dashboard: everything screened or flagged as VCP
+    pairs = set(active_pairs(db, 'screening', countries)) | set(active_pairs(db, 'vcp', countries))
+
+    # Same window as the chart endpoints
+    start_date = datetime.now() - timedelta(days=months * 30)
+
+    jobs = []
+    if pairs:
+        bars = fetch_bars(
+            db,
+            symbols={symbol for symbol, _ in pairs},
+            countries=countries,
+            start_date=start_date,
+            columns=('symbol', 'country') + BAR_COLUMNS
+        )
+        bars['date'] = bars['date'].astype('datetime64[ns]')
+
+        for symbol, country, start, stop in series_bounds(bars):
+            if (symbol, country) not in pairs:
+                continue
+            df = pd.DataFrame({name: bars[name][start:stop] for name in BAR_COLUMNS})
+            jobs.append((symbol, country, months, df))
+
+    rows = []
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for symbol_rows in executor.map(compute_level_rows, jobs, chunksize=16):
+                rows.extend(symbol_rows)
+
+    # Replace the previous snapshot for these countries
+    db.query(SupportResistanceLevel).filter(
+        SupportResistanceLevel.country.in_(countries),
+        SupportResistanceLevel.months == months
+    ).delete(synchronize_session=False)
+    # Every row has every column (see compute_level_rows) and render_nulls keeps the NULL ones,
+    # so the rows of all kinds share one INSERT and go in a single executemany
+    db.bulk_insert_mappings(SupportResistanceLevel, rows, render_nulls=True)
+    db.commit()
+    print(f"Stored {len(rows)} support/resistance levels for {len(jobs)} symbols")
+
+def compute_level_rows(job):
+    # Runs in a worker process: compute both level sets for one symbol and flatten them into rows
+    symbol, country, months, df = job
+    base = {
+        'symbol': symbol,
+        'country': country,
+        'months': months,
+        'first_date': df['date'].iloc[0].date(),
+        'last_date': df['date'].iloc[-1].date(),
+        'computed_date': date.today(),
+        'price': None,
+        'low': None,
+        'high': None,
+        'count': None,
+        'pivot_date': None,
+    }
+    rows = []
+
+    v1 = levels_v1.compute_support_resistance_levels(df, pair=(symbol, country))
+    for pivot_date, price in zip(pd.to_datetime(v1['pivot_dates']), v1['pivot_prices'].tolist()):
+        rows.append(dict(base, method='v1', kind='pivot', price=None if np.isnan(price) else price,
+                         pivot_date=pivot_date.date()))
+    for kind in ('resistance_zone', 'support_zone'):
+        lows, highs, means, counts = v1[kind + 's']
+        for low, high, mean, count in zip(lows.tolist(), highs.tolist(), means.tolist(), counts.tolist()):
+            rows.append(dict(base, method='v1', kind=kind, price=mean, low=low, high=high, count=count))
+
+    v2 = levels_v2.compute_support_resistance_levels(df)
+    for kind in ('support', 'resistance'):
+        for price in v2[kind + '_levels'].tolist():
+            rows.append(dict(base, method='v2', kind=kind, price=price))
+    return rows
+
+def load_levels_snapshot(db: Session, symbol, country, method, months, df):
+    """
+    Return the stored levels for a chart in the same form as compute_support_resistance_levels,
+    or None when there is no snapshot for exactly the bars in df.
+    """
+    if df.empty:
+        return None
+    rows = db.query(SupportResistanceLevel).filter(
+        SupportResistanceLevel.symbol == symbol,
+        SupportResistanceLevel.country == country,
+        SupportResistanceLevel.method == method,
+        SupportResistanceLevel.months == months
+    ).order_by(SupportResistanceLevel.pivot_date, SupportResistanceLevel.price).all()
+    return levels_from_rows(rows, method, df, adjusted_on(db, symbol, country))
+
+def load_levels_snapshots(db: Session, method, months, frames):
+    # load_levels_snapshot for {(symbol, country): df} with one query; returns {(symbol, country): levels or None}
+    frames = {pair: df for pair, df in frames.items() if not df.empty}
+    grouped = {}
+    if frames:
+        rows = db.query(SupportResistanceLevel).filter(
+            SupportResistanceLevel.symbol.in_({symbol for symbol, _ in frames}),
+            SupportResistanceLevel.country.in_({country for _, country in frames}),
+            SupportResistanceLevel.method == method,
+            SupportResistanceLevel.months == months
+        ).order_by(SupportResistanceLevel.pivot_date, SupportResistanceLevel.price).all()
+        for row in rows:
+            grouped.setdefault((row.symbol, row.country), []).append(row)
+    events = adjustment_events(db) if frames else {}
+    return {pair: levels_from_rows(grouped.get(pair, []), method, df, events[pair][3] if pair in events else None)
+            for pair, df in frames.items()}
+
+def adjusted_on(db: Session, symbol, country):
+    # Date the symbol's split and dividend adjustments last changed, or None
+    events = adjustment_events(db).get((symbol, country))
+    return events[3] if events is not None else None
+
+def levels_from_rows(rows, method, df, adjusted=None):
+    if not rows:
+        return None
+
+    # The snapshot is only valid for the same window of bars
+    if rows[0].first_date != df['date'].iloc[0].date() or rows[0].last_date != df['date'].iloc[-1].date():
+        return None
+    # and the same adjustments: prices from before a split recorded since are on the old scale
+    if adjusted is not None and rows[0].computed_date <= adjusted:
+        return None
+
+    if method == 'v2':
+        return {
+            'support_levels': np.array([r.price for r in rows if r.kind == 'support'], dtype=float),
+            'resistance_levels': np.array([r.price for r in rows if r.kind == 'resistance'], dtype=float),
+        }
+
+    pivots = [r for r in rows if r.kind == 'pivot']
+
+    def zones(kind):
+        zone_rows = [r for r in rows if r.kind == kind]
+        return (
+            np.array([r.low for r in zone_rows], dtype=float),
+            np.array([r.high for r in zone_rows], dtype=float),
+            np.array([r.price for r in zone_rows], dtype=float),
+            np.array([r.count for r in zone_rows], dtype=int),
+        )
+
+    return {
+        'pivot_dates': np.array([r.pivot_date for r in pivots], dtype='datetime64[ns]'),
+        'pivot_prices': np.array([np.nan if r.price is None else r.price for r in pivots], dtype=float),
+        'resistance_zones': zones('resistance_zone'),
+        'support_zones': zones('support_zone'),
+    }
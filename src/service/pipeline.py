@@ -0,0 +1,72 @@
+# src/service/pipeline.py
+
+import argparse
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.database import engine, SessionLocal
+from src.database.query_stats import track_queries
+from src.database.schema import upgrade_schema
+from src.service.rs_service import run_rs_rating
+from src.service.breakout_service import update_resistance_index
+from src.service.screener_service import run_screening
+from src.service.vcp_service import run_vcp_detection
+from src.service.vcp_history_service import run_vcp_history
+from src.service.levels_service import run_level_snapshots
+from src.service.trend_line_service import run_trend_line_snapshots
+from src.service.job_service import run_job_processes, SHARD_SIZE
+from src.service.profiling import ProfileRun, PROFILE_DIR
+
+def run_daily_pipeline(countries: list, months=6, workers=None, job=None, shard_size=SHARD_SIZE, processes=1, profile_dir=None):
+    # Create any missing tables and columns, then run the nightly stages in order. With a job name, RS rating,
+    # screening and VCP detection run as a sharded job that other hosts can join and that resumes
+    # where it stopped when rerun. With profile_dir, every stage is profiled into a new run
+    # directory under it (see profiling.py)
+    upgrade_schema(engine)
+    profile = ProfileRun(profile_dir, label=','.join(countries)) if profile_dir else None
+    # Each stage prints its statement count and database time, and any statement it repeated
+    # often enough to look like a per-symbol query. Stages that run in worker processes only
+    # count and profile the work of this process
+    stage = profile.stage if profile else track_queries
+    db = SessionLocal()
+    try:
+        if job:
+            with stage('resistance index'):
+                update_resistance_index(db, countries)
+            with stage('job'):
+                run_job_processes(job, countries, shard_size=shard_size, processes=processes)
+        else:
+            with stage('RS rating'):
+                run_rs_rating(db, countries)
+            with stage('resistance index'):
+                update_resistance_index(db, countries)
+            with stage('screening'):
+                run_screening(db, countries)
+            with stage('VCP detection'):
+                run_vcp_detection(db, countries)
+        with stage('VCP history'):
+            run_vcp_history(db, countries)
+        with stage('level snapshots'):
+            run_level_snapshots(db, countries, months=months, workers=workers)
+        with stage('trend lines'):
+            run_trend_line_snapshots(db, countries)
+    finally:
+        db.close()
+        if profile:
+            profile.write()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the nightly RS rating, resistance index, screening, VCP, VCP history, support/resistance and trend line stages")
+    parser.add_argument("--countries", nargs="+", default=["usa"])
+    parser.add_argument("--months", type=int, default=6, help="Chart window for the support/resistance snapshots")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for the support/resistance stage")
+    parser.add_argument("--job", default=None, help="Run screening and VCP as this sharded job (see job_service)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Symbols per shard in job mode")
+    parser.add_argument("--processes", type=int, default=1, help="Local worker processes in job mode")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_DIR, default=os.environ.get('PIPELINE_PROFILE') or None,
+                        metavar="DIR", help=f"Write CPU and memory profiles of each stage under DIR (default {PROFILE_DIR}; also PIPELINE_PROFILE)")
+    args = parser.parse_args()
+    run_daily_pipeline(args.countries, months=args.months, workers=args.workers,
+                       job=args.job, shard_size=args.shard_size, processes=args.processes, profile_dir=args.profile)
@@ -0,0 +1,164 @@
+# src/service/profiling.py
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Profile-run mode of the nightly pipeline. Each stage runs under cProfile and tracemalloc; its
+# profile is written as <n>-<stage>.pstats in the run's directory, and summary.json records per
+# stage the wall and CPU time, SQL statements, peak traced and resident memory, the slowest
+# functions and the lines whose live allocations grew the most. Two summaries are compared with
+#   python src/service/profiling.py profiles/<old run>/summary.json profiles/<new run>/summary.json
+# tracemalloc slows the stages down, so absolute times are only comparable between profile runs.
+
+PROFILE_DIR = 'profiles'
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 25
+
+
+def peak_rss_mb():
+    # Peak resident memory of the process so far; ru_maxrss is in kilobytes on Linux, bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def top_functions(profile, limit=TOP_FUNCTIONS):
+    # Functions with the most cumulative time: [{function, calls, tottime, cumtime}]
+    stats = pstats.Stats(profile)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {'function': f"{filename}:{line}({name})", 'calls': calls, 'tottime': round(tottime, 4), 'cumtime': round(cumtime, 4)}
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+    ]
+
+
+def top_allocations(before, after, limit=TOP_ALLOCATIONS):
+    # Source lines whose allocations still alive grew the most between the snapshots:
+    # [{line, size_mb, count}], where count is the change in live blocks
+    ignore = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    )
+    diffs = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    return [
+        {'line': f"{diff.traceback[0].filename}:{diff.traceback[0].lineno}",
+         'size_mb': round(diff.size_diff / (1024 * 1024), 3), 'count': diff.count_diff}
+        for diff in diffs[:limit]
+    ]
+
+
+class ProfileRun:
+    """
+    Collects the profiles of one pipeline run in directory/<timestamp>. Use stage(name) around
+    each stage and write() at the end.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, label=None):
+        self.started_at = datetime.now()
+        self.directory = os.path.join(directory, self.started_at.strftime('%Y%m%d-%H%M%S'))
+        self.label = label
+        self.stages = []
+        os.makedirs(self.directory, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name):
+        # Also counts the stage's SQL statements, as the pipeline does outside profile runs. Imported
+        # here so comparing summaries does not need a database
+        from src.database.query_stats import track_queries
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profile = cProfile.Profile()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            with track_queries(name) as queries:
+                profile.enable()
+                try:
+                    yield
+                finally:
+                    profile.disable()
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            after = tracemalloc.take_snapshot()
+            _, peak_traced = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+
+            filename = f"{len(self.stages) + 1:02d}-{re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')}.pstats"
+            profile.dump_stats(os.path.join(self.directory, filename))
+            self.stages.append({
+                'stage': name,
+                'pstats': filename,
+                'wall_seconds': round(wall, 3),
+                'cpu_seconds': round(cpu, 3),
+                'queries': queries.count,
+                'db_seconds': round(queries.seconds, 3),
+                'peak_traced_mb': round(peak_traced / (1024 * 1024), 3),
+                'peak_rss_mb': round(peak_rss_mb(), 1) if resource is not None else None,
+                'top_functions': top_functions(profile),
+                'top_allocations': top_allocations(before, after),
+            })
+            print(f"Profiled {name}: {wall:.2f} s wall, {cpu:.2f} s CPU, peak traced {peak_traced / (1024 * 1024):.1f} MB")
+
+    def write(self):
+        path = os.path.join(self.directory, 'summary.json')
+        with open(path, 'w') as f:
+            json.dump({
+                'label': self.label,
+                'started_at': self.started_at.isoformat(),
+                'argv': sys.argv,
+                'stages': self.stages,
+            }, f, indent=2)
+        print(f"Profile written to {path}")
+        return path
+
+
+def compare_profiles(old_path, new_path):
+    # Prints the change of each stage's numbers between two summary.json files
+    with open(old_path) as f:
+        old = {stage['stage']: stage for stage in json.load(f)['stages']}
+    with open(new_path) as f:
+        new = {stage['stage']: stage for stage in json.load(f)['stages']}
+    metrics = ('wall_seconds', 'cpu_seconds', 'queries', 'db_seconds', 'peak_traced_mb', 'peak_rss_mb')
+    print(f"{'stage':<20} " + " ".join(f"{metric:>22}" for metric in metrics))
+    for name in list(old) + [name for name in new if name not in old]:
+        cells = []
+        for metric in metrics:
+            a = old.get(name, {}).get(metric)
+            b = new.get(name, {}).get(metric)
+            cells.append(f"{_format(a)} -> {_format(b)}".rjust(22))
+        print(f"{name:<20} " + " ".join(cells))
+
+
+def _format(value):
+    return '-' if value is None else f"{value:g}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two pipeline profile summaries")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+    compare_profiles(args.old, args.new)
@@ -0,0 +1,123 @@
+# src/service/results_service.py
+
+import hashlib
+import threading
+from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from src.database.models import ScreenedStock, VCPStock, ResultRun, ActiveResult
+
+# Screening and VCP results are versioned. Every run writes its rows under a new run id, which
+# readers ignore until publish_run points the run's countries at it in one commit. Readers
+# therefore see either the previous complete result set or the new one, never a run in progress.
+
+PUBLISH_ATTEMPTS = 3  # Flips tried when concurrent first publishes race for the pointer rows
+
+RESULT_MODELS = {
+    'screening': ScreenedStock,
+    'vcp': VCPStock,
+}
+
+def start_run(db: Session, kind, countries, job=None):
+    run = ResultRun(kind=kind, countries=','.join(sorted(countries)), job=job, started_at=datetime.now())
+    db.add(run)
+    db.commit()
+    return run.id
+
+def active_runs(db: Session, kind):
+    # {country: run_id} of the published results of kind
+    return {
+        country: run_id
+        for country, run_id in db.query(ActiveResult.country, ActiveResult.run_id).filter(ActiveResult.kind == kind).all()
+    }
+
+def active_filter(model, active):
+    # Rows of each country's active run. Countries that were never published keep serving the
+    # rows written before versioning, which have no run id
+    legacy = model.run_id.is_(None)
+    if active:
+        legacy = and_(legacy, model.country.notin_(list(active)))
+    return or_(legacy, *[and_(model.country == country, model.run_id == run_id) for country, run_id in active.items()])
+
+def active_pairs(db: Session, kind, countries):
+    # Sorted (symbol, country) pairs of the published results of kind in countries
+    model = RESULT_MODELS[kind]
+    pairs = db.query(model.symbol, model.country).filter(
+        model.country.in_(countries),
+        active_filter(model, active_runs(db, kind))
+    ).all()
+    return sorted(set((symbol, country) for symbol, country in pairs))
+
+def publish_run(db: Session, kind, run_id, countries):
+    """
+    Make run_id the served version of kind for countries, unless one of them already serves
+    this or a newer run. The flip is one commit; afterwards rows older than the previous
+    version are deleted, keeping the previous one for readers that looked up the old run id.
+    """
+    model = RESULT_MODELS[kind]
+    for attempt in range(PUBLISH_ATTEMPTS):
+        now = datetime.now()
+        pointers = {
+            pointer.country: pointer
+            for pointer in db.query(ActiveResult).filter(
+                ActiveResult.kind == kind,
+                ActiveResult.country.in_(countries)
+            ).with_for_update().all()
+        }
+        published = {}
+        for country in countries:
+            pointer = pointers.get(country)
+            if pointer is None:
+                db.add(ActiveResult(kind=kind, country=country, run_id=run_id, published_at=now))
+                published[country] = None
+            elif pointer.run_id < run_id:
+                published[country] = pointer.run_id
+                pointer.previous_run_id = pointer.run_id
+                pointer.run_id = run_id
+                pointer.published_at = now
+        try:
+            db.query(ResultRun).filter(ResultRun.id == run_id).update({'published_at': now}, synchronize_session=False)
+            db.commit()
+            break
+        except IntegrityError:
+            # A first publish has no pointer row to lock, so a concurrent publisher can create it
+            # first. Its row exists now: lock it and compare the run ids again
+            db.rollback()
+            if attempt == PUBLISH_ATTEMPTS - 1:
+                raise
+
+    for country, previous_run_id in published.items():
+        # Runs newer than run_id may still be building, so only older rows go
+        oldest_kept = previous_run_id if previous_run_id is not None else run_id
+        db.query(model).filter(
+            model.country == country,
+            or_(model.run_id.is_(None), model.run_id < oldest_kept)
+        ).delete(synchronize_session=False)
+    db.commit()
+    if published:
+        print(f"Published {kind} run {run_id} for {', '.join(sorted(published))}")
+
+# In-process cache of the served result lists, one entry per kind. A request costs one query on
+# active_results; the result rows are only read again when a run was published.
+_cache = {}
+_cache_lock = threading.Lock()
+
+def cached_results(db: Session, kind, build):
+    """
+    (version, payload) for the published results of kind, where payload is build(db, active)
+    and version identifies the active runs. build is only called when the version changed.
+    """
+    active = active_runs(db, kind)
+    version = tuple(sorted(active.items()))
+    cached = _cache.get(kind)
+    if cached is not None and cached[0] == version:
+        return cached
+    payload = build(db, active)
+    with _cache_lock:
+        _cache[kind] = (version, payload)
+    return version, payload
+
+def version_etag(kind, version):
+    # Quoted entity tag for a cached_results version
+    return '"%s-%s"' % (kind, hashlib.sha1(repr(version).encode()).hexdigest()[:16])
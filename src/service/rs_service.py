@@ -0,0 +1,85 @@
+# src/service/rs_service.py
+
+import numpy as np
+from datetime import date, timedelta
+from sqlalchemy.orm import Session
+from src.database.models import RSRating
+from src.database.columnar import fetch_bars, series_bounds
+
+# 3, 6, 9 and 12 month horizons in trading days, with the most recent quarter weighted double
+RS_HORIZONS = np.array([63, 126, 189, 252])
+RS_WEIGHTS = np.array([0.4, 0.2, 0.2, 0.2])
+
+def run_rs_rating(db: Session, countries: list):
+    """
+    Rate every symbol of the given countries by weighted 3/6/9/12-month return and rank the
+    ratings to 1-99 percentiles within each country. Replaces the stored ratings for those
+    countries and returns {(symbol, country): rating}.
+    """
+    # Enough calendar days to cover 252 trading days plus holidays
+    start_date = date.today() - timedelta(days=400)
+    bars = fetch_bars(db, countries=countries, start_date=start_date, columns=('symbol', 'country', 'close'))
+
+    ratings = {}
+    score_by_key = {}
+    if len(bars['close']):
+        closes = bars['close']
+
+        # Row offsets of each (symbol, country) run
+        bounds = series_bounds(bars)
+        keys = [(symbol, country) for symbol, country, _, _ in bounds]
+        starts = np.array([start for _, _, start, _ in bounds])
+        ends = np.array([stop for _, _, _, stop in bounds]) - 1
+
+        scores = weighted_returns(closes, starts, ends)
+        rated = ~np.isnan(scores)
+        group_keys = [key for key, keep in zip(keys, rated.tolist()) if keep]
+        ranks = percentile_ranks(scores[rated], [country for _, country in group_keys])
+        ratings = {key: int(rank) for key, rank in zip(group_keys, ranks)}
+        score_by_key = dict(zip(group_keys, scores[rated].tolist()))
+
+    # Replace the stored ratings for these countries
+    db.query(RSRating).filter(RSRating.country.in_(countries)).delete(synchronize_session=False)
+    today = date.today()
+    db.bulk_insert_mappings(RSRating, [
+        {'symbol': symbol, 'country': country, 'rs_rating': rating,
+         'weighted_return': score_by_key[(symbol, country)], 'computed_date': today}
+        for (symbol, country), rating in ratings.items()
+    ])
+    db.commit()
+    return ratings
+
+def weighted_returns(closes, starts, ends):
+    # Return over each horizon for every symbol at once; horizons longer than a symbol's
+    # history are left out and the remaining weights renormalised
+    lookback = ends[:, None] - RS_HORIZONS[None, :]
+    available = lookback >= starts[:, None]
+    past = closes[np.where(available, lookback, ends[:, None])]
+    returns = np.where(available & (past > 0), closes[ends][:, None] / past - 1, np.nan)
+
+    weights = np.where(np.isnan(returns), 0.0, RS_WEIGHTS[None, :])
+    weight_sum = weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(weight_sum > 0, np.nansum(returns * weights, axis=1) / weight_sum, np.nan)
+
+def percentile_ranks(scores, countries):
+    # Single sort by (country, score); position within each country's block gives the percentile,
+    # the lowest position of a run of tied scores for all of them
+    country_names, country_codes = np.unique(np.asarray(countries), return_inverse=True)
+    order = np.lexsort((scores, country_codes))
+    group_sizes = np.bincount(country_codes, minlength=len(country_names))
+    group_starts = np.concatenate(([0], np.cumsum(group_sizes)[:-1]))
+
+    sorted_codes = country_codes[order]
+    sorted_scores = scores[order]
+    # Tied scores share the position of the first of them, so equal returns get equal ratings
+    tie_start = np.ones(len(order), dtype=bool)
+    tie_start[1:] = (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_scores[1:] != sorted_scores[:-1])
+    first = np.maximum.accumulate(np.where(tie_start, np.arange(len(order)), 0))
+    position = first - group_starts[sorted_codes]
+    denominator = np.maximum(group_sizes[sorted_codes] - 1, 1)
+    sorted_ranks = np.where(group_sizes[sorted_codes] > 1, 1 + (98 * position) // denominator, 99)
+
+    ranks = np.empty(len(order), dtype=int)
+    ranks[order] = sorted_ranks
+    return ranks
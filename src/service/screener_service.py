@@ -1,82 +1,137 @@
 # src/service/screener_service.py
 
 import numpy as np
+from datetime import date, timedelta
+from functools import lru_cache
 from sqlalchemy.orm import Session
-from src.database.models import StockData, ScreenedStock
-
-def run_screening(db: Session, countries: list):
-    # Get a list of all symbols for the specified countries
-    symbols = db.query(StockData.symbol).filter(StockData.country.in_(countries)).distinct().all()
-    symbols = [s[0] for s in symbols]
-
-    # Keep track of symbols that meet the criteria
-    symbols_meeting_criteria = set()
-
-    for symbol in symbols:
-        print("Screening for Symbol " + symbol)
-        stock_entries = db.query(StockData).filter(StockData.symbol == symbol).order_by(StockData.date).all()
-        if len(stock_entries) < 50:
-            # Not enough data even for 50-day moving average
-            continue
-
-        # Prepare data
-        closes = [entry.close for entry in stock_entries]
-        current_price = closes[-1]
-
-        # Calculate moving averages
-        ma_50 = np.mean(closes[-50:]) if len(closes) >= 50 else None
-        ma_150 = np.mean(closes[-150:]) if len(closes) >= 150 else None
-        ma_200 = np.mean(closes[-200:]) if len(closes) >= 200 else None
-
-        # Calculate 52-week high and low
-        last_252_closes = closes[-252:] if len(closes) >= 252 else closes
-        low_52week = min(last_252_closes) if last_252_closes else None
-        high_52week = max(last_252_closes) if last_252_closes else None
-
-        # Screening criteria checks
-        criteria_passed = True
-
-        # Check if moving averages exist
-        if ma_50 is None or ma_150 is None or ma_200 is None:
-            continue  # Not enough data for high precision
-
-        # Criteria 1: Price above its 50-day, 150-day, and 200-day moving averages
-        if current_price < ma_50 or current_price < ma_150 or current_price < ma_200:
-            criteria_passed = False
-
-        # Criteria 2: 50-day MA above 150-day MA
-        if ma_50 < ma_150:
-            criteria_passed = False
-
-        # Criteria 3: 150-day MA above 200-day MA
-        if ma_150 < ma_200:
-            criteria_passed = False
-
-        # Criteria 5: Price at least 30% above its 52-week low
-        if low_52week and current_price < 1.3 * low_52week:
-            criteria_passed = False
-
-        # Criteria 6: Price within 25% of its 52-week high
-        if high_52week and current_price < 0.75 * high_52week:
-            criteria_passed = False
-
-        if criteria_passed:
-            symbols_meeting_criteria.add(symbol)
-
-            # Check if the stock is already in screened_stocks
-            exists = db.query(ScreenedStock).filter(ScreenedStock.symbol == symbol).first()
-            if not exists:
-                # Add new screened stock
-                country = stock_entries[0].country if stock_entries[0].country else 'unknown'
-                screened_stock = ScreenedStock(symbol=symbol, country=country)
-                db.add(screened_stock)
-
-    db.commit()
-
-    # Remove stocks that no longer meet the criteria for the specified countries
-    existing_screened_stocks = db.query(ScreenedStock).filter(ScreenedStock.country.in_(countries)).all()
-    for stock in existing_screened_stocks:
-        if stock.symbol not in symbols_meeting_criteria:
+from src.database.models import StockData, ScreenedStock, RSRating
+from src.database.columnar import fetch_bars, series_bounds
+from src.research.screens import ScreenProgram
+from src.service.results_service import start_run, publish_run
+
+MIN_RS_RATING = 70
+MA_200_TREND_DAYS = 22  # About one month of trading days
+SCREENING_BATCH_SIZE = 200  # Symbols whose closes are read in one query
+SCREEN_CALENDAR_SLACK_DAYS = 30  # Holidays on top of five trading days a week when reading bars for screens
+
+# Screens in the language of src/research/screens.py. trend_template is the published screen:
+#  1. price above its 50-, 150- and 200-day moving averages
+#  2. 50-day MA above the 150-day MA, and 3. the 150-day MA above the 200-day MA
+#  4. 200-day MA trending up for at least a month
+#  5. price at least 30% above its 52-week low, and 6. within 25% of its 52-week high
+#  7. relative strength rating within its country of at least MIN_RS_RATING
+TREND_TEMPLATE = (
+    "close >= sma(50) and close >= sma(150) and close >= sma(200)"
+    " and sma(50) >= sma(150) and sma(150) >= sma(200)"
+    f" and sma(200) > sma(200, {MA_200_TREND_DAYS})"
+    " and close >= 1.3 * low(252) and close >= 0.75 * high(252)"
+    f" and rs >= {MIN_RS_RATING}"
+)
+SCREENS = {
+    'trend_template': TREND_TEMPLATE,
+    # Leaders within 5% of their 52-week high
+    'near_high': "close >= 0.95 * high(252) and close > sma(50) and rs >= 80",
+    # Uptrends pulled back to within 3% of their 50-day MA on drying volume
+    'pullback_to_50': (
+        "sma(50) > sma(200) and close > sma(200) and close <= 1.03 * sma(50) and close >= 0.97 * sma(50)"
+        " and sma(volume, 10) < sma(volume, 50)"
+    ),
+}
+TREND_TEMPLATE_PROGRAM = ScreenProgram({'trend_template': TREND_TEMPLATE})
+
+@lru_cache(maxsize=64)
+def screen_program(screens):
+    # ScreenProgram of a tuple of (name, expression) pairs, compiled once per distinct tuple
+    return ScreenProgram(dict(screens))
+
+def screening_universe(db: Session, countries: list):
+    # Every (symbol, country) with price data in the specified countries
+    pairs = db.query(StockData.symbol, StockData.country).filter(StockData.country.in_(countries)).distinct().all()
+    return sorted((symbol, country) for symbol, country in pairs)
+
+def screen_matrices(bars, bounds, columns, width):
+    # Right-aligned symbol x date matrices of the last width bars of each series, NaN before a
+    # symbol's first bar, so column -1 is every symbol's latest bar
+    matrices = {column: np.full((len(bounds), width), np.nan) for column in columns}
+    for row, (_, _, start, stop) in enumerate(bounds):
+        start = max(start, stop - width)
+        for column in columns:
+            matrices[column][row, width - (stop - start):] = bars[column][start:stop]
+    return matrices
+
+def evaluate_screens(db: Session, program: ScreenProgram, pairs=None, countries=None):
+    """
+    {name: set of (symbol, country)} of the program's screens on each symbol's latest bar, for
+    pairs or for every symbol of countries. Only the bars the screens reach back to are read, in
+    one columnar query, and every screen is evaluated for all symbols at once.
+    """
+    if pairs is not None:
+        pairs = set(pairs)
+        symbols = {symbol for symbol, _ in pairs}
+        countries = {country for _, country in pairs}
+    else:
+        symbols = None
+    results = {name: set() for name in program.outputs}
+    if not countries or (pairs is not None and not pairs):
+        return results
+
+    columns = program.columns or ['close']
+    start_date = date.today() - timedelta(days=program.lookback * 7 // 5 + SCREEN_CALENDAR_SLACK_DAYS)
+    bars = fetch_bars(db, symbols=symbols, countries=countries, start_date=start_date,
+                      columns=('symbol', 'country') + tuple(columns))
+    bounds = [bound for bound in series_bounds(bars) if pairs is None or bound[:2] in pairs]
+    if not bounds:
+        return results
+    keys = [(symbol, country) for symbol, country, _, _ in bounds]
+
+    values = {}
+    if 'rs' in program.values:
+        # Relative strength is ranked across the whole universe by run_rs_rating beforehand;
+        # unrated symbols count as 0
+        query = db.query(RSRating.symbol, RSRating.country, RSRating.rs_rating).filter(RSRating.country.in_(countries))
+        if symbols is not None:
+            query = query.filter(RSRating.symbol.in_(symbols))
+        rs_ratings = {(symbol, country): rating for symbol, country, rating in query.all()}
+        values['rs'] = [rs_ratings.get(key, 0) for key in keys]
+
+    passed = program.evaluate(screen_matrices(bars, bounds, columns, program.lookback), values)
+    for name, matches in passed.items():
+        results[name] = {keys[i] for i in np.flatnonzero(matches[:, -1]).tolist()}
+    return results
+
+def screen_symbols(db: Session, pairs: list):
+    """
+    The (symbol, country) pairs among pairs that pass the trend template.
+    Closes for all of them are read in one columnar query, so pairs should be a bounded
+    subset of the universe (a shard) rather than all of it.
+    """
+    passed = evaluate_screens(db, TREND_TEMPLATE_PROGRAM, pairs=pairs)['trend_template']
+    print(f"Screened {len(set(pairs))} symbols, {len(passed)} passed")
+    return passed
+
+def write_screening_results(db: Session, run_id, pairs: list, passed: set):
+    # Write the screened_stocks rows of pairs for run run_id; writing the same pairs again
+    # replaces them. Does not commit, so a job can commit the rows together with its shard checkpoint
+    pairs = set(pairs)
+    for stock in db.query(ScreenedStock).filter(
+        ScreenedStock.run_id == run_id,
+        ScreenedStock.symbol.in_({symbol for symbol, _ in pairs}),
+        ScreenedStock.country.in_({country for _, country in pairs})
+    ).all():
+        if (stock.symbol, stock.country) in pairs:
             db.delete(stock)
-
-    db.commit()
+    # One executemany; adding ORM objects would insert them one by one to fetch their ids
+    db.bulk_insert_mappings(ScreenedStock, [
+        {'symbol': symbol, 'country': country, 'run_id': run_id} for symbol, country in sorted(passed)
+    ])
+
+def run_screening(db: Session, countries: list, batch_size=SCREENING_BATCH_SIZE):
+    # Screen the universe in batches so only batch_size symbols of closes are in memory at once.
+    # The results are written as a new run and served once it is published
+    run_id = start_run(db, 'screening', countries)
+    universe = screening_universe(db, countries)
+    for i in range(0, len(universe), batch_size):
+        pairs = universe[i:i + batch_size]
+        write_screening_results(db, run_id, pairs, screen_symbols(db, pairs))
+        db.commit()
+    publish_run(db, 'screening', run_id, countries)
@@ -0,0 +1,372 @@
+# src/service/stream_service.py
+
+import argparse
+import asyncio
+import json
+import traceback
+from collections import deque
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from src.database.bar_store import EPOCH_ORDINAL
+from src.database.columnar import fetch_bars, series_bounds
+from src.research.breakout_signals import (
+    evaluate_breakout, LAST_N_RESISTANCE_LEVELS, PIVOT_WINDOW, REQUIRED_MONTHS
+)
+from src.research.pivots import find_pivots, PIVOT_HIGH
+from src.service.stream_sources import open_source
+
+# Same price rule as analyze_vcp. The nightly run_vcp_detection also checks volume and the
+# base's pullbacks, which a partial day cannot settle
+VCP_MIN_BARS = 100
+VCP_LOOKBACK_DAYS = 14
+VCP_CONTRACTION_THRESHOLD = 0.08
+SMA_SHORT = 50
+SMA_LONG = 200
+
+HISTORY_BARS = 260  # Covers the 200-day SMA and the 6-month pivot window
+HISTORY_DAYS = 400  # Calendar days of bars loaded to seed the state
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class SymbolState:
+    """
+    Rolling state of one symbol: the finalized daily bars, the partial bar of the current day,
+    and the parts of the VCP and breakout rules that depend only on finalized bars.
+    Those are rebuilt once per symbol per day, when the first update of a new date arrives,
+    so every intraday update is evaluated in constant time.
+    """
+    __slots__ = ('symbol', 'country', 'days', 'highs', 'lows', 'closes', 'day', 'partial',
+                 'finalized', 'vcp', 'breakout')
+
+    def __init__(self, symbol, country, days=(), highs=(), lows=(), closes=()):
+        self.symbol = symbol
+        self.country = country
+        # Day numbers since 1970-01-01, as in BarStore
+        self.days = deque(days, maxlen=HISTORY_BARS)
+        self.highs = deque(highs, maxlen=HISTORY_BARS)
+        self.lows = deque(lows, maxlen=HISTORY_BARS)
+        self.closes = deque(closes, maxlen=HISTORY_BARS)
+        self.day = None
+        self.partial = None  # [open, high, low, close, volume] of the current day
+        self.finalized = None
+        self.vcp = {'active': False, 'stage': None, 'contraction': None}
+        self.breakout = {'active': False, 'level': None, 'stop_loss': None, 'profit_target': None}
+
+    def update(self, update):
+        # Returns the events for signals that switched on or off with this update
+        day = date.fromisoformat(str(update['date'])[:10]).toordinal() - EPOCH_ORDINAL
+        if self.day is not None and day < self.day:
+            return []  # Late update for a day that is already closed
+        if self.day is None or day > self.day:
+            self._roll(day)
+
+        close = float(update['close'])
+        high = float(update.get('high', close))
+        low = float(update.get('low', close))
+        if self.partial is None:
+            self.partial = [float(update.get('open', close)), max(high, close), min(low, close), close, update.get('volume')]
+        else:
+            bar = self.partial
+            if 'open' in update:
+                bar[0] = float(update['open'])
+            bar[1] = max(bar[1], high, close)
+            bar[2] = min(bar[2], low, close)
+            bar[3] = close
+            if 'volume' in update:
+                bar[4] = update['volume']
+        return self._evaluate()
+
+    def _roll(self, day):
+        # Close the previous day and prepare the finalized-bar parts of the rules for the new one
+        if self.partial is not None:
+            _, high, low, close, _ = self.partial
+            self.days.append(self.day)
+            self.highs.append(high)
+            self.lows.append(low)
+            self.closes.append(close)
+        # Seed bars at or after the first streamed date are superseded by the stream
+        while self.days and self.days[-1] >= day:
+            for column in (self.days, self.highs, self.lows, self.closes):
+                column.pop()
+        self.day = day
+        self.partial = None
+        self.finalized = prepare_finalized(
+            day, np.array(self.days, dtype=np.int64), np.array(self.highs, dtype=float),
+            np.array(self.lows, dtype=float), np.array(self.closes, dtype=float)
+        )
+
+    def _evaluate(self):
+        finalized = self.finalized
+        open_, high, low, close, _ = self.partial
+        events = []
+
+        vcp = evaluate_vcp(finalized, high, low, close)
+        if vcp['active'] != self.vcp['active'] or vcp['stage'] != self.vcp['stage']:
+            events.append(self._event('vcp', vcp, close))
+        self.vcp = vcp
+
+        breakout = evaluate_stream_breakout(finalized, open_, high, low, close)
+        if breakout['active'] != self.breakout['active']:
+            events.append(self._event('breakout', breakout, close))
+        self.breakout = breakout
+        return events
+
+    def _event(self, kind, signal, close):
+        return dict({
+            'type': kind,
+            'symbol': self.symbol,
+            'country': self.country,
+            'date': str(np.datetime64(self.day, 'D')),
+            'close': close,
+        }, **signal)
+
+    def active_events(self):
+        # Events describing the signals currently on, for clients that connect mid-stream
+        if self.partial is None:
+            return []
+        close = self.partial[3]
+        return [
+            self._event(kind, signal, close)
+            for kind, signal in (('vcp', self.vcp), ('breakout', self.breakout))
+            if signal['active']
+        ]
+
+
+def prepare_finalized(day, days, highs, lows, closes):
+    """
+    Everything the VCP and breakout rules need from the finalized bars before day, so that
+    combining it with the partial bar of day is constant work.
+    """
+    n = len(closes)
+    k = VCP_LOOKBACK_DAYS
+    finalized = {
+        'bars': n,
+        'prev_close': float(closes[-1]) if n else None,
+        # Finalized part of the SMA windows that end with the partial bar
+        'sum_short': float(closes[n - SMA_SHORT + 1:].sum()) if n >= SMA_SHORT - 1 else None,
+        'sum_long': float(closes[n - SMA_LONG + 1:].sum()) if n >= SMA_LONG - 1 else None,
+        'recent_base': None,
+        'prior_atr': None,
+    }
+
+    # True ranges as in analyze_vcp, where the first bar of each window has no previous close
+    # within the window and counts its high - low only
+    if n >= 2 * k - 1:
+        high_low = highs - lows
+        true_range = np.maximum(high_low[1:], np.maximum(np.abs(highs[1:] - closes[:-1]), np.abs(lows[1:] - closes[:-1])))
+        # true_range[i - 1] belongs to bar i
+        finalized['recent_base'] = float(high_low[n - k + 1] + true_range[n - k + 1:n - 1].sum())
+        finalized['prior_atr'] = float((high_low[n - 2 * k + 1] + true_range[n - 2 * k + 1:n - k].sum()) / k)
+
+    # Breakout window as in breakout_signals.main: REQUIRED_MONTHS back from day, and only when
+    # the bars in it span at least REQUIRED_MONTHS * 30 days
+    start = (pd.Timestamp(np.datetime64(day, 'D')) - pd.DateOffset(months=REQUIRED_MONTHS)).date()
+    first = int(np.searchsorted(days, start.toordinal() - EPOCH_ORDINAL))
+    finalized['breakout_eligible'] = first < n and day - days[first] >= REQUIRED_MONTHS * 30
+
+    # Pivot highs whose whole window is finalized; the most recent ones are the resistance levels
+    pivots = find_pivots(highs[first:], lows[first:], PIVOT_WINDOW, PIVOT_WINDOW)
+    finalized['levels'] = highs[first:][pivots == PIVOT_HIGH][-LAST_N_RESISTANCE_LEVELS:].tolist()
+
+    # The bar PIVOT_WINDOW before day has the partial bar as the last bar of its window, so whether
+    # it is a pivot high is only settled by the partial bar's high and low
+    candidate = n - PIVOT_WINDOW
+    finalized['candidate_high'] = None
+    finalized['candidate_low'] = None
+    if candidate - PIVOT_WINDOW >= first:
+        window = slice(candidate - PIVOT_WINDOW, n)
+        if highs[candidate] >= highs[window].max():
+            finalized['candidate_high'] = float(highs[candidate])
+        if lows[candidate] <= lows[window].min():
+            finalized['candidate_low'] = float(lows[candidate])
+    return finalized
+
+
+def evaluate_vcp(finalized, high, low, close):
+    # analyze_vcp on the finalized bars plus the partial bar
+    inactive = {'active': False, 'stage': None, 'contraction': None}
+    if finalized['bars'] + 1 < VCP_MIN_BARS or finalized['prior_atr'] is None or finalized['prior_atr'] == 0:
+        return inactive
+
+    prev_close = finalized['prev_close']
+    true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+    recent_atr = (finalized['recent_base'] + true_range) / VCP_LOOKBACK_DAYS
+    contraction = (finalized['prior_atr'] - recent_atr) / finalized['prior_atr']
+    if contraction < VCP_CONTRACTION_THRESHOLD or finalized['sum_long'] is None:
+        return dict(inactive, contraction=contraction)
+
+    sma_short = (finalized['sum_short'] + close) / SMA_SHORT
+    sma_long = (finalized['sum_long'] + close) / SMA_LONG
+    if close > sma_short > sma_long:
+        return {'active': True, 'stage': 'Stage 2', 'contraction': contraction}
+    return dict(inactive, contraction=contraction)
+
+
+def evaluate_stream_breakout(finalized, open_, high, low, close):
+    # generate_buy_signal on the breakout window ending with the partial bar
+    inactive = {'active': False, 'level': None, 'stop_loss': None, 'profit_target': None}
+    if not finalized['breakout_eligible']:
+        return inactive
+
+    levels = finalized['levels']
+    candidate_high = finalized['candidate_high']
+    candidate_low = finalized['candidate_low']
+    # A bar that is both the high and the low pivot of its window is not a resistance level
+    if candidate_high is not None and high <= candidate_high and not (candidate_low is not None and low >= candidate_low):
+        levels = (levels + [candidate_high])[-LAST_N_RESISTANCE_LEVELS:]
+    if not levels:
+        return inactive
+
+    resistance_levels = sorted(set(levels))
+    signal, stop_loss, profit_target = evaluate_breakout(resistance_levels, open_, close)
+    if not signal:
+        return inactive
+    level = max(level for level in resistance_levels if open_ < level < close)
+    return {'active': True, 'level': level, 'stop_loss': stop_loss, 'profit_target': profit_target}
+
+
+class StreamProcessor:
+    """
+    Applies bar updates to per-symbol state and publishes signal changes to subscribers.
+    Each subscriber gets its own bounded queue; a client that falls behind loses its oldest
+    events instead of holding up the stream.
+    """
+
+    def __init__(self, history=None):
+        self.history = history or {}
+        self.states = {}
+        self.subscribers = set()
+
+    def process(self, update):
+        try:
+            key = (update['symbol'], update['country'])
+            state = self.states.get(key)
+            if state is None:
+                state = self.states[key] = SymbolState(*key, **self.history.pop(key, {}))
+            return state.update(update)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping malformed update {update!r}: {e}")
+            return []
+
+    def publish(self, event):
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def close(self):
+        # None tells every subscriber that the stream has stopped
+        self.publish(None)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def snapshot(self):
+        return [event for state in self.states.values() for event in state.active_events()]
+
+    async def run(self, source):
+        updates = 0
+        async for update in source:
+            updates += 1
+            for event in self.process(update):
+                self.publish(event)
+        print(f"Stream ended after {updates} updates for {len(self.states)} symbols")
+
+
+def load_stream_history(db, countries=None, symbols=None, as_of=None, days=HISTORY_DAYS):
+    """
+    Finalized daily bars before as_of (default today) to seed the symbol states, in one query.
+    Returns {(symbol, country): SymbolState keyword arguments}.
+    """
+    as_of = as_of or date.today()
+    bars = fetch_bars(db, symbols=symbols, countries=countries,
+                      start_date=as_of - timedelta(days=days), end_date=as_of - timedelta(days=1),
+                      columns=('symbol', 'country', 'date', 'high', 'low', 'close'))
+    day_numbers = bars['date'].astype(np.int64)
+    history = {}
+    for symbol, country, start, stop in series_bounds(bars):
+        start = max(start, stop - HISTORY_BARS)
+        history[(symbol, country)] = {
+            'days': day_numbers[start:stop].tolist(),
+            'highs': bars['high'][start:stop].tolist(),
+            'lows': bars['low'][start:stop].tolist(),
+            'closes': bars['close'][start:stop].tolist(),
+        }
+    return history
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+# The stream started with the API, if any
+_processor = None
+
+
+def get_stream_processor():
+    return _processor
+
+
+async def start_stream(spec, countries=None, interval=0.0, as_of=None):
+    # Seeds the state from the database off the event loop, then follows the source
+    global _processor
+    from src.database import SessionLocal
+
+    def load():
+        db = SessionLocal()
+        try:
+            return load_stream_history(db, countries=countries, as_of=as_of)
+        finally:
+            db.close()
+
+    history = await asyncio.get_running_loop().run_in_executor(None, load)
+    _processor = StreamProcessor(history)
+    print(f"Streaming from {spec} with history for {len(history)} symbols")
+    await _processor.run(open_source(spec, interval))
+
+
+def stream_stopped(task):
+    # Done-callback of the start_stream task: logs why the stream stopped, ends the subscribers'
+    # event streams and marks streaming unavailable, so /stream/events answers 503 from then on
+    global _processor
+    if task.cancelled():
+        print("Stream cancelled")
+    elif task.exception() is not None:
+        error = task.exception()
+        print("Stream failed: " + ''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+    if _processor is not None:
+        _processor.close()
+        _processor = None
+
+
+if __name__ == "__main__":
+    # Replay a source and print the signal changes, e.g.
+    #   python -m src.service.stream_service --source replay.ndjson --countries usa --as-of 2024-06-03
+    parser = argparse.ArgumentParser(description="Run the intraday stream and print signal changes")
+    parser.add_argument('--source', required=True, help="NDJSON replay file or tcp://host:port")
+    parser.add_argument('--countries', nargs='+', default=None)
+    parser.add_argument('--as-of', type=date.fromisoformat, default=None, help="Seed with bars before this date")
+    parser.add_argument('--interval', type=float, default=0.0, help="Seconds between replayed updates")
+    args = parser.parse_args()
+
+    async def main():
+        from src.database import SessionLocal
+        db = SessionLocal()
+        try:
+            history = load_stream_history(db, countries=args.countries, as_of=args.as_of)
+        finally:
+            db.close()
+        processor = StreamProcessor(history)
+        async for update in open_source(args.source, args.interval):
+            for event in processor.process(update):
+                print(json.dumps(event))
+
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+# src/service/stream_sources.py
+
+import asyncio
+import json
+
+# A stream source is any async iterable of bar updates. An update is a dict with symbol, country,
+# date (YYYY-MM-DD) and the day's bar so far: close, and optionally open, high, low and volume.
+# Sources carry newline-delimited JSON, one update per line.
+
+
+def parse_update(line):
+    # Returns None for blank lines and comments so replay files can be annotated, and for lines
+    # that are not a JSON object, which are logged and skipped so one bad line does not end the stream
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    try:
+        update = json.loads(line)
+    except ValueError as e:
+        print(f"Skipping malformed stream line {line[:200]!r}: {e}")
+        return None
+    if not isinstance(update, dict):
+        print(f"Skipping stream line that is not an update: {line[:200]!r}")
+        return None
+    return update
+
+
+class FileReplaySource:
+    """
+    Replays updates from an NDJSON file, optionally pausing interval seconds between them.
+    Used for testing the stream without a live feed.
+    """
+
+    def __init__(self, path, interval=0.0):
+        self.path = path
+        self.interval = interval
+
+    async def __aiter__(self):
+        with open(self.path) as f:
+            for line in f:
+                update = parse_update(line)
+                if update is None:
+                    continue
+                yield update
+                # Always yield to the event loop so subscribers are served during a fast replay
+                await asyncio.sleep(self.interval)
+
+
+class SocketSource:
+    """
+    Reads updates from a TCP connection sending NDJSON, such as a feed handler or
+    `nc -l 9000 < replay.ndjson`. The stream ends when the peer closes the connection.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def __aiter__(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                update = parse_update(line.decode(errors='replace'))
+                if update is not None:
+                    yield update
+        finally:
+            writer.close()
+
+
+def open_source(spec, interval=0.0):
+    # 'tcp://host:port' opens a socket source; 'file:path' or a plain path replays a file
+    if spec.startswith('tcp://'):
+        host, port = spec[len('tcp://'):].rsplit(':', 1)
+        return SocketSource(host, int(port))
+    if spec.startswith('file:'):
+        spec = spec[len('file:'):]
+    return FileReplaySource(spec, interval)
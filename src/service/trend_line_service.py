@@ -0,0 +1,65 @@
+# src/service/trend_line_service.py
+
+from datetime import date
+from sqlalchemy.orm import Session
+from src.database.bar_store import BarStore
+from src.database.models import TrendLine
+from src.service.results_service import active_pairs
+from src.research.trend_lines import fit_symbol_trend_lines
+
+def run_trend_line_fitting(db: Session, countries: list, min_bars=60):
+    """
+    Fit trend lines for every screened symbol of the given countries.
+    Bars for the whole universe are loaded with a single query into a BarStore.
+    Returns {(symbol, country): [line, ...]} with the line parameters from fit_symbol_trend_lines.
+    """
+    screened = set(active_pairs(db, 'screening', countries))
+    if not screened:
+        return {}
+
+    store = BarStore.load(db, countries=countries, symbols={symbol for symbol, _ in screened})
+
+    results = {}
+    for bars in store:
+        key = (bars.symbol, bars.country)
+        if key not in screened or len(bars) < min_bars:
+            continue
+        lines = fit_symbol_trend_lines(bars.dates, bars.high, bars.low, bars.close)
+        last_date = bars.dates[-1].item()
+        for line in lines:
+            line['last_date'] = last_date
+        results[key] = lines
+    return results
+
+def run_trend_line_snapshots(db: Session, countries: list, min_bars=60):
+    """
+    Fit the trend lines of the screened symbols and store them in trend_lines, replacing the
+    previous snapshot for the countries. /trend_lines serves the stored lines, so charts and
+    breakout alerts can project them onto new bars without refitting.
+    """
+    today = date.today()
+    rows = []
+    fitted = run_trend_line_fitting(db, countries, min_bars=min_bars)
+    for (symbol, country), lines in fitted.items():
+        for line in lines:
+            rows.append({
+                'symbol': symbol,
+                'country': country,
+                'kind': line['kind'],
+                'start_date': line['start_date'].item(),
+                'end_date': line['end_date'].item(),
+                # Intercepts are relative to the first loaded bar; store the value at the first anchor instead
+                'start_price': line['slope'] * line['start_index'] + line['intercept'],
+                'slope': line['slope'],
+                'touches': line['touches'],
+                'violations': line['violations'],
+                'score': line['score'],
+                'value_at_last': line['value_at_last'],
+                'last_date': line['last_date'],
+                'computed_date': today,
+            })
+
+    db.query(TrendLine).filter(TrendLine.country.in_(countries)).delete(synchronize_session=False)
+    db.bulk_insert_mappings(TrendLine, rows)
+    db.commit()
+    print(f"Stored {len(rows)} trend lines for {len(fitted)} symbols")
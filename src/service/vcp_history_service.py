@@ -0,0 +1,77 @@
+# src/service/vcp_history_service.py
+
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from sqlalchemy.orm import Session
+from src.database.models import VCPEvent
+from src.database.columnar import fetch_bars, series_bounds
+from src.research.VCP_Plot import label_vcp_stages
+from src.service.screener_service import screening_universe
+
+# A daily update relabels the last VCP_HISTORY_UPDATE_DAYS, with slack for holidays and missed runs
+VCP_HISTORY_UPDATE_DAYS = 60
+# Bars read before the relabelled days so the 200-day SMA and contraction windows are complete
+VCP_HISTORY_WARMUP_DAYS = 400
+VCP_HISTORY_BATCH_SIZE = 200  # Symbols whose bars are read in one query
+
+def run_vcp_history(db: Session, countries: list, rebuild=False, batch_size=VCP_HISTORY_BATCH_SIZE):
+    """
+    Label every day of every symbol with label_vcp_stages and store the Stage 2 and Stage 4 days
+    in vcp_events. Labels only depend on earlier bars, so once the table is filled a daily update
+    replaces the last VCP_HISTORY_UPDATE_DAYS of events from a shorter read; the first run, or
+    rebuild=True, labels the full history.
+    """
+    if rebuild:
+        db.query(VCPEvent).filter(VCPEvent.country.in_(countries)).delete(synchronize_session=False)
+    indexed = db.query(VCPEvent.id).filter(VCPEvent.country.in_(countries)).first() is not None
+    replace_from = start_date = None
+    if indexed:
+        replace_from = date.today() - timedelta(days=VCP_HISTORY_UPDATE_DAYS)
+        start_date = replace_from - timedelta(days=VCP_HISTORY_WARMUP_DAYS)
+        db.query(VCPEvent).filter(
+            VCPEvent.country.in_(countries),
+            VCPEvent.date >= replace_from
+        ).delete(synchronize_session=False)
+
+    universe = screening_universe(db, countries)
+    stored = 0
+    for i in range(0, len(universe), batch_size):
+        pairs = set(universe[i:i + batch_size])
+        bars = fetch_bars(db, symbols={symbol for symbol, _ in pairs}, countries={country for _, country in pairs},
+                          start_date=start_date, columns=('symbol', 'country', 'date', 'high', 'low', 'close'))
+        rows = []
+        for symbol, country, start, stop in series_bounds(bars):
+            if (symbol, country) not in pairs:
+                continue
+            df = label_vcp_stages(pd.DataFrame({name: bars[name][start:stop] for name in ('date', 'high', 'low', 'close')}))
+            events = df[df['VCP_Stage'].notna()]
+            if replace_from is not None:
+                events = events[events['date'] >= np.datetime64(replace_from)]
+            rows.extend({
+                'symbol': symbol,
+                'country': country,
+                'date': day,
+                'stage': stage,
+                'contraction': contraction,
+                'close': close,
+            } for day, stage, contraction, close in zip(events['date'].dt.date, events['VCP_Stage'], events['Contraction'].tolist(), events['close'].tolist()))
+        db.bulk_insert_mappings(VCPEvent, rows)
+        stored += len(rows)
+    db.commit()
+    print(f"Stored {stored} VCP events")
+
+def load_vcp_events(db: Session, countries=None, symbol=None, stage=None, start_date=None, end_date=None):
+    # Stored VCP days, ordered by date then symbol
+    query = db.query(VCPEvent)
+    if countries is not None:
+        query = query.filter(VCPEvent.country.in_(countries))
+    if symbol is not None:
+        query = query.filter(VCPEvent.symbol == symbol)
+    if stage is not None:
+        query = query.filter(VCPEvent.stage == stage)
+    if start_date is not None:
+        query = query.filter(VCPEvent.date >= start_date)
+    if end_date is not None:
+        query = query.filter(VCPEvent.date <= end_date)
+    return query.order_by(VCPEvent.date, VCPEvent.symbol, VCPEvent.country).all()
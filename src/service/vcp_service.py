@@ -3,67 +3,152 @@
 import numpy as np
 import pandas as pd
 from sqlalchemy.orm import Session
-from src.database.models import StockData, VCPStock, ScreenedStock
+from src.database.models import VCPStock
+from src.database.columnar import fetch_bars, series_bounds
+from src.research.contractions import classify_contractions, contraction_volumes, contraction_label
+from src.service.results_service import start_run, publish_run, active_runs, active_filter, active_pairs
 from datetime import date 
 
 # Turn off SettingWithCopyWarning
 pd.options.mode.chained_assignment = None
 
-def run_vcp_detection(db: Session, countries: list):
-    # Fetch symbols and countries from the screened_stocks table for the specified countries
-    screened_stocks = db.query(ScreenedStock.symbol, ScreenedStock.country).filter(ScreenedStock.country.in_(countries)).all()
-    screened_symbols = [s.symbol for s in screened_stocks]
-    symbol_country_map = {s.symbol: s.country for s in screened_stocks}
-
-    # Keep track of symbols that meet the VCP criteria
-    symbols_meeting_vcp = set()
-
-    for symbol in screened_symbols:
+VCP_BATCH_SIZE = 200  # Symbols whose bars are read in one query
+VOLUME_AVERAGE_DAYS = 50
+VCP_MAX_VOLUME_RATIO = 1.0  # A VCP's recent volume is below its 50-day average
+VCP_BASE_DAYS = 250  # Bars searched for the base's swings
+VCP_MIN_CONTRACTIONS = 2  # Tightening pullbacks a VCP needs
+VCP_MIN_VOLUME_DRY_UP = 0.0  # The last pullback trades on less volume than the first
+
+def vcp_universe(db: Session, countries: list):
+    # VCP detection runs on the published screened stocks of the specified countries
+    return active_pairs(db, 'screening', countries)
+
+def volume_ratios(bars, bounds, lookback_days=14, average_days=VOLUME_AVERAGE_DAYS):
+    """
+    volume_ratio at the last bar of every series in bounds, [(start, stop)] into the columnar
+    bars: the mean volume of the last lookback_days over the average_days average, computed for
+    all of them at once from one cumulative sum. NaN for series too short or missing volume in
+    either window.
+    """
+    volume = bars['volume'].astype(float)
+    missing = np.isnan(volume)
+    starts = np.array([start for start, _ in bounds], dtype=np.int64)
+    stops = np.array([stop for _, stop in bounds], dtype=np.int64)
+    lengths = stops - starts
+
+    # The windows of short series would reach into the series before them; those are masked
+    # A window with a missing volume is masked too; the sums count missing volume as 0
+    totals = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, volume))))
+    gaps = np.concatenate(([0], np.cumsum(missing)))
+    average_start = np.maximum(stops - average_days, 0)
+    recent_start = np.maximum(stops - lookback_days, 0)
+    average = (totals[stops] - totals[average_start]) / average_days
+    recent_mean = (totals[stops] - totals[recent_start]) / lookback_days
+    complete = (gaps[stops] == gaps[average_start]) & (gaps[stops] == gaps[recent_start])
+    valid = (lengths >= max(average_days, lookback_days)) & complete & (average > 0)
+    volume_ratio = np.full(len(bounds), np.nan)
+    volume_ratio[valid] = recent_mean[valid] / average[valid]
+    return volume_ratio
+
+def volume_dry_up(volumes):
+    # How far the mean volume fell from the first pullback of the base to the last; NaN without volume
+    first, last = volumes[0], volumes[-1]
+    return (first - last) / first if first > 0 else np.nan
+
+def detect_vcp_symbols(db: Session, pairs: list):
+    """
+    {(symbol, country): {'stage', 'contraction_count', 'final_contraction', 'volume_ratio',
+    'volume_dry_up'}} for the pairs among pairs showing a VCP. Bars for all of them are read in
+    one columnar query, so pairs should be a bounded subset (a shard). stage names the
+    contraction sequence, e.g. 'Stage 2 3T tight 25.0/12.1/6.3'.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    bars = fetch_bars(db, symbols={symbol for symbol, _ in pairs}, countries={country for _, country in pairs},
+                      columns=('symbol', 'country', 'date', 'close', 'high', 'low', 'volume'), keep_missing_volume=True)
+    series = [(symbol, country, start, stop) for symbol, country, start, stop in series_bounds(bars) if (symbol, country) in pairs]
+    ratios = volume_ratios(bars, [(start, stop) for _, _, start, stop in series])
+
+    detected = {}
+    for (symbol, country, start, stop), volume_ratio in zip(series, ratios.tolist()):
         print("Running VCP detection for Symbol " + symbol)
-        # Fetch historical data for the symbol
-        stock_entries = db.query(StockData).filter(StockData.symbol == symbol).order_by(StockData.date).all()
-
-        if len(stock_entries) < 100:
+        if stop - start < 100:
             # Need at least 100 data points for analysis
             continue
 
         # Prepare DataFrame
-        data = pd.DataFrame([{
-            'date': entry.date,
-            'close': entry.close,
-            'high': entry.high,
-            'low': entry.low,
-            'volume': entry.volume
-        } for entry in stock_entries])
-
-        data.set_index('date', inplace=True)
+        data = pd.DataFrame({name: bars[name][start:stop] for name in ('date', 'close', 'high', 'low', 'volume')}).set_index('date')
 
         # Detect VCP pattern
         is_vcp, stage = analyze_vcp(data)
 
+        # Volume has to dry up with the price range; symbols without volume data are judged on price
+        if is_vcp and volume_ratio > VCP_MAX_VOLUME_RATIO:
+            is_vcp = False
+
+        # The base has to show a sequence of shallower and shallower pullbacks
+        if is_vcp:
+            base = slice(max(start, stop - VCP_BASE_DAYS), stop)
+            contractions = classify_contractions(bars['high'][base], bars['low'][base], bars['close'][base])
+            is_vcp = contractions['count'] >= VCP_MIN_CONTRACTIONS
+
+        # Volume also has to dry up across the base: the bars of the last pullback trade less than those of the first
+        if is_vcp:
+            dry_up = volume_dry_up(contraction_volumes(bars['volume'][base], contractions['legs']))
+            if dry_up <= VCP_MIN_VOLUME_DRY_UP:
+                is_vcp = False
+
         if is_vcp:
             print("VCP Detected for Symbol " + symbol)
-            symbols_meeting_vcp.add(symbol)
-
-            # Check if the stock is already in vcp_stocks
-            exists = db.query(VCPStock).filter(VCPStock.symbol == symbol).first()
-            if exists:
-                # Update the stage if necessary
-                if exists.stage != stage:
-                    exists.stage = stage
-                    db.commit()
-            else:
-                # Add new VCP stock
-                vcp_stock = VCPStock(symbol=symbol, stage=stage, country=symbol_country_map[symbol], detected_date=date.today())
-                db.add(vcp_stock)
-                db.commit()
-
-    # Remove stocks that no longer meet the VCP criteria for the specified countries
-    existing_vcp_stocks = db.query(VCPStock).filter(VCPStock.country.in_(countries)).all()
-    for stock in existing_vcp_stocks:
-        if stock.symbol not in symbols_meeting_vcp:
+            detected[(symbol, country)] = {
+                'stage': contraction_label(stage, contractions),
+                'contraction_count': contractions['count'],
+                'final_contraction': contractions['depths'][-1],
+                'volume_ratio': None if np.isnan(volume_ratio) else volume_ratio,
+                'volume_dry_up': None if np.isnan(dry_up) else dry_up,
+            }
+    return detected
+
+def write_vcp_results(db: Session, run_id, pairs: list, detected: dict):
+    # Write the vcp_stocks rows of pairs for run run_id; writing the same pairs again replaces
+    # them. Stocks that were already in a VCP in the published run keep their detected_date.
+    # Does not commit
+    pairs = set(pairs)
+    symbols = {symbol for symbol, _ in pairs}
+    countries = {country for _, country in pairs}
+    detected_dates = {
+        (stock.symbol, stock.country): stock.detected_date
+        for stock in db.query(VCPStock).filter(
+            VCPStock.symbol.in_(symbols),
+            VCPStock.country.in_(countries),
+            active_filter(VCPStock, active_runs(db, 'vcp'))
+        ).all()
+    }
+    for stock in db.query(VCPStock).filter(
+        VCPStock.run_id == run_id,
+        VCPStock.symbol.in_(symbols),
+        VCPStock.country.in_(countries)
+    ).all():
+        if (stock.symbol, stock.country) in pairs:
             db.delete(stock)
-    db.commit()
+    db.bulk_insert_mappings(VCPStock, [
+        {'symbol': symbol, 'stage': result['stage'], 'country': country, 'run_id': run_id,
+         'detected_date': detected_dates.get((symbol, country), date.today()),
+         'contraction_count': result['contraction_count'], 'final_contraction': result['final_contraction'],
+         'volume_ratio': result['volume_ratio'], 'volume_dry_up': result['volume_dry_up']}
+        for (symbol, country), result in sorted(detected.items())
+    ])
+
+def run_vcp_detection(db: Session, countries: list, batch_size=VCP_BATCH_SIZE):
+    # Written as a new run and served once it is published
+    run_id = start_run(db, 'vcp', countries)
+    universe = vcp_universe(db, countries)
+    for i in range(0, len(universe), batch_size):
+        pairs = universe[i:i + batch_size]
+        write_vcp_results(db, run_id, pairs, detect_vcp_symbols(db, pairs))
+        db.commit()
+    publish_run(db, 'vcp', run_id, countries)
 
 def analyze_vcp(data, lookback_days=14, contraction_threshold=0.08):
     # Ensure data is sorted by date
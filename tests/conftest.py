@@ -0,0 +1,9 @@
+# tests/conftest.py
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+# src.database builds its engine on import; the tests use their own in-memory databases
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
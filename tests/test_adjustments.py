@@ -0,0 +1,52 @@
+# tests/test_adjustments.py
+
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from src.database.adjustments import adjustment_events, record_split
+from src.database.columnar import fetch_bars
+from src.database.models import Base, StockData
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(StockData), [
+            {'symbol': 'AAA', 'country': 'usa', 'date': date(2024, 1, day), 'open': 100.0, 'high': 100.0,
+             'low': 100.0, 'close': 100.0, 'volume': 1000}
+            for day in range(2, 6)
+        ])
+    return engine
+
+
+def count_aggregates(engine):
+    # Number of times the adjustment_factors version query runs
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return lambda: sum('count(*)' in statement and 'adjustment_factors' in statement for statement in statements)
+
+
+def test_events_are_read_once_per_transaction(engine):
+    db = sessionmaker(bind=engine)()
+    record_split(db, 'AAA', 'usa', date(2024, 1, 4), 2)
+    aggregates = count_aggregates(engine)
+
+    for _ in range(3):
+        bars = fetch_bars(db, symbol='AAA', country='usa')
+        assert bars['close'].tolist() == [50.0, 50.0, 100.0, 100.0]
+    assert aggregates() == 1
+
+    # A new transaction checks the version again and sees an event recorded since
+    db.commit()
+    record_split(db, 'AAA', 'usa', date(2024, 1, 5), 2)
+    bars = fetch_bars(db, symbol='AAA', country='usa')
+    assert bars['close'].tolist() == [25.0, 25.0, 50.0, 100.0]
+    assert aggregates() == 2
+    assert len(adjustment_events(db)[('AAA', 'usa')][0]) == 2
+    db.close()
@@ -0,0 +1,94 @@
+# tests/test_contractions.py
+
+import numpy as np
+import pytest
+
+from src.research.contractions import (
+    SWING_HIGH, SWING_LOW, classify_contractions, swing_threshold, zigzag,
+)
+
+
+def random_bars(rng, n=120, sigma=0.02, width=0.01):
+    # Random walk with gaps and bars that are often wider than the threshold
+    close = 100 * np.exp(np.cumsum(rng.normal(0, sigma, n)))
+    previous = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, width, n))
+    return np.maximum(previous, close) * (1 + spread), np.minimum(previous, close) * (1 - spread), close
+
+
+def assert_swing_invariants(high, low, threshold):
+    swings, pending = zigzag(high, low, threshold)
+    points = swings + ([pending] if pending is not None else [])
+    indexes = [index for index, _, _ in points]
+    assert indexes == sorted(set(indexes)), "one swing per bar, in order"
+    assert all(a[2] != b[2] for a, b in zip(points, points[1:])), "swings alternate"
+    for k, (index, price, kind) in enumerate(points):
+        start = points[k - 1][0] + 1 if k > 0 else 0
+        stop = points[k + 1][0] if k + 1 < len(points) else len(high)
+        if kind == SWING_HIGH:
+            assert price == high[index] and high[start:stop].max() <= price
+        else:
+            assert price == low[index] and low[start:stop].min() >= price
+    # Every confirmed leg is a reversal of at least threshold
+    for a, b in zip(points, points[1:-1] if pending is not None else points[1:]):
+        if a[2] == SWING_HIGH:
+            assert b[1] <= a[1] * (1 - threshold) + 1e-9
+        else:
+            assert b[1] >= a[1] * (1 + threshold) - 1e-9
+
+
+@pytest.mark.parametrize('threshold, sigma, width', [
+    (0.03, 0.02, 0.01),
+    (0.03, 0.01, 0.03),
+    (0.05, 0.03, 0.02),
+    (0.02, 0.01, 0.005),
+])
+def test_each_swing_is_the_extreme_between_its_neighbours(threshold, sigma, width):
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        high, low, _ = random_bars(rng, sigma=sigma, width=width)
+        assert_swing_invariants(high, low, threshold)
+
+
+def test_wide_bar_holds_one_swing():
+    high = [10, 10.5, 11, 11, 9.5, 9.6]
+    low = [9.9, 10.4, 10.9, 9.0, 9.4, 9.5]
+    swings, pending = zigzag(high, low, 0.03)
+    assert [index for index, _, _ in swings] == [0, 2, 3]
+    assert pending[0] == 5
+
+
+def vcp_base(points, noise=0.003, width=0.008, seed=0):
+    x = np.arange(points[-1][0] + 1)
+    close = np.interp(x, [i for i, _ in points], [p for _, p in points])
+    close = close * np.exp(np.random.default_rng(seed).normal(0, noise, len(x)))
+    return close * (1 + width), close * (1 - width), close
+
+
+def test_tightening_base_is_classified():
+    # Up to 100, then pullbacks of about 25%, 12% and 6%
+    high, low, close = vcp_base([(0, 60), (60, 100), (80, 75), (110, 98), (125, 86.2), (150, 97), (160, 91.2), (180, 99)])
+    contractions = classify_contractions(high, low, close)
+    assert contractions['count'] == 3
+    assert contractions['tightness'] == 'tight'
+    assert [round(depth, 2) for depth in contractions['depths']] == pytest.approx([0.26, 0.13, 0.07], abs=0.02)
+    assert all(start < stop for start, stop in contractions['legs'])
+
+
+def test_base_with_a_deeper_later_pullback_is_not_a_vcp():
+    high, low, close = vcp_base([(0, 60), (60, 100), (80, 88), (110, 98), (125, 80), (150, 97), (160, 91.2), (180, 99)])
+    assert classify_contractions(high, low, close)['count'] == 0
+
+
+def test_shallow_first_pullback_is_not_a_vcp():
+    high, low, close = vcp_base([(0, 60), (60, 100), (80, 93), (110, 99), (125, 95), (150, 99), (160, 97.5), (180, 99)],
+                                noise=0.001, width=0.002)
+    assert classify_contractions(high, low, close, threshold=0.01)['count'] == 0
+
+
+def test_threshold_scales_with_daily_range():
+    rng = np.random.default_rng(1)
+    quiet = random_bars(rng, n=250, sigma=0.005, width=0.002)
+    volatile = random_bars(rng, n=250, sigma=0.04, width=0.02)
+    assert swing_threshold(*quiet) == 0.03
+    assert swing_threshold(*volatile) > 0.1
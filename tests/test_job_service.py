@@ -0,0 +1,108 @@
+# tests/test_job_service.py
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import Base, JobShard
+from src.service.job_service import (
+    LEASE_SECONDS, MAX_ATTEMPTS, claim_shard, claim_stage, complete_shard, create_shards, ensure_shards,
+    release_shard, stage_status,
+)
+
+JOB = 'nightly-test'
+PAIRS = [[f'S{i}', 'usa'] for i in range(5)]
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    # Each worker has its own session on a shared database file
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    opened = []
+
+    def session():
+        opened.append(factory())
+        return opened[-1]
+    yield session
+    for db in opened:
+        db.close()
+    engine.dispose()
+
+
+def expire_lease(db, **filters):
+    # Backdate claims as if their worker stopped renewing them long ago
+    db.query(JobShard).filter_by(job=JOB, **filters).update(
+        {'claimed_at': datetime.now() - timedelta(seconds=LEASE_SECONDS + 60)}, synchronize_session=False)
+    db.commit()
+
+
+def test_one_worker_claims_the_stage_setup(sessions):
+    a, b = sessions(), sessions()
+    assert claim_stage(a, JOB, 'screening', 'worker-a')
+    assert not claim_stage(b, JOB, 'screening', 'worker-b')
+    # The same worker name restarting after a crash takes its setup back
+    assert claim_stage(b, JOB, 'screening', 'worker-a')
+    # Another worker only once the lease has expired
+    assert not claim_stage(b, JOB, 'screening', 'worker-b')
+    expire_lease(a, stage='screening', shard=0)
+    assert claim_stage(b, JOB, 'screening', 'worker-b')
+    setup = b.query(JobShard).filter_by(job=JOB, stage='screening', shard=0).one()
+    assert (setup.status, setup.worker, setup.attempts) == ('setup', 'worker-b', 3)
+    # Stages are claimed separately
+    assert claim_stage(a, JOB, 'vcp', 'worker-a')
+
+
+def test_workers_claim_distinct_shards(sessions):
+    a, b = sessions(), sessions()
+    assert claim_stage(a, JOB, 'screening', 'worker-a')
+    create_shards(a, JOB, 'screening', 7, PAIRS, shard_size=2)
+    assert stage_status(a, JOB, 'screening') == {'pending': 3}
+
+    claimed = [claim_shard(a, JOB, 'screening', 'worker-a'), claim_shard(b, JOB, 'screening', 'worker-b'),
+               claim_shard(a, JOB, 'screening', 'worker-a')]
+    assert [shard.shard for shard in claimed] == [0, 1, 2]
+    assert {shard.run_id for shard in claimed} == {7}
+    assert claimed[2].symbols == '[["S4", "usa"]]'
+    assert claim_shard(b, JOB, 'screening', 'worker-b') is None
+    assert complete_shard(b, claimed[1], 'worker-b')
+    b.commit()
+    assert stage_status(a, JOB, 'screening') == {'running': 2, 'done': 1}
+
+
+def test_expired_shard_is_taken_over(sessions):
+    a, b = sessions(), sessions()
+    claim_stage(a, JOB, 'vcp', 'worker-a')
+    create_shards(a, JOB, 'vcp', 1, PAIRS[:1])
+    shard = claim_shard(a, JOB, 'vcp', 'worker-a')
+    assert claim_shard(b, JOB, 'vcp', 'worker-b') is None
+
+    expire_lease(b, stage='vcp')
+    taken = claim_shard(b, JOB, 'vcp', 'worker-b')
+    assert (taken.id, taken.worker, taken.attempts) == (shard.id, 'worker-b', 2)
+    # The first worker finishing late must not mark the shard done over the new holder
+    assert not complete_shard(a, shard, 'worker-a')
+    a.rollback()
+    assert complete_shard(b, taken, 'worker-b')
+    b.commit()
+    assert stage_status(a, JOB, 'vcp') == {'done': 1}
+
+
+def test_failing_shard_is_retried_then_failed(sessions):
+    db = sessions()
+    claim_stage(db, JOB, 'vcp', 'worker-a')
+    create_shards(db, JOB, 'vcp', 1, PAIRS)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        shard = claim_shard(db, JOB, 'vcp', 'worker-a')
+        assert shard.attempts == attempt
+        release_shard(db, shard, 'worker-a', 'ValueError()')
+    assert claim_shard(db, JOB, 'vcp', 'worker-a') is None
+    assert stage_status(db, JOB, 'vcp') == {'failed': 1}
+
+    # A rerun of the job sends failed shards back to pending without setting the stage up again
+    ensure_shards(db, JOB, 'vcp', ['usa'], universe=None, worker='worker-b')
+    assert stage_status(db, JOB, 'vcp') == {'pending': 1}
+    assert claim_shard(db, JOB, 'vcp', 'worker-b').attempts == 1
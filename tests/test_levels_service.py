@@ -0,0 +1,45 @@
+# tests/test_levels_service.py
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import StockData, SupportResistanceLevel
+from src.database.schema import upgrade_schema
+from src.service.levels_service import compute_level_rows, load_levels_snapshot, load_levels_snapshots
+
+
+def price_frame(n=120, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return pd.DataFrame({
+        'date': pd.to_datetime([date(2024, 1, 1) + timedelta(days=i) for i in range(n)]),
+        'open': close, 'high': close * 1.01, 'low': close * 0.99, 'close': close,
+        'volume': np.full(n, 1000.0),
+    })
+
+
+def test_snapshots_after_startup_migration():
+    # A database that only has stock_data, as before the nightly snapshot tables were added
+    engine = create_engine('sqlite://')
+    StockData.__table__.create(engine)
+    upgrade_schema(engine)
+    assert {'support_resistance_levels', 'adjustment_factors'} <= set(inspect(engine).get_table_names())
+
+    db = sessionmaker(bind=engine)()
+    df = price_frame()
+    # No snapshot yet: the charts fall back to computing the levels live
+    assert load_levels_snapshots(db, 'v1', 6, {('AAA', 'usa'): df}) == {('AAA', 'usa'): None}
+
+    db.bulk_insert_mappings(SupportResistanceLevel, compute_level_rows(('AAA', 'usa', 6, df)), render_nulls=True)
+    db.commit()
+    levels = load_levels_snapshots(db, 'v2', 6, {('AAA', 'usa'): df, ('BBB', 'usa'): df})
+    assert levels[('BBB', 'usa')] is None
+    assert set(levels[('AAA', 'usa')]) == {'support_levels', 'resistance_levels'}
+    assert load_levels_snapshot(db, 'AAA', 'usa', 'v1', 6, df)['pivot_dates'].dtype == np.dtype('datetime64[ns]')
+    # A snapshot of a different window of bars is not served
+    assert load_levels_snapshot(db, 'AAA', 'usa', 'v1', 6, df.iloc[1:]) is None
+    db.close()
@@ -0,0 +1,42 @@
+# tests/test_pivots.py
+
+import numpy as np
+import pytest
+
+from src.research.pivots import PIVOT_HIGH, PIVOT_LOW, find_pivots, pivot_pyramid
+
+
+def reference_pivots(high, low, n1, n2):
+    pivots = np.zeros(len(high), dtype=int)
+    for i in range(n1, len(high) - n2):
+        window = slice(i - n1, i + n2 + 1)
+        pivots[i] = (low[i] == low[window].min()) * PIVOT_LOW + (high[i] == high[window].max()) * PIVOT_HIGH
+    return pivots
+
+
+@pytest.mark.parametrize('n1, n2', [(1, 1), (2, 5), (5, 5), (7, 3)])
+def test_matches_reference(n1, n2):
+    rng = np.random.default_rng(n1 * 10 + n2)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 200)))
+    high, low = np.round(close * 1.01, 1), np.round(close * 0.99, 1)  # Rounded so extremes tie
+    assert find_pivots(high, low, n1, n2).tolist() == reference_pivots(high, low, n1, n2).tolist()
+    assert pivot_pyramid(high, low).pivots(n1, n2).tolist() == reference_pivots(high, low, n1, n2).tolist()
+
+
+def test_cache_by_name_and_by_content():
+    rng = np.random.default_rng(0)
+    high = 100 + rng.random(50)
+    low = high - 1
+    key = ('AAA', 'usa', np.datetime64('2026-10-19'))
+    pyramid = pivot_pyramid(high, low, key=key)
+    assert pivot_pyramid(high.copy(), low.copy(), key=key) is pyramid
+    # Anonymous arrays share a pyramid by content
+    assert pivot_pyramid(high, low) is pivot_pyramid(high.copy(), low.copy())
+
+    # The same name with other bars, as after a split is recorded, is recomputed and replaces it
+    adjusted = pivot_pyramid(high / 2, low / 2, key=key)
+    assert adjusted is not pyramid
+    assert np.array_equal(adjusted.high, high / 2)
+    assert pivot_pyramid(high / 2, low / 2, key=key) is adjusted
+    # A different window of the same name is another entry
+    assert pivot_pyramid(high[1:], low[1:], key=key) is not adjusted
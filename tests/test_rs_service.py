@@ -0,0 +1,38 @@
+# tests/test_rs_service.py
+
+import numpy as np
+import pytest
+
+from src.service.rs_service import percentile_ranks
+
+
+def reference_ranks(scores, countries):
+    # 1 to 99 by the number of strictly lower scores in the same country; ties share the lowest rank
+    ranks = []
+    for score, country in zip(scores, countries):
+        peers = scores[countries == country]
+        below = int((peers < score).sum())
+        ranks.append(99 if len(peers) == 1 else 1 + 98 * below // (len(peers) - 1))
+    return np.array(ranks)
+
+
+def test_ties_share_the_lowest_rank():
+    scores = np.array([0.1, 0.3, 0.3, 0.3, 0.5, 0.2, 0.2])
+    countries = np.array(['usa'] * 5 + ['india'] * 2)
+    assert percentile_ranks(scores, countries).tolist() == [1, 25, 25, 25, 99, 1, 1]
+
+
+def test_single_symbol_country():
+    assert percentile_ranks(np.array([0.4, 0.1, 0.9]), np.array(['usa', 'india', 'usa'])).tolist() == [1, 99, 99]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    n = 300
+    # Few distinct scores, so most of them are tied
+    scores = rng.integers(0, 20, n) / 10
+    countries = rng.choice(['usa', 'india', 'japan'], n)
+    ranks = percentile_ranks(scores, countries)
+    assert ranks.tolist() == reference_ranks(scores, countries).tolist()
+    assert ranks.min() >= 1 and ranks.max() <= 99
@@ -0,0 +1,107 @@
+# tests/test_screens.py
+
+import numpy as np
+import pytest
+
+from src.research.screens import ScreenProgram, parse_screen
+
+
+def evaluate(screen, bars, values=None, days=1):
+    return ScreenProgram({'s': screen}).evaluate(bars, values, days=days)['s']
+
+
+def test_precedence():
+    # * binds tighter than +, comparison tighter than and, and tighter than or
+    assert parse_screen("close > 1 + 2 * 3") == parse_screen("close > 1 + (2 * 3)")
+    assert parse_screen("close > 1 or close < 2 and open > 3") == \
+        parse_screen("close > 1 or (close < 2 and open > 3)")
+    assert parse_screen("not close > 1 and open > 2") == parse_screen("(not close > 1) and open > 2")
+    bars = {'close': np.array([[7.5]]), 'open': np.array([[0.0]])}
+    assert evaluate("close > 1 + 2 * 3", bars)[0, 0]
+    assert not evaluate("close > (1 + 2) * 3", bars)[0, 0]
+    assert evaluate("close - 1 - 2 > 4", bars)[0, 0]  # Left associative: (7.5 - 1) - 2
+
+
+def test_unary_minus():
+    # A negated number folds into the number; anything else becomes a negate node
+    assert parse_screen("close > -2")[3] == ('number', -2.0)
+    assert parse_screen("-close > 2")[2] == ('negate', ('column', 'close'))
+    assert parse_screen("close > --2") == parse_screen("close > 2")
+    bars = {'close': np.array([[-1.0], [3.0]])}
+    assert evaluate("-close > -2", bars)[:, 0].tolist() == [True, False]
+    assert evaluate("2 * -close < 0", bars)[:, 0].tolist() == [False, True]
+    with pytest.raises(ValueError, match="unary minus needs a number"):
+        parse_screen("-(close > 1)")
+
+
+@pytest.mark.parametrize('screen, message', [
+    ("1 < close < 2", "Chained comparison at 10"),
+    ("close > sma(50) > 3", "Chained comparison"),
+    ("price > 1", "Unknown name 'price' at 0"),
+    ("close > ema(20)", "Unknown function 'ema' at 8"),
+    ("close + 1", "A screen must be a condition"),
+    ("close > sma(2.5)", "whole number of bars"),
+    ("close > sma(50, 1, 2)", "whole number of bars"),
+    ("close > sma(0)", "must cover 1 to"),
+    ("close > 1 and", "Unexpected end of expression"),
+    ("close > 1 $", "Unexpected character '\\$' at 10"),
+])
+def test_errors(screen, message):
+    with pytest.raises(ValueError, match=message):
+        parse_screen(screen)
+
+
+def test_program_names_the_screen_that_fails():
+    with pytest.raises(ValueError, match="Screen 'bad': Unknown name 'foo'"):
+        ScreenProgram({'good': "close > 1", 'bad': "foo > 1"})
+
+
+def test_window_column_selection():
+    assert parse_screen("sma(volume, 50) > 1")[2] == ('window', 'sma', 'volume', 50, 0)
+    assert parse_screen("sma(50) > 1")[2] == ('window', 'sma', 'close', 50, 0)
+    program = ScreenProgram({'s': "sma(volume, 3) > sma(3)"})
+    assert program.columns == ['close', 'volume']
+    bars = {'close': np.array([[1.0, 2.0, 3.0]]), 'volume': np.array([[10.0, 20.0, 30.0]])}
+    assert program.evaluate(bars)['s'][0, 0]
+    assert not evaluate("sma(close, 3) > sma(3)", bars)[0, 0]
+
+
+def test_lag():
+    # sma(n, lag) ends lag bars before the screening day
+    program = ScreenProgram({'s': "sma(2, 1) == 2.5 and low(2, 2) == 1 and high(3, 1) == 3"})
+    assert program.lookback == 4
+    bars = {'close': np.array([[1.0, 2.0, 3.0, 10.0]])}
+    assert program.evaluate(bars)['s'][0, 0]
+    # days > 1 evaluates a lagged window on each of the last days
+    closes = np.array([[1.0, 2.0, 3.0, 4.0, 5.0]])
+    assert evaluate("sma(2, 1) < close - 1", {'close': closes}, days=3)[0].tolist() == [True, True, True]
+    assert evaluate("sma(2, 1) == 1.5", {'close': closes}, days=3)[0].tolist() == [True, False, False]
+    with pytest.raises(ValueError, match="Screens need 4 bars, got 3"):
+        program.evaluate({'close': np.ones((1, 3))})
+
+
+def test_short_history_is_false():
+    # NaN before a symbol's first bar: the moving average is missing and the condition is false
+    bars = {'close': np.array([[np.nan, np.nan, 5.0], [1.0, 2.0, 5.0]])}
+    assert evaluate("close > sma(3)", bars)[:, 0].tolist() == [False, True]
+    assert evaluate("not close > sma(3)", bars)[:, 0].tolist() == [True, False]
+    # low and high skip the missing bars
+    assert evaluate("low(3) == 5", bars)[:, 0].tolist() == [True, False]
+    assert evaluate("rs >= 70", {}, values={'rs': [np.nan, 80.0]})[:, 0].tolist() == [False, True]
+
+
+def test_shared_terms_compile_once():
+    program = ScreenProgram({
+        'a': "close > sma(50) and sma(50) > sma(200)",
+        'b': "sma(200) < sma(50) or sma(50) < close",
+        'c': "close + sma(50) > 1 and sma(50) + close > 1",
+    })
+    windows = [step for step in program.steps if step[0] == 'window']
+    assert set(windows) == {('window', 'sma', 'close', 50, 0), ('window', 'sma', 'close', 200, 0)}
+    compares = [step for step in program.steps if step[0] == 'compare']
+    # close > sma(50) and sma(200) < sma(50) are mirrored into a's comparisons; c adds one
+    assert len(compares) == 3
+    assert len(set(program.steps)) == len(program.steps)
+    a, b = program.steps[program.outputs['a']], program.steps[program.outputs['b']]
+    assert (a[0], b[0]) == ('and', 'or') and set(a[1:]) == set(b[1:])
+    assert program.lookback == 200 and program.columns == ['close']
@@ -0,0 +1,76 @@
+# tests/test_vcp_service.py
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from src.database.columnar import fetch_bars, series_bounds
+from src.database.models import Base, StockData
+from src.service.vcp_service import detect_vcp_symbols, volume_ratios
+
+DAYS = [date(2025, 1, 1) + timedelta(days=i) for i in range(300)]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def vcp_path():
+    # An advance, then a base whose pullbacks contract 25% -> 12% -> 6% with tight recent bars
+    x = np.arange(len(DAYS))
+    points = [(0, 30), (180, 100), (200, 75), (230, 98), (245, 86.2), (270, 97), (280, 91.2), (299, 96)]
+    close = np.interp(x, [a for a, _ in points], [b for _, b in points])
+    close *= np.exp(np.random.default_rng(0).normal(0, 0.002, len(x)))
+    width = np.where(x >= len(x) - 14, 0.003, 0.008)
+    return close, width
+
+
+def add_symbol(db, symbol, volume):
+    close, width = vcp_path()
+    db.execute(insert(StockData), [
+        {'symbol': symbol, 'country': 'usa', 'date': d, 'open': c, 'high': c * (1 + w), 'low': c * (1 - w),
+         'close': c, 'volume': v}
+        for d, c, w, v in zip(DAYS, close.tolist(), width.tolist(), volume)
+    ])
+    db.commit()
+
+
+def test_missing_volume_is_judged_on_price(db):
+    x = np.arange(len(DAYS))
+    dry = np.where(x < 200, 1e6, np.where(x < 232, 8e5, np.where(x < 272, 5e5, 2e5)))
+    add_symbol(db, 'DRY', [int(v) for v in dry])
+    add_symbol(db, 'NOVOL', [None] * len(DAYS))
+
+    results = detect_vcp_symbols(db, [('DRY', 'usa'), ('NOVOL', 'usa')])
+    assert results[('DRY', 'usa')]['contraction_count'] == 3
+    assert results[('DRY', 'usa')]['volume_ratio'] < 1
+    assert results[('NOVOL', 'usa')]['contraction_count'] == 3
+    assert results[('NOVOL', 'usa')]['volume_ratio'] is None
+    assert results[('NOVOL', 'usa')]['volume_dry_up'] is None
+
+
+def test_volume_ratio_masks_windows_with_missing_volume(db):
+    volume = [500_000] * len(DAYS)
+    add_symbol(db, 'FULL', volume)
+    add_symbol(db, 'GAP', volume[:-30] + [None] + volume[-29:])
+    add_symbol(db, 'OLDGAP', [None] + volume[1:])
+
+    bars = fetch_bars(db, columns=('symbol', 'country', 'date', 'volume'), keep_missing_volume=True)
+    bounds = series_bounds(bars)
+    ratios = dict(zip([symbol for symbol, _, _, _ in bounds],
+                      volume_ratios(bars, [(start, stop) for _, _, start, stop in bounds])))
+    assert ratios['FULL'] == pytest.approx(1.0)
+    assert ratios['OLDGAP'] == pytest.approx(1.0)
+    assert np.isnan(ratios['GAP'])
+
+    # Without keep_missing_volume a bar with a missing volume is dropped
+    bars = fetch_bars(db, symbols=['GAP'], columns=('symbol', 'date', 'volume'))
+    assert len(bars['date']) == len(DAYS) - 1 and bars['volume'].dtype == np.int64